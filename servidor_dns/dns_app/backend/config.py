@@ -1,4 +1,5 @@
 # Configurações do servidor
+import os
 
 # --- CONFIGURAÇÕES DE UPSTREAM ---
 
@@ -9,7 +10,92 @@
 # Quad9: ("9.9.9.9", 53)
 UPSTREAM_DNS = ("8.8.8.8", 53)  # Servidor público da Google (porta 53 é a padrão de DNS)
 
+# Permite apontar o upstream para outro servidor sem editar este arquivo,
+# ex: DNS_UPSTREAM=127.0.0.1:5300 para usar o stub local (dns_stub.py) nos testes de desempenho.
+if os.environ.get("DNS_UPSTREAM"):
+    _host, _, _porta = os.environ["DNS_UPSTREAM"].rpartition(":")
+    UPSTREAM_DNS = (_host, int(_porta))
+
+# Modo de resolução: "encaminhar" (envia tudo ao UPSTREAM_DNS) ou "recursivo" (resolve
+# iterativamente a partir dos servidores raiz, sem depender de resolvedores públicos; dns_recursivo.py).
+MODO_RESOLUCAO = "encaminhar"
+
+# Servidores raiz (root hints) usados no modo recursivo: (nome, endereço IPv4)
+RECURSIVO_RAIZES = [
+    ("a.root-servers.net.", "198.41.0.4"),
+    ("b.root-servers.net.", "170.247.170.2"),
+    ("c.root-servers.net.", "192.33.4.12"),
+    ("d.root-servers.net.", "199.7.91.13"),
+    ("e.root-servers.net.", "192.203.230.10"),
+    ("f.root-servers.net.", "192.5.5.241"),
+    ("g.root-servers.net.", "192.112.36.4"),
+    ("h.root-servers.net.", "198.97.190.53"),
+    ("i.root-servers.net.", "192.36.148.17"),
+    ("j.root-servers.net.", "192.58.128.30"),
+    ("k.root-servers.net.", "193.0.14.129"),
+    ("l.root-servers.net.", "199.7.83.42"),
+    ("m.root-servers.net.", "202.12.27.33"),
+]
+# Porta usada com os servidores autoritativos (53; outra só em testes com uma hierarquia local)
+RECURSIVO_PORTA = 53
+# Tempo máximo de espera por um servidor antes de tentar os próximos (segundos)
+RECURSIVO_TIMEOUT_S = 0.8
+# Quantos servidores da zona são consultados ao mesmo tempo (vale a primeira resposta)
+RECURSIVO_PARALELO = 2
+# Limite de delegações seguidas numa resolução e de zonas guardadas no cache de delegações
+RECURSIVO_MAX_DELEGACOES = 16
+RECURSIVO_MAX_ZONAS = 10000
+
 # ---CONFIGURAÇÃO DE CACHE---
+# Tamanho máximo do cache do servidor DNS, em bytes (estimados). Cada entrada conta os registros e a
+# resposta já empacotada (cerca de 1 KB para uma resposta com um registro): 512 KB guardam ~550 respostas.
+CACHE_TAMANHO_MAXIMO_BYTES = 512 * 1024
+
+# Política de remoção quando o cache enche: "LRU" (padrão), ou, opcionalmente, "TINYLFU" (W-TinyLFU,
+# resistente a varreduras de nomes consultados uma única vez) ou "ARC". No trace sintético do
+# teste_politicas.py (Zipf 0.9 com 30% de varreduras), a taxa de acerto com 512 KB foi de 27,1% (LRU),
+# 36,1% (TINYLFU) e 34,8% (ARC), com ~40% mais CPU por consulta no TINYLFU. Compare no seu tráfego com:
+# python teste_politicas.py --dominios <log de consultas>
+CACHE_POLITICA = "LRU"
+
+# API de consulta do cache (painel e /cache/): tamanho máximo de uma página e por quantos
+# segundos a lista ordenada de chaves usada na paginação é reaproveitada antes de ser refeita.
+CACHE_API_LIMITE_PAGINA = 200
+CACHE_API_SNAPSHOT_S = 5
+
+# Aquecimento do cache ao iniciar o servidor (dns_aquecimento.py): resolve os nomes mais
+# populares antes que os clientes os peçam. Fonte: None (desativado), "lista" (AQUECIMENTO_LISTA)
+# ou "historico" (nomes mais consultados nas últimas AQUECIMENTO_HISTORICO_HORAS horas).
+AQUECIMENTO_FONTE = None
+AQUECIMENTO_LISTA = "dns_app/dns_modules/domains_list/backlink_rank.json"
+AQUECIMENTO_HISTORICO_HORAS = 24
+
+# Quantos nomes resolver e com quais tipos de consulta (no máximo o que cabe em CACHE_TAMANHO_MAXIMO_BYTES).
+AQUECIMENTO_QUANTIDADE = 200
+AQUECIMENTO_TIPOS = ["A", "AAAA"]
+
+# Consultas simultâneas ao upstream e limite de consultas por segundo durante o aquecimento.
+AQUECIMENTO_CONCORRENCIA = 16
+AQUECIMENTO_QPS = 100
+
+# True: aguarda o aquecimento antes de abrir a porta. False: aquece em segundo plano, já atendendo.
+AQUECIMENTO_BLOQUEANTE = False
+
+
+# ---CONFIGURAÇÕES DE DADOS LOCAIS---
+# Arquivos no formato hosts ("IP nome1 nome2 ...") respondidos localmente, sem consultar o upstream.
+# Nomes iniciados por "*." funcionam como curinga (ex: "10.0.0.5 *.lab.interno").
+LOCAL_HOSTS_ARQUIVOS = []
+
+# Arquivos de zona simples (formato BIND, com $ORIGIN/$TTL). Zonas com SOA são autoritativas:
+# nomes inexistentes dentro delas recebem NXDOMAIN.
+LOCAL_ZONAS_ARQUIVOS = []
+
+# TTL das respostas geradas a partir dos arquivos hosts, em segundos.
+LOCAL_TTL_HOSTS = 300
+
+# Intervalo (em segundos) para verificar se os arquivos mudaram e recarregá-los. 0 desativa.
+LOCAL_INTERVALO_RECARGA = 5
 
 
 # ---CONFIGURAÇÕES DA BLOCKLIST---
@@ -23,4 +109,171 @@ BLOCKLIST_URLS =[
 BLOCKLIST_CACHE_DIR = "dns_app/dns_modules/blocklist_cache"
 
 # TTL do cache local da blocklist, em segundos (86400 segundos = 24 horas).
-BLOCKLIST_CACHE_TTL = 86400
\ No newline at end of file
+BLOCKLIST_CACHE_TTL = 86400
+
+# Comportamento enquanto a blocklist ainda está carregando (ela é carregada em segundo plano):
+# True (fail-open) responde normalmente, sem bloquear nada; False (fail-closed) responde SERVFAIL.
+BLOCKLIST_FALHA_ABERTA = True
+
+# Regras extras de bloqueio, avaliadas junto com as listas:
+#   "exemplo.com"        o nome e todos os subdomínios (como nas listas)
+#   "=exemplo.com"       apenas o nome exato
+#   "ads*.exemplo.com"   curinga: * é qualquer sequência de caracteres (inclusive pontos) e ? um caractere
+#   "/^track[0-9]+\./"   expressão regular, procurada no nome em minúsculas e sem o ponto final
+#   "@@cdn.exemplo.com"  exceção: nunca bloqueia, mesmo que outra regra ou lista bloqueie
+BLOCKLIST_REGRAS = []
+
+# Arquivos com regras no mesmo formato, uma por linha (linhas iniciadas por # são comentários).
+BLOCKLIST_REGRAS_ARQUIVOS = []
+
+# Exceções (allowlist) para corrigir falsos positivos das listas, no mesmo formato e sem o "@@".
+BLOCKLIST_PERMITIDOS = []
+
+# Quantos nomes têm o resultado da avaliação das regras guardado (LRU). 0 desativa.
+BLOCKLIST_CACHE_NOMES = 65536
+
+# Resposta enviada para domínios bloqueados:
+# "NXDOMAIN" (domínio inexistente), "NODATA" (sem registros), "SINKHOLE" (A 0.0.0.0 / AAAA ::) ou "REFUSED".
+BLOCKLIST_MODO = "NXDOMAIN"
+
+# Endereços e TTL usados no modo SINKHOLE.
+BLOCKLIST_SINKHOLE_IPV4 = "0.0.0.0"
+BLOCKLIST_SINKHOLE_IPV6 = "::"
+BLOCKLIST_TTL_RESPOSTA = 60
+
+# ---CONFIGURAÇÕES DO LOG DE CONSULTAS---
+# Arquivo do log de consultas (NDJSON, um registro por linha). Use None para escrever no terminal.
+LOG_ARQUIVO = "logs/consultas.ndjson"
+
+# Nível mínimo registrado: "DEBUG" (toda consulta), "INFO", "WARNING" ou "ERROR".
+LOG_NIVEL = "INFO"
+
+# Proporção de registros mantidos por nível (amostragem). 1.0 = todos, 0.01 = 1 em cada 100.
+LOG_AMOSTRAGEM = {"DEBUG": 1.0, "INFO": 1.0, "WARNING": 1.0, "ERROR": 1.0}
+
+# Tamanho máximo da fila entre o servidor e a thread de escrita.
+# Quando a fila está cheia o registro é descartado (e contado), sem bloquear o atendimento.
+LOG_FILA_MAX = 10000
+
+# Quantidade máxima de registros escritos de uma vez pela thread de escrita.
+LOG_LOTE_MAX = 500
+
+# Rotação do arquivo de log: tamanho máximo em bytes e quantos arquivos antigos manter.
+LOG_ROTACAO_BYTES = 50 * 1024 * 1024
+LOG_ARQUIVOS_MANTIDOS = 5
+
+
+# ---RASTREIO E PERFIL (dns_rastreio.py)---
+# Histogramas do tempo gasto em cada etapa do atendimento (parse, limite, blocklist, cache,
+# upstream, envio...). Desativado, o custo é desprezível; as capturas o ligam temporariamente.
+RASTREIO_ATIVO = False
+
+# Captura de perfil sob demanda (kill -USR1 <pid>, python -m dns_app.backend.dns_rastreio ou
+# POST /perfil/ no painel): duração, intervalo entre amostras das pilhas e pasta dos arquivos gerados.
+RASTREIO_AMOSTRAGEM_S = 10
+RASTREIO_INTERVALO_MS = 5
+RASTREIO_DIRETORIO = "logs"
+
+# ---CONFIGURAÇÕES DO HISTÓRICO DE CONSULTAS---
+# Banco SQLite com o histórico persistente de consultas (usado pelo painel web).
+HISTORICO_ARQUIVO = "dns_historico.sqlite3"
+
+# Por quantos dias as consultas (e suas agregações) são mantidas.
+HISTORICO_RETENCAO_DIAS = 7
+
+# Tamanho máximo da fila de gravação; acima disso as consultas não são registradas.
+HISTORICO_FILA_MAX = 50000
+
+# Quantidade máxima de consultas gravadas por transação.
+HISTORICO_LOTE_MAX = 2000
+
+
+# ---CONFIGURAÇÕES DE LIMITE DE TAXA---
+# Limita consultas por cliente, por sub-rede e respostas repetidas (RRL), com baldes de fichas.
+# Desativado por padrão: o limite é avaliado antes do cache, então numa rede local atrás de uma
+# única sub-rede um nome popular pode passar do RRL. Ajuste os limites ao tráfego antes de ativar.
+LIMITE_ATIVO = False
+
+# Consultas por segundo sustentadas e rajada máxima por IP de cliente.
+LIMITE_QPS_CLIENTE = 50
+LIMITE_RAJADA_CLIENTE = 100
+
+# Consultas por segundo e rajada por sub-rede (prefixos abaixo).
+LIMITE_QPS_SUBREDE = 200
+LIMITE_RAJADA_SUBREDE = 400
+LIMITE_PREFIXO_IPV4 = 24
+LIMITE_PREFIXO_IPV6 = 56
+
+# RRL: respostas iguais (mesmo nome e tipo) por segundo para a mesma sub-rede.
+LIMITE_RRL_QPS = 10
+LIMITE_RRL_RAJADA = 20
+
+# Acima do limite, 1 em cada LIMITE_SLIP consultas recebe resposta truncada (TC) e as demais
+# são descartadas. 0 descarta todas. O servidor ainda não atende via TCP, então o cliente que
+# recebe TC não tem como repetir a consulta: mantenha 0 até existir um listener TCP.
+LIMITE_SLIP = 0
+
+# Quantidade máxima de baldes guardados por tabela (limita a memória usada sob ataque).
+LIMITE_MAX_ENTRADAS = 100000
+
+# Redes que não são limitadas (ex: a própria máquina, usada pelo teste_vazao.py).
+LIMITE_ISENTOS = ["127.0.0.0/8", "::1/128"]
+
+
+# ---CONFIGURAÇÕES DO LOOP DO SERVIDOR---
+# Quantidade máxima de pacotes lidos e respondidos a cada vez que o socket fica pronto.
+SERVIDOR_LOTE = 64
+
+# Tamanho de cada buffer de recepção pré-alocado (maior que qualquer consulta DNS via UDP).
+SERVIDOR_TAMANHO_BUFFER = 4096
+
+# Arquivo onde o cache do servidor DNS é salvo ao sair e lido ao iniciar (None: não persiste).
+CACHE_ARQUIVO = "./dns_cache.pkl"
+if "DNS_CACHE_ARQUIVO" in os.environ:   # Vazio: não persiste (ex: vários servidores na mesma pasta)
+    CACHE_ARQUIVO = os.environ["DNS_CACHE_ARQUIVO"] or None
+
+# Arquivo com o PID do servidor DNS em execução, usado para enviar SIGHUP (recarga da configuração).
+SERVIDOR_ARQUIVO_PID = os.environ.get("DNS_ARQUIVO_PID", "dns_servidor.pid")
+# Arquivo JSON com o estado do servidor DNS em execução (PID, porta e carga da blocklist), lido pelo
+# /ready/ do painel para saber se o servidor UDP também está pronto.
+SERVIDOR_ARQUIVO_ESTADO = os.environ.get("DNS_ARQUIVO_ESTADO", "dns_servidor.estado.json")
+
+
+# ---CONFIGURAÇÕES DO POOL DE TRABALHADORES---
+# Threads fixas que atendem as consultas encaminhadas ao upstream (cache hits e bloqueios
+# são respondidos direto no loop principal, sem passar pela fila).
+POOL_TRABALHADORES = 64
+
+# Tamanho máximo da fila de consultas esperando um trabalhador.
+POOL_FILA_MAX = 2048
+
+# Controle de sobrecarga no estilo CoDel: se a espera na fila ficar acima de POOL_ALVO_ESPERA_MS
+# por mais de POOL_INTERVALO_MS, as consultas atrasadas são recusadas até a fila voltar ao normal.
+POOL_ALVO_ESPERA_MS = 50
+POOL_INTERVALO_MS = 200
+
+# Resposta para consultas recusadas por sobrecarga: "SERVFAIL", "REFUSED" ou "DROP" (sem resposta).
+POOL_ACAO_SOBRECARGA = "SERVFAIL"
+
+# ---CACHE COOPERATIVO ENTRE SERVIDORES (dns_pares.py)---
+# Vários servidores DNS podem dividir os nomes entre si num anel de hash consistente: numa falha do
+# cache, o servidor pergunta ao dono do nome antes de ir ao upstream. Use a mesma lista em todos os
+# nós ("host:porta" da porta de pares) e informe em PARES_LOCAL qual deles é este nó (None desativa).
+PARES = []   # Ex: ["10.0.0.1:5400", "10.0.0.2:5400", "10.0.0.3:5400"]
+PARES_LOCAL = None
+# Também pelo ambiente (ou pelos argumentos --pares/--par-local do dns_server), ex:
+# DNS_PARES=127.0.0.1:5401,127.0.0.1:5402 DNS_PARES_LOCAL=127.0.0.1:5401
+if os.environ.get("DNS_PARES"):
+    PARES = [par.strip() for par in os.environ["DNS_PARES"].split(",") if par.strip()]
+if os.environ.get("DNS_PARES_LOCAL"):
+    PARES_LOCAL = os.environ["DNS_PARES_LOCAL"]
+# Espera máxima pela resposta do dono antes de ir ao upstream, e por quanto tempo um dono que
+# não respondeu deixa de ser consultado. Numa falha do seu cache o dono avisa na hora que está
+# resolvendo, e então a espera passa a ser PARES_ESPERA_RESOLUCAO_MS (sem penalidade se acabar).
+PARES_TIMEOUT_MS = 400
+PARES_ESPERA_RESOLUCAO_MS = 2000
+PARES_PENALIDADE_S = 10
+# Posições de cada nó no anel (mais posições = divisão mais uniforme dos nomes).
+PARES_REPLICAS_VIRTUAIS = 100
+# Threads que atendem as consultas vindas dos outros nós.
+PARES_TRABALHADORES = 16
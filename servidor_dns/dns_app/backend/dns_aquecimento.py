@@ -0,0 +1,217 @@
+import json
+import time
+import threading
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from .dns_functions import query_upstream, parse_response
+from . import config
+
+
+def carregar_lista(caminho, quantidade):
+
+    """
+    Lê os primeiros 'quantidade' nomes de uma lista no formato do backlink_rank.json
+    (lista de dicionários com a chave "target", já ordenada por popularidade).
+    """
+
+    with open(caminho, "r", encoding="utf-8") as f:
+        itens = json.load(f)
+
+    dominios = []
+    for item in itens:
+        dominio = item["target"] if isinstance(item, dict) else str(item)
+        if dominio and dominio not in dominios:
+            dominios.append(dominio)
+            if len(dominios) >= quantidade:
+                break
+    return dominios
+
+
+def carregar_historico(historico, quantidade, horas):
+
+    """
+    Retorna os 'quantidade' nomes mais consultados nas últimas 'horas' horas do histórico.
+    """
+
+    fim = time.time()
+    return [dominio for dominio, _ in historico.top_dominios(fim - horas * 3600, fim, quantidade)]
+
+
+class AquecimentoCache:
+
+    def __init__(self, cache, blocklist = None, tipos = None, concorrencia = None, qps = None):
+
+        """
+        Resolve uma lista de nomes no upstream e guarda as respostas no cache.
+
+        As consultas são feitas por um pool de threads ('concorrencia') e espaçadas para
+        não passar de 'qps' consultas por segundo, evitando sobrecarregar o upstream.
+        Nomes bloqueados ou já presentes no cache são ignorados, e a lista é limitada ao que
+        cabe no cache: o excedente só expulsaria (ou teria recusadas) as respostas já aquecidas.
+        """
+
+        self.cache = cache
+        self.blocklist = blocklist
+        self.tipos = list(config.AQUECIMENTO_TIPOS if tipos is None else tipos)
+        self.concorrencia = config.AQUECIMENTO_CONCORRENCIA if concorrencia is None else concorrencia
+        self.qps = config.AQUECIMENTO_QPS if qps is None else qps
+
+        self._lock = threading.Lock()
+        self._proxima_consulta = 0.0
+        self._parar = threading.Event()
+        self._thread = None
+
+        # Progresso (consultado por quem acompanha o aquecimento em segundo plano)
+        self.total = 0
+        self.concluidas = 0
+        self.armazenadas = 0
+        self.ignoradas = 0
+        self.recusadas = 0   # Respondidas, mas não guardadas (política de remoção, TTL 0, negativa sem SOA)
+        self.erros = 0       # Sem resposta do upstream ou resposta inválida
+        self.inicio = None
+        self.fim = None
+
+    def dominios_configurados(self, historico = None):
+
+        """
+        Retorna os nomes a aquecer de acordo com AQUECIMENTO_FONTE (lista vazia se desativado).
+        """
+
+        fonte = config.AQUECIMENTO_FONTE
+        try:
+            if fonte == "lista":
+                return carregar_lista(config.AQUECIMENTO_LISTA, config.AQUECIMENTO_QUANTIDADE)
+            if fonte == "historico" and historico is not None:
+                return carregar_historico(historico, config.AQUECIMENTO_QUANTIDADE,
+                                          config.AQUECIMENTO_HISTORICO_HORAS)
+        except Exception as e:
+            print(f"Erro ao carregar nomes para o aquecimento do cache: {e}")
+        return []
+
+    def _aguardar_vez(self):
+
+        """
+        Espaça as consultas em 1/qps segundos, somando todas as threads do pool.
+        """
+
+        if not self.qps:
+            return
+        with self._lock:
+            agora = time.monotonic()
+            vez = max(agora, self._proxima_consulta)
+            self._proxima_consulta = vez + 1 / self.qps
+        if vez > agora:
+            self._parar.wait(vez - agora)
+
+    def _resolver(self, dominio, tipo):
+        nome = dominio.strip().lower().rstrip(".") + "."
+        try:
+            if (self._parar.is_set() or self.cache.contem(f"{nome}|{tipo}")
+                    or (self.blocklist is not None and self.blocklist.is_blocked(nome))):
+                self._contar("ignoradas")
+                return
+
+            self._aguardar_vez()
+            resposta = query_upstream(nome, tipo, timeout=2)
+            registros, _ = parse_response(resposta) if resposta else ([], None)
+            if not registros:
+                self._contar("erros")
+            elif self.cache.set_resposta(nome, tipo, registros, rcode=resposta[3] & 0x0F):
+                self._contar("armazenadas")
+            else:
+                self._contar("recusadas")
+        except Exception:
+            self._contar("erros")
+
+    def _contar(self, contador):
+        with self._lock:
+            setattr(self, contador, getattr(self, contador) + 1)
+            self.concluidas += 1
+            concluidas = self.concluidas
+
+        # Informa o progresso a cada 10%
+        passo = max(self.total // 10, 1)
+        if concluidas % passo == 0 or concluidas == self.total:
+            print(f"Aquecimento do cache: {concluidas}/{self.total} "
+                  f"(armazenadas={self.armazenadas}, ignoradas={self.ignoradas}, "
+                  f"recusadas={self.recusadas}, erros={self.erros})")
+
+    def executar(self, dominios):
+
+        """
+        Aquece o cache com os nomes informados e aguarda o fim. Retorna o resumo do aquecimento.
+        """
+
+        # A blocklist não é aguardada (ela carrega em segundo plano): cada nome é conferido na hora
+        # de ser resolvido, com a lista disponível naquele momento. Guardar um nome que depois passa
+        # a ser bloqueado não tem efeito, pois a blocklist é verificada antes do cache.
+        limite = max(self.cache.capacidade_estimada() // max(len(self.tipos), 1), 1)
+        if len(dominios) > limite:
+            print(f"Aquecimento limitado aos {limite} primeiros de {len(dominios)} nomes (o que cabe no cache)")
+            dominios = dominios[:limite]
+        self.total = len(dominios) * len(self.tipos)
+        self.inicio = time.time()
+        print(f"Aquecendo o cache com {len(dominios)} nomes ({', '.join(self.tipos)})...")
+
+        with ThreadPoolExecutor(max_workers=self.concorrencia) as pool:
+            for dominio in dominios:
+                for tipo in self.tipos:
+                    pool.submit(self._resolver, dominio, tipo)
+
+        self.fim = time.time()
+        resumo = self.resumo()
+        print(f"Aquecimento do cache concluído em {resumo['duracao_s']:.1f}s: {resumo}")
+        return resumo
+
+    def iniciar(self, dominios):
+
+        """
+        Executa o aquecimento em segundo plano (o servidor já atende enquanto isso).
+        """
+
+        self._thread = threading.Thread(target=self.executar, args=(dominios,), daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def parar(self):
+
+        """
+        Interrompe o aquecimento: as consultas que ainda não começaram são ignoradas.
+        """
+
+        self._parar.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def resumo(self):
+        fim = self.fim or time.time()
+        return {
+            "total": self.total,
+            "concluidas": self.concluidas,
+            "armazenadas": self.armazenadas,
+            "ignoradas": self.ignoradas,
+            "recusadas": self.recusadas,
+            "erros": self.erros,
+            "duracao_s": round(fim - self.inicio, 2) if self.inicio else 0.0,
+            "cache": self.cache.estatisticas(),
+        }
+
+
+if __name__ == "__main__":
+    # Execução direta: python -m dns_app.backend.dns_aquecimento (a partir de servidor_dns/)
+    # Aquece o cache persistido em disco (dns_cache.pkl), que o servidor carrega ao iniciar.
+    from .dns_cache import DNSCache
+
+    parser = argparse.ArgumentParser(description="Aquece o cache DNS persistido em disco.")
+    parser.add_argument("--lista", default=config.AQUECIMENTO_LISTA, help="Lista de nomes (formato backlink_rank.json)")
+    parser.add_argument("--quantidade", type=int, default=config.AQUECIMENTO_QUANTIDADE)
+    parser.add_argument("--tipos", nargs="+", default=config.AQUECIMENTO_TIPOS)
+    parser.add_argument("--concorrencia", type=int, default=config.AQUECIMENTO_CONCORRENCIA)
+    parser.add_argument("--qps", type=float, default=config.AQUECIMENTO_QPS, help="Limite de consultas por segundo (0 = sem limite)")
+    args = parser.parse_args()
+
+    cache = DNSCache(tamanho_maximo_bytes=config.CACHE_TAMANHO_MAXIMO_BYTES)
+    aquecimento = AquecimentoCache(cache, tipos=args.tipos, concorrencia=args.concorrencia, qps=args.qps)
+    aquecimento.executar(carregar_lista(args.lista, args.quantidade))
+    # O cache é salvo em disco ao sair (atexit do DNSCache)
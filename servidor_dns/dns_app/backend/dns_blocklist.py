@@ -2,53 +2,151 @@ import os
 import time
 import threading
 import urllib.request
-from dnslib import DNSRecord
 
-from .config import BLOCKLIST_URLS, BLOCKLIST_CACHE_DIR, BLOCKLIST_CACHE_TTL
+from .dns_functions import get_blocked_response
+from .dns_regras import MotorRegras, ler_regras
+from . import config
 
 class blocklist_cache:
 
-    def __init__(self):
+    def __init__(self, dominios = None, segundo_plano = False):
 
         """
         Inicializando a blocklist
+
+        - Se 'dominios' for informado, usa esse conjunto e não baixa as listas (útil em testes e benchmarks).
+        - Com segundo_plano=True as listas são baixadas/lidas em outra thread e o objeto fica
+          disponível na hora. Até lá nenhum domínio é bloqueado; 'carregada' e o evento 'pronta'
+          indicam quando a carga terminou (ver BLOCKLIST_FALHA_ABERTA), e estado() diz se ela
+          terminou sem nenhuma lista (ex: todos os downloads falharam).
+
+        As listas são compiladas junto com as regras extras e exceções (BLOCKLIST_REGRAS,
+        BLOCKLIST_REGRAS_ARQUIVOS e BLOCKLIST_PERMITIDOS) num MotorRegras (dns_regras.py).
         """
         
         self._lock = threading.Lock()   # Garantindo multithreading sem rece conditions
         self.blocked_domains = set()
+        self.motor = MotorRegras()      # Vazio até a primeira carga
+        self.carregada = False
+        self.pronta = threading.Event()
+        self.tempo_carga = None         # Segundos gastos na primeira carga
+        self.listas_total = 0           # Listas (BLOCKLIST_URLS) da última carga...
+        self.listas_com_erro = 0        # ... e quantas delas falharam
+        self.ao_atualizar = None        # Chamada após cada carga (ex: arquivo de estado do servidor)
+
+        if dominios is not None:
+            self.blocked_domains = set(dominios)
+            self.motor = self._compilar(self.blocked_domains)
+            self.tempo_carga = 0.0
+            self.carregada = True
+            self.pronta.set()
+            return
+
+        if segundo_plano:
+            threading.Thread(target=self._carregar, daemon=True).start()
+        else:
+            self._carregar()
+
+    def _carregar(self):
 
-        if not os.path.exists(BLOCKLIST_CACHE_DIR):  # Verificando se o diretorio do cache existe
-            os.makedirs(BLOCKLIST_CACHE_DIR)        # Se não existir, criamos
-        
+        """
+        Primeira carga da blocklist. Marca a lista como pronta ao final (mesmo se algum download falhar).
+        """
+
+        inicio = time.time()
         print("Atualizando a blocklist...")
-        self.update_blocklists()
-        print(f"Blocklist carregada com {len(self.blocked_domains)} dominios.")
+        try:
+            self.update_blocklists()
+        finally:
+            self.tempo_carga = time.time() - inicio
+            self.carregada = True
+            self.pronta.set()
+        if self.estado()["estado"] == "sem_listas":
+            print(f"Blocklist carregada sem nenhuma lista ({self.listas_com_erro} de {self.listas_total} com erro).")
+        print(f"Blocklist carregada com {len(self.blocked_domains)} dominios em {self.tempo_carga:.1f}s.")
+        self._avisar()
 
     def update_blocklists(self):
 
         """
         Atualiza blocklist com blocklists dos urls 
+
+        O novo conjunto é montado à parte e trocado de uma vez: as consultas continuam
+        usando a lista anterior até o fim (usado também na recarga da configuração).
         """
 
+        if not os.path.exists(config.BLOCKLIST_CACHE_DIR):  # Verificando se o diretorio do cache existe
+            os.makedirs(config.BLOCKLIST_CACHE_DIR)        # Se não existir, criamos
+
         new_domains = set()
+        urls = list(config.BLOCKLIST_URLS)
+        falhas = 0
 
-        for url in BLOCKLIST_URLS:
-            new_domains.update(self._download_and_cache_blocklist(url))
+        for url in urls:
+            dominios = self._download_and_cache_blocklist(url)
+            if dominios is None:
+                falhas += 1
+            else:
+                new_domains.update(dominios)
 
+        motor = self._compilar(new_domains)
         with self._lock:
             self.blocked_domains = new_domains
+            self.motor = motor
+            self.listas_total = len(urls)
+            self.listas_com_erro = falhas
+
+        print(f"Blocklist atualizada, domínios bloqueados: {len(self.blocked_domains)}, "
+              f"regras com curinga/regex: {len(motor.padroes)}, listas com erro: {falhas}/{len(urls)}.")
+        if self.carregada:
+            self._avisar()   # Na primeira carga o aviso vem de _carregar, já com 'carregada'
+
+    def estado(self):
 
-        print(f"Blocklist atualizada, domínios bloqueados: {len(self.blocked_domains)}.")
+        """
+        Resumo da carga para as verificações de prontidão. 'estado' é "carregando", "carregada"
+        ou "sem_listas" (a carga terminou, mas nenhuma das BLOCKLIST_URLS foi lida).
+        """
+
+        if not self.carregada:
+            situacao = "carregando"
+        elif self.listas_total and self.listas_com_erro == self.listas_total:
+            situacao = "sem_listas"
+        else:
+            situacao = "carregada"
+        return {
+            "estado": situacao,
+            "dominios": len(self.blocked_domains),
+            "listas": self.listas_total,
+            "listas_com_erro": self.listas_com_erro,
+            "tempo_carga_s": round(self.tempo_carga, 2) if self.tempo_carga is not None else None,
+        }
+
+    def _avisar(self):
+        if self.ao_atualizar is not None:
+            try:
+                self.ao_atualizar()
+            except Exception as e:
+                print(f"Erro ao informar o estado da blocklist: {e}")
+
+    def _compilar(self, dominios):
+
+        """
+        Compila os domínios das listas com as regras e exceções do config.py
+        """
+
+        return MotorRegras(dominios, ler_regras(), config.BLOCKLIST_PERMITIDOS)
 
     def _download_and_cache_blocklist(self, url):
 
         """
         Baixa blocklist dos urls, processa e retorna um set com todos os dominios bloqueados
+        (None se a lista não pôde ser lida)
         """
 
         try:
             filename = url.split("/")[-1]
-            cache_path = os.path.join(BLOCKLIST_CACHE_DIR, filename)
+            cache_path = os.path.join(config.BLOCKLIST_CACHE_DIR, filename)
 
             # Usa o cache local se for válido, do contrário, baixa uma nova versão
             if self._is_cache_valid(cache_path):
@@ -80,7 +178,7 @@ class blocklist_cache:
 
         except Exception as e:
             print(f"Erro ao processar blocklist {url}: {e}")
-            return set()
+            return None
 
     def _is_cache_valid(self, cache_path):
 
@@ -92,34 +190,20 @@ class blocklist_cache:
             return False
         
         file_mod_time = os.path.getmtime(cache_path)
-        return (time.time() - file_mod_time) < BLOCKLIST_CACHE_TTL  # Comparando se a ultima vez que o cache foi atualizado excede TTL
+        return (time.time() - file_mod_time) < config.BLOCKLIST_CACHE_TTL  # Comparando se a ultima vez que o cache foi atualizado excede TTL
         
     def is_blocked(self, domain):
 
         """
-        Verificando se um domínio está na blocklist
+        Verificando se um domínio está na blocklist (nome, domínios pai, curingas e regex, menos as exceções).
+        O motor é trocado de uma vez na atualização, então a leitura não precisa do lock.
         """
 
-        domain = domain.rstrip('.')
-        
-        with self._lock:
-            if domain in self.blocked_domains:
-                return True
-            
-            # Verifica domínios pai
-            parts = domain.split('.')
-            for i in range(1, len(parts)):
-                parent_domain = '.'.join(parts[i:])
-                if parent_domain in self.blocked_domains:
-                    return True
-        
-            return False
+        return self.motor.bloqueado(domain)
 
-    def get_blocked_response(self, query_packet):
+    def get_blocked_response(self, query_packet, fim_pergunta = None, qtype = None):
         """
-        Cria uma resposta DNS do tipo NXDOMAIN (Non-Existent Domain) para um domínio bloqueado,
-        preservando o ID da transação original.
+        Cria a resposta para um domínio bloqueado (NXDOMAIN por padrão, ver BLOCKLIST_MODO),
+        preservando o ID da transação original. A resposta é montada copiando os bytes da consulta.
         """
-        request = DNSRecord.parse(query_packet)
-        reply = request.reply(rcode=3) # rcode 3 significa ID não existente
-        return reply.pack()
\ No newline at end of file
+        return get_blocked_response(query_packet, fim_pergunta=fim_pergunta, qtype=qtype)
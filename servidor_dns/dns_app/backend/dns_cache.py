@@ -1,4 +1,5 @@
 from collections import OrderedDict
+from bisect import bisect_left, bisect_right
 import sys
 import os
 import pickle
@@ -6,19 +7,57 @@ import time
 import atexit
 import threading
 
+from .dns_politicas import criar_politica
+from .dns_functions import empacotar_registros
+from . import config
+
+# Limite de CNAMEs seguidos ao montar uma resposta a partir de entradas separadas
+MAX_CADEIA_CNAME = 8
+
+# Bytes dos valores de um registro típico (textos, TTL e objeto rdata com seus dados), medidos com
+# sys.getsizeof; somado ao dicionário de cada registro na estimativa de tamanho das entradas
+TAMANHO_CAMPOS_REGISTRO = 512
+
+# Maior caractere possível: posiciona a busca binária logo após um cursor
+_FIM = "\U0010ffff"
+
+
+def ordem_dominio(chave):
+    """
+    Ordem de uma chave 'nome|tipo' pelos rótulos invertidos do nome ("www.google.com.|A" ->
+    "com.google.www.|A"), que deixa juntos um domínio e todos os seus subdomínios.
+    """
+    nome, _, tipo = chave.rpartition("|")
+    rotulos = nome.lower().rstrip(".").split(".")
+    return ".".join(reversed(rotulos)) + ".|" + tipo
+
+
 class DNSCache:
-    def __init__(self, tamanho_maximo_bytes = 10 * 1024, cache_file_path = "./dns_cache.pkl"):
+    def __init__(self, tamanho_maximo_bytes = 10 * 1024, cache_file_path = "./dns_cache.pkl", politica = None):
         """
         Inicializa o cache DNS.
+
+        - Se 'cache_file_path' for None, o cache não é carregado nem salvo em disco.
+        - 'politica' escolhe qual entrada remover quando o cache enche: "LRU", "TINYLFU"
+          ou "ARC" (padrão: config.CACHE_POLITICA). Ver dns_politicas.py.
         """
         self.tamanho_maximo_bytes = tamanho_maximo_bytes
         self.tamanho_atual_bytes = 0
         self.cache_file_path = cache_file_path
-        # OrderedDict preserva a ordem de inserção e permite mover itens para o fim,
-        # o que facilita implementar uma política LRU (Least Recently Used).
+        # As entradas ficam em 'cache'; a ordem de remoção é controlada pela política
         self.cache = OrderedDict()
+        self.politica = criar_politica(politica or config.CACHE_POLITICA, tamanho_maximo_bytes)
         # Lock para garantir concorrência segura
         self._lock = threading.Lock()
+        # Contadores de consultas respondidas (ou não) pelo cache, usados na taxa de acerto
+        self.acertos = 0
+        self.falhas = 0
+        # Listas ordenadas de chaves usadas na paginação: {por_dominio: (instante, [(ordem, chave)])}
+        self._snapshots = {}
+        self._lock_snapshots = threading.Lock()
+
+        if cache_file_path is None:
+            return
 
         # Carregar o cache do disco
         self._load_cache_from_disk()
@@ -37,6 +76,9 @@ class DNSCache:
                     # Carrega tanto o cache quanto seu tamanho calculado
                     self.cache = data_to_load['cache']
                     self.tamanho_atual_bytes = data_to_load['tamanho_atual_bytes']
+                    # Reconstrói o estado da política na ordem salva
+                    for key, entry in self.cache.items():
+                        self.politica.inserir(key, entry["size"])
                     print(f"Cache carregado com sucesso de {self.cache_file_path}.")
             except Exception as e:
                 print(f"Erro ao carregar cache de {self.cache_file_path}: {e}. Iniciando cache vazio.")
@@ -62,42 +104,65 @@ class DNSCache:
         except Exception as e:
             print(f"Erro ao salvar cache em {self.cache_file_path}: {e}")
 
-    def calculate_entry_size(self, key, value):
+    def calculate_entry_size(self, key, value, pacote = None):
         """
-        Estima o tamanho (em bytes) de uma entrada do cache.
+        Estima o tamanho (em bytes) de uma entrada do cache: a chave, a lista de registros com
+        cada dicionário e seus valores (TAMANHO_CAMPOS_REGISTRO) e a resposta já empacotada.
         """
-        return sys.getsizeof(key) + sys.getsizeof(value)
+        tamanho = sys.getsizeof(key) + sys.getsizeof(value)
+        if isinstance(value, list):
+            for registro in value:
+                tamanho += sys.getsizeof(registro) + TAMANHO_CAMPOS_REGISTRO
+        if pacote is not None:
+            tamanho += sys.getsizeof(pacote) + sys.getsizeof(pacote[0])
+        return tamanho
     
+    def capacidade_estimada(self, registros = 2):
+        """
+        Quantas respostas típicas ('registros' registros cada, empacotadas) cabem no limite de bytes.
+        """
+        tipica = self.calculate_entry_size("x" * 20 + ".exemplo.com.|A", [{}] * registros,
+                                           (bytes(16 * registros), registros, 0, 0))
+        return self.tamanho_maximo_bytes // tipica
+
     def remove(self, key = None):
         """
         Remove uma entrada do cache.
 
-        - Se 'key' não for informada, remove o item mais antigo (LRU) usando popitem(last=False).
+        - Se 'key' não for informada, remove a entrada escolhida pela política de remoção.
         - Caso contrário, remove a entrada associada à chave informada.
         """
-        entry = None
-
         if not key:
-            # Remove o primeiro item inserido/menos recentemente usado
-            _, entry = self.cache.popitem(last=False)
-        else:
-            # Remove a entrada específica solicitada
-            entry = self.cache.pop(key)
+            key = self.politica.vitima()
+
+        # Remove a entrada e avisa a política
+        entry = self.cache.pop(key)
+        self.politica.remover(key)
         
         # Subtrai o tamanho da entrada removida do total atual
         self.tamanho_atual_bytes -= entry["size"]
     
-    def set_key(self, key, value, ttl):
+    def set_key(self, key, value, ttl, rcode = None):
         """
         Adiciona ou atualiza uma entrada de resposta DNS no cache.
+
+        As seções da resposta são empacotadas aqui (e contadas no tamanho da entrada), então os
+        acertos não precisam empacotá-las. O 'rcode' da resposta (0 para NOERROR/NODATA, 3 para
+        NXDOMAIN) fica em entry["rcode"] e é repetido nos acertos. Retorna False se a política
+        recusou a entrada (TINYLFU).
         """
+        try:
+            pacote = empacotar_registros(value, key.rpartition("|")[0])
+        except Exception:
+            pacote = None   # Valor que não é uma lista de registros: empacotado no primeiro acerto
+
         with self._lock:
             # Se já existe, remove antigo (assim atualizamos tamanho e posição)
             if key in self.cache:
                 self.remove(key)
 
             # Estimativa de tamanho da nova entrada
-            tamanho_entrada = self.calculate_entry_size(key, value)
+            tamanho_entrada = self.calculate_entry_size(key, value, pacote)
             # Momento (timestamp) em que a entrada expirará
             expire_at = time.time() + ttl
 
@@ -106,20 +171,38 @@ class DNSCache:
                 "value": value,
                 "expire_at": expire_at,
                 "size": tamanho_entrada,
+                "acertos": 0,
             }
+            if pacote is not None:
+                self.cache[key]["pacote"] = pacote
+            if rcode is not None:
+                self.cache[key]["rcode"] = rcode
 
             # Atualiza contador total de bytes no cache
             self.tamanho_atual_bytes += tamanho_entrada
+            self.politica.inserir(key, tamanho_entrada)
 
-            # Evita ultrapassar o limite: remove itens mais antigos até caber
-            while self.tamanho_atual_bytes > self.tamanho_maximo_bytes:
+            # Evita ultrapassar o limite: remove as entradas escolhidas pela política até caber
+            # (com TINYLFU a própria entrada nova pode ser recusada)
+            while self.tamanho_atual_bytes > self.tamanho_maximo_bytes and self.cache:
                 self.remove()
+            return key in self.cache
 
     def get_key(self, key):
         """
         Recupera uma resposta do cache.
         """
+        entry = self.get_entry(key)
+        # Retorna apenas o valor (ex.: lista de registros A)
+        return entry["value"] if entry is not None else None
+
+    def get_entry(self, key):
+        """
+        Recupera a entrada completa do cache (valor, expiração, tamanho e dados auxiliares,
+        como a resposta já empacotada guardada pelo servidor).
+        """
         with self._lock:
+            self.politica.registrar(key)
             if key not in self.cache:
                 return None
             
@@ -131,8 +214,258 @@ class DNSCache:
                 self.remove(key)
                 return None
             
-            # Marca como recentemente usada: move para o fim
-            self.cache.move_to_end(key)
+            # Marca como recentemente usada
+            self.politica.acessar(key)
+            entry["acertos"] = entry.get("acertos", 0) + 1
+
+            return entry
+
+    def set_resposta(self, dominio, qtype, registros, rcode = None):
+        """
+        Armazena a resposta completa (todas as seções) de uma consulta em 'dominio|qtype'.
+
+        Os CNAMEs da cadeia também são guardados em 'nome|CNAME', e os registros do destino
+        final em 'destino|qtype', para que outros apelidos do mesmo destino (comum em CDNs)
+        sejam respondidos pelo cache. 'dominio' deve estar em minúsculas e terminar com ponto.
+
+        Com o 'rcode' da resposta informado, respostas negativas (NXDOMAIN, ou NODATA) que trazem
+        o SOA da zona também são guardadas, pelo menor entre o TTL e o mínimo do SOA (RFC 2308).
+        Retorna o TTL usado, ou None se a resposta não foi guardada (sem registros na seção de
+        resposta, negativa sem SOA ou recusada pela política de remoção).
+        """
+        if rcode not in (None, 0, 3):
+            return None   # SERVFAIL, REFUSED...: não são guardados
+        respostas = [r for r in registros if r.get("secao", "answer") == "answer"]
+        if not respostas:
+            return self._set_negativa(dominio, qtype, registros, rcode)
+        ttl = min(r["ttl"] for r in registros)
+        if ttl <= 0:
+            return None
+
+        if not self.set_key(f"{dominio}|{qtype}", registros, ttl, rcode=rcode):
+            return None
+        if qtype == "CNAME":
+            return ttl
+
+        # Percorre a cadeia a partir do nome consultado. O rcode vale para o nome consultado (um
+        # NXDOMAIN é do fim da cadeia): os CNAMEs e o destino só o recebem quando for NOERROR
+        rcode_cadeia = rcode if rcode == 0 else None
+        nome = dominio
+        for _ in range(MAX_CADEIA_CNAME):
+            cname = next((r for r in respostas if r["type"] == "CNAME" and r["name"].lower() == nome), None)
+            if cname is None:
+                break
+            self.set_key(f"{nome}|CNAME", [cname], cname["ttl"], rcode=rcode_cadeia)
+            nome = cname["address"].lower()
+
+        if nome != dominio:
+            finais = [r for r in respostas if r["type"] == qtype and r["name"].lower() == nome]
+            if finais:
+                self.set_key(f"{nome}|{qtype}", finais, min(r["ttl"] for r in finais), rcode=rcode_cadeia)
+
+        return ttl
+
+    def _set_negativa(self, dominio, qtype, registros, rcode):
+        """
+        Guarda uma resposta NXDOMAIN (rcode 3) ou NODATA (rcode 0) só com o SOA da seção de autoridade.
+        """
+        if rcode not in (0, 3):
+            return None
+        soa = next((r for r in registros if r["type"] == "SOA" and r.get("secao") == "authority"), None)
+        if soa is None:
+            return None
+        rdata = soa.get("rdata")
+        try:
+            minimo = rdata.times[4] if rdata is not None else int(soa["address"].split()[-1])
+        except (AttributeError, IndexError, ValueError):
+            return None
+        ttl = min(soa["ttl"], minimo)
+        if ttl <= 0:
+            return None
+        if not self.set_key(f"{dominio}|{qtype}", [dict(soa, ttl=ttl)], ttl, rcode=rcode):
+            return None
+        return ttl
 
-            # Retorna apenas o valor (ex.: lista de registros A)
-            return entry["value"]
\ No newline at end of file
+    def get_resposta(self, dominio, qtype):
+        """
+        Recupera a entrada de 'dominio|qtype'. Se ela não existir, tenta montá-la a partir
+        de CNAMEs e do destino já guardados por set_resposta (ex: outro apelido do mesmo destino).
+        A resposta montada é guardada com o menor tempo restante entre as partes.
+        """
+        entry = self._montar_resposta(dominio, qtype)
+        if entry is not None:
+            self.acertos += 1
+        else:
+            self.falhas += 1
+        return entry
+
+    def _montar_resposta(self, dominio, qtype):
+        entry = self.get_entry(f"{dominio}|{qtype}")
+        if entry is not None or qtype == "CNAME":
+            return entry
+
+        cadeia = []
+        expira = float("inf")
+        nome = dominio
+        for _ in range(MAX_CADEIA_CNAME):
+            cname = self.get_entry(f"{nome}|CNAME")
+            if cname is None or not cname["value"] or cname["value"][0].get("type") != "CNAME":
+                return None   # Sem CNAME guardado, ou resposta negativa (só o SOA)
+            cadeia.extend(cname["value"])
+            expira = min(expira, cname["expire_at"])
+            nome = cname["value"][0]["address"].lower()
+
+            final = self.get_entry(f"{nome}|{qtype}")
+            if final is not None and final.get("rcode") == 3:
+                return None   # Destino inexistente: a resposta com o NXDOMAIN vem do upstream
+            if final is not None:
+                registros = cadeia + [r for r in final["value"] if r.get("secao", "answer") == "answer"]
+                restante = min(expira, final["expire_at"]) - time.time()
+                if restante <= 0:
+                    return None
+                self.set_key(f"{dominio}|{qtype}", registros, restante)
+                return self.get_entry(f"{dominio}|{qtype}")
+
+        return None
+
+    def contem(self, key):
+        """
+        Indica se a chave está no cache e não expirou, sem alterar a ordem LRU nem os contadores.
+        """
+        entry = self.cache.get(key)
+        return entry is not None and entry["expire_at"] > time.time()
+
+    def _chaves_ordenadas(self, por_dominio = False, refazer = False):
+        """
+        Retorna a lista ordenada de (ordem, chave) de todas as entradas. A cópia das chaves é feita
+        sob o lock e a ordenação fora dele; a lista é reaproveitada por CACHE_API_SNAPSHOT_S segundos,
+        então cada página custa uma busca binária mais o tamanho da página.
+        """
+        agora = time.monotonic()
+        with self._lock_snapshots:
+            instante, chaves = self._snapshots.get(por_dominio, (None, None))
+        if refazer or chaves is None or agora - instante > config.CACHE_API_SNAPSHOT_S:
+            with self._lock:
+                chaves = list(self.cache)
+            chaves = sorted((ordem_dominio(k) if por_dominio else k, k) for k in chaves)
+            with self._lock_snapshots:
+                self._snapshots[por_dominio] = (agora, chaves)
+        return chaves
+
+    @staticmethod
+    def _intervalo(chaves, prefixo, cursor = None):
+        """
+        Itera as chaves cuja ordem começa com 'prefixo', a partir da primeira depois de 'cursor'.
+        """
+        inicio = bisect_left(chaves, (prefixo,))
+        if cursor:
+            inicio = max(inicio, bisect_right(chaves, (cursor, _FIM)))
+        for i in range(inicio, len(chaves)):
+            ordem, chave = chaves[i]
+            if not ordem.startswith(prefixo):
+                return
+            yield ordem, chave
+
+    @staticmethod
+    def _descrever(key, entry, agora):
+        nome, _, tipo = key.rpartition("|")
+        return {
+            "chave": key,
+            "nome": nome,
+            "tipo": tipo,
+            "ttl_restante": int(entry["expire_at"] - agora),
+            "acertos": entry.get("acertos", 0),
+            "tamanho": entry["size"],
+            "registros": [{
+                "name": r["name"],
+                "type": r["type"],
+                "address": r["address"],
+                "ttl": r["ttl"],
+                "secao": r.get("secao", "answer"),
+            } for r in entry["value"]],
+        }
+
+    def listar(self, cursor = None, limite = 50, prefixo = None, dominio = None, qtype = None):
+        """
+        Retorna uma página das entradas do cache em ordem de chave, com TTL restante e acertos.
+
+        - 'prefixo' filtra pelo início da chave (ex: "www.goo"); 'dominio' traz o domínio e todos
+          os seus subdomínios (ordem pelos rótulos invertidos); 'qtype' filtra pelo tipo.
+        - 'cursor' é o valor de 'proximo' da página anterior (None na última página).
+        Entradas expiradas encontradas no caminho são removidas.
+
+        A lista ordenada e os filtros são percorridos fora do lock; só as chaves selecionadas
+        são consultadas no cache, em lotes do tamanho da página.
+        """
+        limite = max(1, min(int(limite), config.CACHE_API_LIMITE_PAGINA))
+        if dominio:
+            chaves = self._chaves_ordenadas(por_dominio=True)
+            faixa = self._intervalo(chaves, ordem_dominio(dominio + "|").rpartition("|")[0], cursor)
+        else:
+            chaves = self._chaves_ordenadas()
+            faixa = self._intervalo(chaves, prefixo or "", cursor)
+
+        if qtype:
+            faixa = ((ordem, key) for ordem, key in faixa if key.endswith("|" + qtype))
+
+        entradas = []
+        proximo = None
+        agora = time.time()
+        while True:
+            # Um lote de candidatas (uma a mais que o que falta, para saber se há próxima página)
+            faltam = limite - len(entradas)
+            lote = [item for _, item in zip(range(faltam + 1), faixa)]
+            with self._lock:
+                for ordem, key in lote:
+                    entry = self.cache.get(key)
+                    if entry is None:
+                        continue
+                    if entry["expire_at"] <= agora:
+                        self.remove(key)
+                        continue
+                    if len(entradas) == limite:
+                        return {"entradas": entradas, "proximo": proximo, "total": len(self.cache)}
+                    entradas.append(self._descrever(key, entry, agora))
+                    proximo = ordem
+            if len(lote) <= faltam:
+                break   # A faixa acabou
+
+        return {"entradas": entradas, "proximo": None, "total": len(self.cache)}
+
+    def limpar(self, nome = None, sufixo = None, qtype = None):
+        """
+        Remove as entradas de 'nome' (exato), de 'sufixo' (o domínio e seus subdomínios) e/ou
+        do tipo 'qtype'. Sem nenhum filtro, esvazia o cache. Retorna a quantidade removida.
+        """
+        if nome:
+            prefixo = ordem_dominio(nome + "|")
+        elif sufixo:
+            prefixo = ordem_dominio(sufixo + "|").rpartition("|")[0]
+        else:
+            prefixo = ""
+        # Lista refeita na hora para não deixar de fora entradas recentes
+        chaves = self._chaves_ordenadas(por_dominio=True, refazer=True)
+        alvos = [key for _, key in self._intervalo(chaves, prefixo)
+                 if not qtype or key.endswith("|" + qtype)]
+
+        removidas = 0
+        with self._lock:
+            for key in alvos:
+                if key in self.cache:
+                    self.remove(key)
+                    removidas += 1
+        return removidas
+
+    def estatisticas(self):
+        """
+        Retorna o tamanho do cache e a taxa de acerto das consultas feitas por get_resposta.
+        """
+        total = self.acertos + self.falhas
+        return {
+            "politica": type(self.politica).__name__,
+            "entradas": len(self.cache),
+            "bytes": self.tamanho_atual_bytes,
+            "acertos": self.acertos,
+            "falhas": self.falhas,
+            "taxa_acerto": round(self.acertos / total, 4) if total else None,
+        }
@@ -1,6 +1,9 @@
 import socket  # Permite criar soquetes para enviar e receber pacotes UDP
-from dnslib import DNSRecord, DNSHeader, DNSQuestion, QTYPE, RCODE  # Biblioteca que facilita a criação e análise de pacotes DNS
-from .config import UPSTREAM_DNS
+import struct
+from dnslib import DNSRecord, DNSHeader, DNSQuestion, DNSBuffer, DNSLabel, QTYPE, RCODE, A, AAAA  # Biblioteca que facilita a criação e análise de pacotes DNS
+from dnslib.dns import RDMAP
+from .dns_log import query_log
+from . import config
 
 # Dicionário de tipos de consulta DNS
 QUERY_TYPES = {
@@ -10,33 +13,47 @@ QUERY_TYPES = {
     "TXT": 16   # Registros de texto
 }
 
-def build_query(domain, query_type="A"):
+def tipo_consulta(query_type):
     """
-    Constrói um pacote DNS de consulta para enviar ao servidor upstream
+    Converte o tipo de consulta (nome como "SRV", número ou "TYPE65") para o valor numérico.
+    Tipos desconhecidos resultam em A.
     """
-    query_type = query_type.upper()
+    if isinstance(query_type, int):
+        return query_type
 
-    # Obtém o valor numérico do tipo de consulta corretamente
+    query_type = str(query_type).upper()
     if query_type in QUERY_TYPES:
-        qtype_enum = QUERY_TYPES[query_type]
-    else:
-        qtype_enum = 1  # Default A
+        return QUERY_TYPES[query_type]
+    if query_type in QTYPE.reverse:
+        return QTYPE.reverse[query_type]
+    if query_type.startswith("TYPE") and query_type[4:].isdigit():
+        return int(query_type[4:])
+    return 1  # Default A
+
+def nome_tipo(qtype):
+    """
+    Retorna o nome do tipo de registro (ex: 33 -> "SRV"); tipos sem nome viram "TYPE<n>".
+    """
+    return QTYPE.forward.get(qtype, f"TYPE{qtype}")
 
-    request = DNSRecord(q=DNSQuestion(domain, qtype_enum))
+def build_query(domain, query_type="A"):
+    """
+    Constrói um pacote DNS de consulta para enviar ao servidor upstream
+    """
+    request = DNSRecord(q=DNSQuestion(domain, tipo_consulta(query_type)))
     return request.pack()
 
 def query_upstream(domain, query_type="A", transaction_id = None, timeout = 5):
     """
     Envia uma consulta DNS para o servidor upstream via UDP e retorna a resposta
+    (no modo recursivo, resolve a partir dos servidores raiz; ver dns_recursivo.py)
     """
-    try:
-        query_type = query_type.upper()
-        if query_type in QUERY_TYPES:
-            qtype_enum = QUERY_TYPES[query_type]
-        else:
-            qtype_enum = 1  # Default A
+    if config.MODO_RESOLUCAO == "recursivo":
+        from .dns_recursivo import resolvedor_recursivo
+        return resolvedor_recursivo().consultar(domain, query_type, transaction_id)
 
-        request = DNSRecord(q=DNSQuestion(domain, qtype_enum))
+    try:
+        request = DNSRecord(q=DNSQuestion(domain, tipo_consulta(query_type)))
         if transaction_id is not None:
             request.header.id = int(transaction_id)
 
@@ -44,58 +61,223 @@ def query_upstream(domain, query_type="A", transaction_id = None, timeout = 5):
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         sock.settimeout(timeout)
 
-        # Envia a consulta para o servidor upstream
-        sock.sendto(request.pack(), UPSTREAM_DNS)
+        # Envia a consulta para o servidor upstream (lido a cada chamada, para permitir trocá-lo em execução)
+        sock.sendto(request.pack(), config.UPSTREAM_DNS)
 
         # Recebe a resposta (até 4096 bytes, para respostas maiores)
         resposta_bytes, _ = sock.recvfrom(4096)
         sock.close()
 
-        if transaction_id is not None:
-            try:
-                response = DNSRecord.parse(resposta_bytes)
-                response.header.id = int(transaction_id)
-                return response.pack()
-            except Exception:
-                return resposta_bytes
+        # Resposta truncada (flag TC): repete a consulta via TCP
+        if len(resposta_bytes) > 2 and resposta_bytes[2] & 0x02:
+            resposta_bytes = query_upstream_tcp(request.pack(), timeout)
 
+        if transaction_id is not None and len(resposta_bytes) >= 2:
+            # Troca apenas os 2 bytes do ID: reempacotar com o dnslib poderia alterar
+            # registros de tipos que ele não conhece
+            return struct.pack("!H", int(transaction_id)) + resposta_bytes[2:]
 
         return resposta_bytes
 
     except socket.timeout:
-        print("Timeout ao consultar servidor upstream.")
+        query_log.registrar("WARNING", "UPSTREAM TIMEOUT", dominio=domain, tipo=query_type,
+                            upstream=config.UPSTREAM_DNS[0])
         return None
     except Exception as e:
-        print(f"Erro ao consultar servidor upstream: {e}")
+        query_log.registrar("ERROR", "ERROR", motivo=f"upstream: {e}", dominio=domain)
         return None
 
+def query_upstream_tcp(query_packet, timeout = 5, servidor = None):
+    """
+    Envia uma consulta já montada ao servidor upstream (ou a 'servidor') via TCP
+    (usado quando a resposta UDP vem truncada)
+    """
+    with socket.create_connection(servidor or config.UPSTREAM_DNS, timeout=timeout) as sock:
+        # No TCP cada mensagem DNS é prefixada com 2 bytes de tamanho
+        sock.sendall(struct.pack("!H", len(query_packet)) + query_packet)
+
+        resposta = b""
+        tamanho = None
+        while tamanho is None or len(resposta) < tamanho + 2:
+            parte = sock.recv(4096)
+            if not parte:
+                break
+            resposta += parte
+            if tamanho is None and len(resposta) >= 2:
+                tamanho = struct.unpack("!H", resposta[:2])[0]
+
+        return resposta[2:]
+
 def parse_query(data):
 
     """
     Faz o parsing de uma consulta DNS recebida de um cliente
     """
 
+    id_transicao, dominio, qtype, _ = localizar_pergunta(data)
+    return id_transicao, dominio, qtype
+
+def localizar_pergunta(data):
+
+    """
+    Lê o cabeçalho e a pergunta de uma consulta DNS sem montar objetos do dnslib.
+
+    Aceita bytes, bytearray ou memoryview (sem copiar o pacote) e retorna
+    (id_transicao, dominio, qtype, fim_pergunta), onde 'fim_pergunta' é o offset
+    do primeiro byte após a pergunta. O domínio é retornado em minúsculas, com o ponto final.
+    """
+
     try:
-        # Interpreta os bytes da consulta DNS em um objeto DNSRecord
-        d = DNSRecord.parse(data)
+        tamanho = len(data)
+        if tamanho < 17 or data[2] & 0x80 or data[4] != 0 or data[5] != 1:
+            # Pacote curto, resposta (QR=1) ou quantidade de perguntas diferente de 1
+            raise ValueError("consulta DNS inválida")
 
-        # Extrai o ID da transação
-        id_transicao = d.header.id
+        id_transicao = (data[0] << 8) | data[1]
 
-        # Extrai o nome do domínio consultado
-        dominio = str(d.q.qname)
+        # Nome da pergunta: sequência de rótulos prefixados pelo tamanho, terminada por 0
+        pos = 12
+        rotulos = []
+        while True:
+            n = data[pos]
+            if n == 0:
+                pos += 1
+                break
+            if n & 0xC0:
+                raise ValueError("compressão de nome na pergunta")
+            rotulos.append(bytes(data[pos + 1:pos + 1 + n]).decode("ascii").lower())
+            pos += 1 + n
+            if pos > 12 + 255:
+                raise ValueError("nome muito longo")
 
-        # Extrai o tipo da consulta
-        qtype = d.q.qtype
+        if pos + 4 > tamanho:
+            raise ValueError("pergunta incompleta")
 
-        return id_transicao, dominio, qtype
-    except Exception as e:
-        print(f"Erro ao parsear consulta: {e}")
-        return None, None, None
+        qtype = (data[pos] << 8) | data[pos + 1]
+        dominio = ".".join(rotulos) + "."
+        return id_transicao, dominio, qtype, pos + 4
+
+    except Exception:
+        # Caso incomum (ex: rótulos com caracteres não ASCII): usa o parser do dnslib
+        try:
+            buffer = DNSBuffer(bytes(data))
+            header = DNSHeader.parse(buffer)
+            pergunta = DNSQuestion.parse(buffer)
+            return header.id, str(pergunta.qname).lower(), pergunta.qtype, buffer.offset
+        except Exception as e:
+            # Só em DEBUG: quem chamou já registra a consulta inválida
+            query_log.registrar("DEBUG", "ERROR", motivo=f"consulta inválida: {e}")
+            return None, None, None, None
+
+class _BufferSemCompressao(DNSBuffer):
+
+    """
+    Buffer do dnslib que nunca comprime nomes: o rdata empacotado pode ser copiado
+    para qualquer posição de outro pacote sem que ponteiros fiquem inválidos.
+    """
+
+    def encode_name(self, name):
+        self.encode_name_nocompress(name)
+
+def empacotar_nome(nome):
+
+    """
+    Converte um nome de domínio para o formato de rótulos do DNS (sem compressão).
+    """
+
+    return b"".join(bytes([len(rotulo)]) + rotulo for rotulo in DNSLabel(nome).label) + b"\x00"
+
+def empacotar_rdata(rdata):
+
+    """
+    Empacota o rdata (objeto do dnslib) de um registro em bytes, sem compressão de nomes.
+    """
+
+    buffer = _BufferSemCompressao()
+    rdata.pack(buffer)
+    return bytes(buffer.data)
+
+def empacotar_rr(nome_wire, rtype, ttl, rdata_wire, rclass = 1):
 
-def parse_response(data, query_type):
+    """
+    Monta um registro de recurso a partir do nome já em formato wire e do rdata empacotado.
+    """
+
+    return nome_wire + struct.pack("!HHIH", rtype, rclass, ttl, len(rdata_wire)) + rdata_wire
+
+def _rdata_de_registro(registro):
+
+    """
+    Obtém o rdata de um registro do cache. Registros antigos (sem a chave 'rdata')
+    são reconstruídos a partir do endereço textual quando possível.
+    """
+
+    rdata = registro.get("rdata")
+    if rdata is not None:
+        return rdata
+
+    tipo = registro["type"]
+    try:
+        if tipo == "A":
+            return A(registro["address"])
+        if tipo == "AAAA":
+            return AAAA(registro["address"])
+        return RDMAP[tipo].fromZone(registro["address"].split())
+    except Exception:
+        return None
+
+def empacotar_registros(registros, dominio):
+
+    """
+    Empacota uma lista de registros do cache nas seções de resposta, autoridade e adicional.
+
+    Registros cujo nome é o próprio domínio consultado usam o ponteiro 0xC00C
+    (a pergunta sempre começa no offset 12). Registros sem 'secao' pertencem à resposta.
+    Retorna (bytes, ancount, nscount, arcount).
+    """
+
+    secoes = {"answer": [], "authority": [], "additional": []}
+    dominio = dominio.lower()
+    for registro in registros:
+        rdata = _rdata_de_registro(registro)
+        if rdata is None:
+            continue
+        nome = registro["name"]
+        nome_wire = b"\xc0\x0c" if nome.lower() == dominio else empacotar_nome(nome)
+        rtype = tipo_consulta(registro["type"])
+        secoes[registro.get("secao", "answer")].append(
+            empacotar_rr(nome_wire, rtype, registro["ttl"], empacotar_rdata(rdata)))
+
+    respostas, autoridade, adicional = secoes["answer"], secoes["authority"], secoes["additional"]
+    return (b"".join(respostas + autoridade + adicional),
+            len(respostas), len(autoridade), len(adicional))
+
+def montar_resposta(query, fim_pergunta, respostas = b"", ancount = 0, nscount = 0, arcount = 0, rcode = 0, aa = False,
+                    tc = False):
+
+    """
+    Monta uma resposta reaproveitando os bytes da consulta recebida.
+
+    Copia o ID, o opcode, a flag RD e a pergunta da consulta (bytes ou memoryview),
+    define QR=1, RA=1 e o RCODE e anexa as seções já empacotadas.
+    Com tc=True a resposta vai marcada como truncada (o cliente deve repetir via TCP).
+    """
+
+    flags = 0x8080 | ((query[2] & 0x79) << 8) | (rcode & 0x0F)  # QR, RA + opcode/RD da consulta
+    if aa:
+        flags |= 0x0400
+    if tc:
+        flags |= 0x0200
+    cabecalho = bytes(query[0:2]) + struct.pack("!HHHHH", flags, 1, ancount, nscount, arcount)
+    return cabecalho + bytes(query[12:fim_pergunta]) + respostas
+
+def parse_response(data, query_type = None):
     """
     Parseia uma resposta DNS recebida de um servidor upstream
+
+    Mantém todas as seções (resposta, autoridade e adicional) e registros de qualquer tipo,
+    inclusive os CNAMEs da cadeia. Cada registro indica sua seção em 'secao'; o TTL
+    retornado é o menor entre os registros. 'query_type' é aceito por compatibilidade.
     """
     
     try:
@@ -103,51 +285,85 @@ def parse_response(data, query_type):
         registros = []
         ttl = None
 
-        for rr in d.rr:
-            tipo = QTYPE[rr.rtype]
-
-            if tipo != query_type.upper():
-                continue  # ignora registros de outros tipos
-
-            # Tratamento para diferentes tipos de rdata
-            if tipo == "A" or tipo == "AAAA":
-                address = str(rr.rdata)
-            elif tipo == "MX":
-                address = str(rr.rdata.exchange)  # MX tem atributo exchange
-            else:
-                address = str(rr.rdata)
+        for secao, rrs in (("answer", d.rr), ("authority", d.auth), ("additional", d.ar)):
+            for rr in rrs:
+                if rr.rtype == QTYPE.OPT:
+                    continue  # Pseudo-registro do EDNS, não pertence à resposta
 
-            registros.append({
-                "name": str(rr.rname),
-                "type": tipo,
-                "address": address,
-                "ttl": rr.ttl
-            })
+                registros.append({
+                    "name": str(rr.rname),
+                    "type": nome_tipo(rr.rtype),
+                    "address": str(rr.rdata),
+                    "ttl": rr.ttl,
+                    "secao": secao,
+                    "rdata": rr.rdata  # Mantido para empacotar a resposta direto do cache
+                })
 
-            if ttl is None:
-                ttl = rr.ttl
+                if ttl is None or rr.ttl < ttl:
+                    ttl = rr.ttl
 
         return registros, ttl
 
     except Exception as e:
-        print(f"Erro ao parsear resposta: {e}")
+        query_log.registrar("ERROR", "ERROR", motivo=f"resposta inválida: {e}")
         return [], None
 
-    
 
-def get_blocked_response(id_transicao):
+# Respostas de sinkhole já empacotadas, por (tipo, endereço, ttl)
+_RESPOSTAS_SINKHOLE = {}
+
+def _resposta_sinkhole(qtype, ttl):
+    """
+    Retorna o registro de resposta (0.0.0.0 ou ::, por padrão) para o sinkhole,
+    empacotado uma única vez. O nome usa o ponteiro para a pergunta (0xC00C).
+    """
+    if qtype == QTYPE.A:
+        endereco = config.BLOCKLIST_SINKHOLE_IPV4
+    elif qtype == QTYPE.AAAA:
+        endereco = config.BLOCKLIST_SINKHOLE_IPV6
+    else:
+        return None
+
+    chave = (qtype, endereco, ttl)
+    rr = _RESPOSTAS_SINKHOLE.get(chave)
+    if rr is None:
+        familia = socket.AF_INET if qtype == QTYPE.A else socket.AF_INET6
+        rr = _RESPOSTAS_SINKHOLE[chave] = empacotar_rr(b"\xc0\x0c", qtype, ttl, socket.inet_pton(familia, endereco))
+    return rr
+
+def get_blocked_response(query_packet, modo = None, fim_pergunta = None, qtype = None):
     
     """ 
-    Gera uma resposta NXDOMAIN para domínios bloqueados
+    Gera a resposta para um domínio bloqueado a partir dos bytes da própria consulta.
+
+    O cabeçalho é copiado e ajustado (QR, RCODE e contadores) e a pergunta é reaproveitada,
+    sem parsear o pacote com o dnslib. Modos (config.BLOCKLIST_MODO):
+    - "NXDOMAIN": domínio inexistente (padrão)
+    - "NODATA": NOERROR sem registros
+    - "SINKHOLE": responde A 0.0.0.0 / AAAA :: (outros tipos recebem NODATA)
+    - "REFUSED": consulta recusada
+
+    'fim_pergunta' e 'qtype' podem ser informados quando a consulta já foi parseada.
+    Retorna None se a consulta for inválida.
     """
     
-    # Converter de bytes para inteiro, se necessário
-    if isinstance(id_transicao, bytes):
-        id_transicao = int.from_bytes(id_transicao, "big")
-    
-    response = DNSRecord(
-        header=DNSHeader(id=id_transicao, qr=1, rcode=RCODE.NXDOMAIN),
-        q=DNSQuestion("blocked.domain", QTYPE.A)
-    )
+    modo = (modo or config.BLOCKLIST_MODO).upper()
+
+    if fim_pergunta is None or qtype is None:
+        _, dominio, qtype, fim_pergunta = localizar_pergunta(query_packet)
+        if dominio is None:
+            return None
+
+    if modo == "REFUSED":
+        return montar_resposta(query_packet, fim_pergunta, rcode=RCODE.REFUSED)
+
+    if modo == "SINKHOLE":
+        rr = _resposta_sinkhole(qtype, config.BLOCKLIST_TTL_RESPOSTA)
+        if rr is not None:
+            return montar_resposta(query_packet, fim_pergunta, rr, ancount=1)
+        return montar_resposta(query_packet, fim_pergunta)
+
+    if modo == "NODATA":
+        return montar_resposta(query_packet, fim_pergunta)
 
-    return response.pack()
\ No newline at end of file
+    return montar_resposta(query_packet, fim_pergunta, rcode=RCODE.NXDOMAIN)
@@ -0,0 +1,305 @@
+import os
+import time
+import queue
+import sqlite3
+import atexit
+import threading
+from contextlib import closing
+from collections import Counter
+from datetime import datetime
+
+from . import config
+
+# Granularidades das tabelas de agregação (em segundos)
+GRANULARIDADES = {"minuto": 60, "hora": 3600}
+
+# A partir desse intervalo as consultas agregadas usam as tabelas por hora
+INTERVALO_USAR_HORA = 3 * 3600
+
+# Fontes que respondem sem ir ao upstream (acertos) e todas as que passam pelo cache, usadas na
+# taxa de acerto. A blocklist fica de fora: essas consultas nunca chegam ao cache.
+FONTES_ACERTO = ("cache", "local", "par")
+FONTES_RESPONDIDAS = FONTES_ACERTO + ("upstream",)
+
+
+class HistoricoConsultas:
+    def __init__(self, caminho = None, retencao_dias = None, fila_max = None, lote_max = None):
+        """
+        Inicializa o histórico persistente de consultas (SQLite).
+
+        - As consultas brutas ficam em uma tabela por dia (consultas_AAAAMMDD), apagadas após 'retencao_dias'.
+        - Contagens por domínio, cliente e fonte são acumuladas incrementalmente em tabelas
+          por minuto e por hora, então as agregações não precisam varrer as consultas brutas.
+        - A escrita é feita em lotes por uma thread em segundo plano; registrar() nunca bloqueia.
+
+        Os parâmetros omitidos vêm do config.py; retenção e tamanho do lote são lidos a cada uso
+        (e acompanham a recarga da configuração).
+        """
+        self.caminho = config.HISTORICO_ARQUIVO if caminho is None else caminho
+        self._retencao_dias = retencao_dias
+        self._lote_max = lote_max
+
+        self._fila = queue.Queue(maxsize=config.HISTORICO_FILA_MAX if fila_max is None else fila_max)
+        self._local = threading.local()   # Uma conexão de leitura por thread
+        self._particoes = set()
+        self.descartados = 0
+
+        diretorio = os.path.dirname(self.caminho)
+        if diretorio and not os.path.exists(diretorio):
+            os.makedirs(diretorio)
+
+        self._criar_tabelas_agregadas()
+
+        self._rodando = True
+        self._thread = threading.Thread(target=self._loop_escrita, daemon=True)
+        self._thread.start()
+        atexit.register(self.fechar)
+
+    @property
+    def retencao_dias(self):
+        return config.HISTORICO_RETENCAO_DIAS if self._retencao_dias is None else self._retencao_dias
+
+    @property
+    def lote_max(self):
+        return config.HISTORICO_LOTE_MAX if self._lote_max is None else self._lote_max
+
+    def _conectar(self):
+        conn = sqlite3.connect(self.caminho, timeout=10, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")     # Leitores não bloqueiam o escritor
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _leitura(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._conectar()
+        return conn
+
+    def _criar_tabelas_agregadas(self):
+        with closing(self._conectar()) as conn, conn:
+            for gran in GRANULARIDADES:
+                conn.execute(f"""CREATE TABLE IF NOT EXISTS agg_dominio_{gran} (
+                    periodo INTEGER, dominio TEXT, total INTEGER, bloqueados INTEGER,
+                    PRIMARY KEY (periodo, dominio)) WITHOUT ROWID""")
+                conn.execute(f"""CREATE TABLE IF NOT EXISTS agg_cliente_{gran} (
+                    periodo INTEGER, cliente TEXT, total INTEGER,
+                    PRIMARY KEY (periodo, cliente)) WITHOUT ROWID""")
+                conn.execute(f"""CREATE TABLE IF NOT EXISTS agg_fonte_{gran} (
+                    periodo INTEGER, fonte TEXT, total INTEGER,
+                    PRIMARY KEY (periodo, fonte)) WITHOUT ROWID""")
+
+    def registrar(self, dominio, qtype, fonte, cliente = None, latencia_ms = None, ts = None):
+        """
+        Enfileira uma consulta para ser gravada. Retorna False se a fila estiver cheia.
+
+        'fonte' indica de onde veio a resposta: "cache", "upstream", "blocklist", ...
+        """
+        try:
+            self._fila.put_nowait((ts or time.time(), cliente, dominio.rstrip('.').lower(), qtype, fonte, latencia_ms))
+            return True
+        except queue.Full:
+            self.descartados += 1
+            return False
+
+    def fechar(self):
+        """
+        Grava o que restar na fila e encerra a thread de escrita.
+        """
+        if not self._rodando:
+            return
+        self._rodando = False
+        self._thread.join(timeout=5)
+
+    def sincronizar(self, timeout = 5):
+        """
+        Aguarda a fila de escrita esvaziar (útil antes de consultar dados recém registrados).
+        """
+        limite = time.time() + timeout
+        while self._fila.unfinished_tasks and time.time() < limite:
+            time.sleep(0.01)
+
+    # ---------------- Escrita ----------------
+
+    @staticmethod
+    def _particao(ts):
+        return "consultas_" + datetime.fromtimestamp(ts).strftime("%Y%m%d")
+
+    def _garantir_particao(self, conn, nome):
+        if nome in self._particoes:
+            return
+        conn.execute(f"""CREATE TABLE IF NOT EXISTS {nome} (
+            ts REAL, cliente TEXT, dominio TEXT, qtype TEXT, fonte TEXT, latencia_ms REAL)""")
+        self._particoes.add(nome)
+
+    def _gravar_lote(self, conn, lote):
+        # Consultas brutas, separadas por partição diária
+        por_particao = {}
+        for registro in lote:
+            por_particao.setdefault(self._particao(registro[0]), []).append(registro)
+        for nome, registros in por_particao.items():
+            self._garantir_particao(conn, nome)
+            conn.executemany(f"INSERT INTO {nome} VALUES (?, ?, ?, ?, ?, ?)", registros)
+
+        # Agregações incrementais: soma o lote em memória e faz um único upsert por chave
+        for gran, segundos in GRANULARIDADES.items():
+            dominios, bloqueados, clientes, fontes = Counter(), Counter(), Counter(), Counter()
+            for ts, cliente, dominio, _, fonte, _ in lote:
+                periodo = int(ts // segundos) * segundos
+                dominios[(periodo, dominio)] += 1
+                if fonte == "blocklist":
+                    bloqueados[(periodo, dominio)] += 1
+                if cliente:
+                    clientes[(periodo, cliente)] += 1
+                fontes[(periodo, fonte)] += 1
+
+            conn.executemany(f"""INSERT INTO agg_dominio_{gran} VALUES (?, ?, ?, ?)
+                ON CONFLICT (periodo, dominio) DO UPDATE SET
+                total = total + excluded.total, bloqueados = bloqueados + excluded.bloqueados""",
+                [(p, d, n, bloqueados[(p, d)]) for (p, d), n in dominios.items()])
+            conn.executemany(f"""INSERT INTO agg_cliente_{gran} VALUES (?, ?, ?)
+                ON CONFLICT (periodo, cliente) DO UPDATE SET total = total + excluded.total""",
+                [(p, c, n) for (p, c), n in clientes.items()])
+            conn.executemany(f"""INSERT INTO agg_fonte_{gran} VALUES (?, ?, ?)
+                ON CONFLICT (periodo, fonte) DO UPDATE SET total = total + excluded.total""",
+                [(p, f, n) for (p, f), n in fontes.items()])
+
+    def _aplicar_retencao(self, conn):
+        """
+        Remove partições e agregações mais antigas que a retenção configurada.
+        """
+        limite = time.time() - self.retencao_dias * 86400
+        particao_limite = self._particao(limite)
+        tabelas = [r[0] for r in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'consultas_%'")]
+        for nome in tabelas:
+            if nome < particao_limite:
+                conn.execute(f"DROP TABLE {nome}")
+                self._particoes.discard(nome)
+        for gran in GRANULARIDADES:
+            for dim in ("dominio", "cliente", "fonte"):
+                conn.execute(f"DELETE FROM agg_{dim}_{gran} WHERE periodo < ?", (limite,))
+
+    def _loop_escrita(self):
+        conn = self._conectar()
+        ultima_retencao = 0
+
+        while self._rodando or not self._fila.empty():
+            try:
+                lote = [self._fila.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+
+            while len(lote) < self.lote_max:
+                try:
+                    lote.append(self._fila.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                with conn:
+                    self._gravar_lote(conn, lote)
+                    if time.time() - ultima_retencao > 3600:
+                        self._aplicar_retencao(conn)
+                        ultima_retencao = time.time()
+            except Exception as e:
+                print(f"Erro ao gravar histórico de consultas: {e}")
+            finally:
+                for _ in lote:
+                    self._fila.task_done()
+
+        conn.close()
+
+    # ---------------- Consultas ----------------
+
+    def ultimas(self, quantidade = 20):
+        """
+        Retorna as últimas consultas registradas (mais recentes primeiro).
+        """
+        conn = self._leitura()
+        agora = time.time()
+        resultado = []
+        # Percorre as partições do dia atual para trás até completar a quantidade pedida
+        for dias in range(self.retencao_dias + 1):
+            nome = self._particao(agora - dias * 86400)
+            try:
+                linhas = conn.execute(
+                    f"SELECT ts, cliente, dominio, qtype, fonte, latencia_ms FROM {nome} "
+                    f"ORDER BY rowid DESC LIMIT ?", (quantidade - len(resultado),)).fetchall()
+            except sqlite3.OperationalError:
+                continue  # Partição inexistente (nenhuma consulta nesse dia)
+            for ts, cliente, dominio, qtype, fonte, latencia_ms in linhas:
+                resultado.append({
+                    'domain': dominio,
+                    'qtype': qtype,
+                    'source': fonte,
+                    'client': cliente,
+                    'elapsed_time': f"{latencia_ms / 1000:.2f}s" if latencia_ms is not None else None,
+                    'timestamp': datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S"),
+                })
+            if len(resultado) >= quantidade:
+                break
+        return resultado
+
+    def _intervalo(self, inicio, fim):
+        fim = fim or time.time()
+        inicio = inicio or fim - 3600
+        gran = "hora" if fim - inicio >= INTERVALO_USAR_HORA else "minuto"
+        segundos = GRANULARIDADES[gran]
+        return int(inicio // segundos) * segundos, fim, gran
+
+    def top_dominios(self, inicio = None, fim = None, quantidade = 10):
+        """
+        Domínios mais consultados no intervalo [inicio, fim] (timestamps; padrão: última hora).
+        """
+        inicio, fim, gran = self._intervalo(inicio, fim)
+        return self._leitura().execute(
+            f"SELECT dominio, SUM(total) AS n FROM agg_dominio_{gran} WHERE periodo BETWEEN ? AND ? "
+            f"GROUP BY dominio ORDER BY n DESC LIMIT ?", (inicio, fim, quantidade)).fetchall()
+
+    def top_bloqueados(self, inicio = None, fim = None, quantidade = 10):
+        """
+        Domínios bloqueados mais consultados no intervalo.
+        """
+        inicio, fim, gran = self._intervalo(inicio, fim)
+        return self._leitura().execute(
+            f"SELECT dominio, SUM(bloqueados) AS n FROM agg_dominio_{gran} "
+            f"WHERE periodo BETWEEN ? AND ? AND bloqueados > 0 "
+            f"GROUP BY dominio ORDER BY n DESC LIMIT ?", (inicio, fim, quantidade)).fetchall()
+
+    def qps_por_cliente(self, inicio = None, fim = None, quantidade = 10):
+        """
+        Clientes com mais consultas no intervalo e sua taxa média (consultas por segundo).
+        """
+        inicio, fim, gran = self._intervalo(inicio, fim)
+        duracao = max(fim - inicio, 1)
+        linhas = self._leitura().execute(
+            f"SELECT cliente, SUM(total) AS n FROM agg_cliente_{gran} WHERE periodo BETWEEN ? AND ? "
+            f"GROUP BY cliente ORDER BY n DESC LIMIT ?", (inicio, fim, quantidade)).fetchall()
+        return [(cliente, n, n / duracao) for cliente, n in linhas]
+
+    def totais_por_fonte(self, inicio = None, fim = None):
+        """
+        Quantidade de consultas por fonte (cache, upstream, blocklist...) no intervalo.
+        """
+        inicio, fim, gran = self._intervalo(inicio, fim)
+        return dict(self._leitura().execute(
+            f"SELECT fonte, SUM(total) FROM agg_fonte_{gran} WHERE periodo BETWEEN ? AND ? GROUP BY fonte",
+            (inicio, fim)).fetchall())
+
+    def taxa_acerto(self, inicio = None, fim = None, passo = 60):
+        """
+        Série temporal da taxa de acerto do cache: lista de (período, hits, total, taxa).
+        Acertos são as respostas de FONTES_ACERTO (cache, dados locais e cache dos pares); o total
+        considera todas as FONTES_RESPONDIDAS (acertos + upstream).
+        'passo' é o tamanho de cada ponto da série em segundos.
+        """
+        inicio, fim, gran = self._intervalo(inicio, fim)
+        passo = max(passo, GRANULARIDADES[gran])
+        acertos = ", ".join("?" * len(FONTES_ACERTO))
+        respondidas = ", ".join("?" * len(FONTES_RESPONDIDAS))
+        linhas = self._leitura().execute(
+            f"SELECT (periodo / ?) * ? AS p, SUM(CASE WHEN fonte IN ({acertos}) THEN total ELSE 0 END), SUM(total) "
+            f"FROM agg_fonte_{gran} WHERE periodo BETWEEN ? AND ? AND fonte IN ({respondidas}) "
+            f"GROUP BY p ORDER BY p",
+            (passo, passo, *FONTES_ACERTO, inicio, fim, *FONTES_RESPONDIDAS)).fetchall()
+        return [(p, hits, total, hits / total if total else 0.0) for p, hits, total in linhas]
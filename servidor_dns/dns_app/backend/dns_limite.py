@@ -0,0 +1,160 @@
+import time
+from collections import OrderedDict
+import ipaddress
+import threading
+
+from . import config
+
+# Ações para uma consulta acima do limite
+TRUNCAR = "TC"        # responde vazio com a flag TC (o cliente legítimo repete via TCP)
+DESCARTAR = "DROP"    # não responde
+
+
+class LimitadorTaxa:
+    def __init__(self, qps_cliente = None, rajada_cliente = None, qps_subrede = None, rajada_subrede = None,
+                 rrl_qps = None, rrl_rajada = None, slip = None, prefixo_ipv4 = None, prefixo_ipv6 = None,
+                 isentos = None, max_entradas = None, ativo = None):
+        """
+        Limita a taxa de consultas com baldes de fichas (token buckets).
+
+        - Por IP do cliente e por sub-rede (/24 no IPv4, /56 no IPv6 por padrão).
+        - RRL (response rate limiting): respostas iguais (mesmo nome e tipo) para a mesma
+          sub-rede, o padrão de um ataque de amplificação com IP de origem falsificado.
+
+        Cada balde ocupa uma lista [fichas, instante]; as tabelas têm no máximo 'max_entradas'
+        baldes e, quando cheias, descartam o usado há mais tempo (LRU): um balde em uso
+        contínuo, como o de quem está sendo limitado, não é recriado cheio. Acima do limite, uma em cada 'slip'
+        consultas recebe uma resposta truncada (TC) e as demais são descartadas (slip=0 descarta todas).
+        """
+        self.ativo = config.LIMITE_ATIVO if ativo is None else ativo
+        self.qps_cliente = config.LIMITE_QPS_CLIENTE if qps_cliente is None else qps_cliente
+        self.rajada_cliente = config.LIMITE_RAJADA_CLIENTE if rajada_cliente is None else rajada_cliente
+        self.qps_subrede = config.LIMITE_QPS_SUBREDE if qps_subrede is None else qps_subrede
+        self.rajada_subrede = config.LIMITE_RAJADA_SUBREDE if rajada_subrede is None else rajada_subrede
+        self.rrl_qps = config.LIMITE_RRL_QPS if rrl_qps is None else rrl_qps
+        self.rrl_rajada = config.LIMITE_RRL_RAJADA if rrl_rajada is None else rrl_rajada
+        self.slip = config.LIMITE_SLIP if slip is None else slip
+        self.prefixo_ipv4 = config.LIMITE_PREFIXO_IPV4 if prefixo_ipv4 is None else prefixo_ipv4
+        self.prefixo_ipv6 = config.LIMITE_PREFIXO_IPV6 if prefixo_ipv6 is None else prefixo_ipv6
+        self.max_entradas = config.LIMITE_MAX_ENTRADAS if max_entradas is None else max_entradas
+        self.isentos = [ipaddress.ip_network(rede, strict=False)
+                        for rede in (config.LIMITE_ISENTOS if isentos is None else isentos)]
+
+        self._clientes = OrderedDict()
+        self._subredes = OrderedDict()
+        self._respostas = OrderedDict()
+        self._ips = {}      # IP -> (isento, sub-rede), evita converter o endereço a cada pacote
+        self._lock = threading.Lock()
+
+        # Métricas
+        self.permitidas = 0
+        self.limitadas_cliente = 0
+        self.limitadas_subrede = 0
+        self.limitadas_rrl = 0
+        self.truncadas = 0
+        self.descartadas = 0
+        self._limitados_por_cliente = {}
+        self._contador_slip = 0
+
+    def configurar(self):
+        """
+        Passa a usar os limites atuais do config (recarga da configuração). Os baldes são mantidos.
+        """
+        with self._lock:
+            self.ativo = config.LIMITE_ATIVO
+            self.qps_cliente, self.rajada_cliente = config.LIMITE_QPS_CLIENTE, config.LIMITE_RAJADA_CLIENTE
+            self.qps_subrede, self.rajada_subrede = config.LIMITE_QPS_SUBREDE, config.LIMITE_RAJADA_SUBREDE
+            self.rrl_qps, self.rrl_rajada = config.LIMITE_RRL_QPS, config.LIMITE_RRL_RAJADA
+            self.slip = config.LIMITE_SLIP
+            self.prefixo_ipv4, self.prefixo_ipv6 = config.LIMITE_PREFIXO_IPV4, config.LIMITE_PREFIXO_IPV6
+            self.max_entradas = config.LIMITE_MAX_ENTRADAS
+            self.isentos = [ipaddress.ip_network(rede, strict=False) for rede in config.LIMITE_ISENTOS]
+            self._ips = {}   # Isenções e prefixos podem ter mudado
+
+    def _info_ip(self, ip):
+        """
+        Retorna (isento, sub-rede) do IP. Chamado com o lock adquirido.
+        """
+        info = self._ips.get(ip)
+        if info is None:
+            try:
+                endereco = ipaddress.ip_address(ip)
+                isento = any(endereco in rede for rede in self.isentos)
+                prefixo = self.prefixo_ipv4 if endereco.version == 4 else self.prefixo_ipv6
+                subrede = str(ipaddress.ip_network(f"{ip}/{prefixo}", strict=False))
+            except ValueError:
+                isento, subrede = False, ip
+            if len(self._ips) >= self.max_entradas:
+                self._ips.clear()
+            info = self._ips[ip] = (isento, subrede)
+        return info
+
+    def _consumir(self, tabela, chave, taxa, rajada, agora):
+        """
+        Retira uma ficha do balde 'chave'. Retorna False se o balde estiver vazio.
+        """
+        balde = tabela.get(chave)
+        if balde is None:
+            if len(tabela) >= self.max_entradas:
+                tabela.popitem(last=False)   # Remove o balde usado há mais tempo
+            tabela[chave] = [rajada - 1.0, agora]
+            return True
+        tabela.move_to_end(chave)
+
+        fichas = min(rajada, balde[0] + (agora - balde[1]) * taxa)
+        balde[1] = agora
+        if fichas >= 1.0:
+            balde[0] = fichas - 1.0
+            return True
+        balde[0] = fichas
+        return False
+
+    def avaliar(self, ip, dominio, qtype, agora = None):
+        """
+        Contabiliza uma consulta. Retorna None se ela deve ser atendida,
+        ou TRUNCAR / DESCARTAR se o cliente passou do limite.
+        """
+        if not self.ativo:
+            return None
+
+        agora = time.monotonic() if agora is None else agora
+        with self._lock:
+            isento, subrede = self._info_ip(ip)
+            if isento:
+                return None
+            if not self._consumir(self._clientes, ip, self.qps_cliente, self.rajada_cliente, agora):
+                self.limitadas_cliente += 1
+            elif not self._consumir(self._subredes, subrede, self.qps_subrede, self.rajada_subrede, agora):
+                self.limitadas_subrede += 1
+            elif not self._consumir(self._respostas, (subrede, dominio, qtype), self.rrl_qps, self.rrl_rajada, agora):
+                self.limitadas_rrl += 1
+            else:
+                self.permitidas += 1
+                return None
+
+            if len(self._limitados_por_cliente) < self.max_entradas or ip in self._limitados_por_cliente:
+                self._limitados_por_cliente[ip] = self._limitados_por_cliente.get(ip, 0) + 1
+
+            self._contador_slip += 1
+            if self.slip and self._contador_slip % self.slip == 0:
+                self.truncadas += 1
+                return TRUNCAR
+            self.descartadas += 1
+            return DESCARTAR
+
+    def estatisticas(self, quantidade = 10):
+        """
+        Retorna os contadores do limitador e os clientes mais limitados.
+        """
+        with self._lock:
+            mais_limitados = sorted(self._limitados_por_cliente.items(), key=lambda item: item[1], reverse=True)
+            return {
+                "permitidas": self.permitidas,
+                "limitadas_cliente": self.limitadas_cliente,
+                "limitadas_subrede": self.limitadas_subrede,
+                "limitadas_rrl": self.limitadas_rrl,
+                "truncadas": self.truncadas,
+                "descartadas": self.descartadas,
+                "baldes": len(self._clientes) + len(self._subredes) + len(self._respostas),
+                "mais_limitados": mais_limitados[:quantidade],
+            }
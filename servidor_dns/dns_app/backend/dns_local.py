@@ -0,0 +1,286 @@
+import os
+import time
+import ipaddress
+import threading
+
+from dnslib import RR, QTYPE, RCODE, PTR, A, AAAA
+
+from .dns_functions import empacotar_rr, empacotar_nome, empacotar_rdata
+from . import config
+
+# Limite de CNAMEs seguidos dentro dos dados locais
+MAX_CADEIA_CNAME = 8
+
+
+class RespostaLocal:
+
+    """
+    Resposta pronta para uma consulta respondida pelos dados locais.
+    As seções já estão empacotadas e basta copiá-las após a pergunta.
+    """
+
+    __slots__ = ("rcode", "respostas", "ancount", "autoridade", "nscount")
+
+    def __init__(self, rcode, respostas = b"", ancount = 0, autoridade = b"", nscount = 0):
+        self.rcode = rcode
+        self.respostas = respostas
+        self.ancount = ancount
+        self.autoridade = autoridade
+        self.nscount = nscount
+
+
+class _Indice:
+
+    """
+    Índice imutável com os dados locais. Uma recarga constrói um índice novo e o troca por inteiro.
+    """
+
+    def __init__(self):
+        # (nome, qtype) -> [(rr com ponteiro para a pergunta, rr com o nome completo)]
+        self.registros = {}
+        # sufixo do curinga ("lab.local.") -> {qtype: [rr com ponteiro para a pergunta]}
+        self.curingas = {}
+        # nomes que existem (para responder NODATA em vez de NXDOMAIN)
+        self.nomes = set()
+        # origem da zona -> registro SOA empacotado (autoridade das respostas negativas)
+        self.zonas = {}
+
+
+class ZonasLocais:
+    def __init__(self, hosts = None, zonas = None, ttl_hosts = None, intervalo_recarga = None):
+        """
+        Inicializa os dados locais (arquivos hosts e arquivos de zona simples).
+
+        Os registros são indexados por nome e tipo com as respostas pré-empacotadas,
+        então uma consulta local custa o mesmo que um cache hit. Curingas ("*.lab.local")
+        são suportados, e os arquivos são recarregados quando modificados.
+        """
+        self.arquivos_hosts = list(config.LOCAL_HOSTS_ARQUIVOS if hosts is None else hosts)
+        self.arquivos_zonas = list(config.LOCAL_ZONAS_ARQUIVOS if zonas is None else zonas)
+        self.ttl_hosts = config.LOCAL_TTL_HOSTS if ttl_hosts is None else ttl_hosts
+        self.intervalo_recarga = config.LOCAL_INTERVALO_RECARGA if intervalo_recarga is None else intervalo_recarga
+
+        self._indice = _Indice()
+        self._mtimes = {}
+        self._proxima_verificacao = 0.0
+        self._recarregando = threading.Lock()
+
+        self.recarregar()
+
+    def configurar(self):
+        """
+        Passa a usar os arquivos e o TTL atuais do config e recarrega os dados (recarga da configuração).
+        """
+        self.arquivos_hosts = list(config.LOCAL_HOSTS_ARQUIVOS)
+        self.arquivos_zonas = list(config.LOCAL_ZONAS_ARQUIVOS)
+        self.ttl_hosts = config.LOCAL_TTL_HOSTS
+        self.intervalo_recarga = config.LOCAL_INTERVALO_RECARGA
+        self.recarregar()
+
+    @property
+    def vazio(self):
+        return not self.arquivos_hosts and not self.arquivos_zonas
+
+    # ---------------- Carga ----------------
+
+    def _ler_mtimes(self):
+        mtimes = {}
+        for caminho in self.arquivos_hosts + self.arquivos_zonas:
+            try:
+                mtimes[caminho] = os.path.getmtime(caminho)
+            except OSError:
+                mtimes[caminho] = None
+        return mtimes
+
+    def recarregar(self):
+        """
+        Reconstrói o índice a partir dos arquivos e o troca de forma atômica.
+        """
+        with self._recarregando:
+            mtimes = self._ler_mtimes()
+            indice = _Indice()
+            total = 0
+
+            for caminho in self.arquivos_zonas:
+                try:
+                    total += self._carregar_zona(indice, caminho)
+                except Exception as e:
+                    print(f"Erro ao carregar zona local {caminho}: {e}")
+
+            for caminho in self.arquivos_hosts:
+                try:
+                    total += self._carregar_hosts(indice, caminho)
+                except Exception as e:
+                    print(f"Erro ao carregar hosts local {caminho}: {e}")
+
+            self._indice = indice
+            self._mtimes = mtimes
+
+        if not self.vazio:
+            print(f"Dados locais carregados: {total} registros, {len(indice.zonas)} zonas.")
+
+    def _adicionar(self, indice, nome, rtype, ttl, rdata):
+        nome = nome.lower()
+        rdata_wire = empacotar_rdata(rdata)
+        ponteiro = empacotar_rr(b"\xc0\x0c", rtype, ttl, rdata_wire)
+
+        if nome.startswith("*."):
+            sufixo = nome[2:]
+            indice.curingas.setdefault(sufixo, {}).setdefault(rtype, []).append(ponteiro)
+            return
+
+        completo = empacotar_rr(empacotar_nome(nome), rtype, ttl, rdata_wire)
+        indice.registros.setdefault((nome, rtype), []).append((ponteiro, completo))
+        indice.nomes.add(nome)
+
+    def _carregar_zona(self, indice, caminho):
+        with open(caminho, "r", encoding="utf-8") as f:
+            registros = list(RR.fromZone(f.read()))
+
+        for rr in registros:
+            nome = str(rr.rname)
+            self._adicionar(indice, nome, rr.rtype, rr.ttl, rr.rdata)
+            if rr.rtype == QTYPE.SOA:
+                # A zona passa a ser autoritativa: nomes ausentes recebem NXDOMAIN com o SOA
+                indice.zonas[nome.lower()] = empacotar_rr(empacotar_nome(nome), QTYPE.SOA, rr.ttl,
+                                                          empacotar_rdata(rr.rdata))
+        return len(registros)
+
+    def _carregar_hosts(self, indice, caminho):
+        total = 0
+        with open(caminho, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.split("#", 1)[0].strip()
+                if not line:
+                    continue
+                partes = line.split()
+                if len(partes) < 2:
+                    continue
+                try:
+                    ip = ipaddress.ip_address(partes[0])
+                except ValueError:
+                    continue
+
+                if ip.version == 4:
+                    rtype, rdata = QTYPE.A, A(str(ip))
+                else:
+                    rtype, rdata = QTYPE.AAAA, AAAA(str(ip))
+
+                for nome in partes[1:]:
+                    nome = nome.rstrip(".") + "."
+                    self._adicionar(indice, nome, rtype, self.ttl_hosts, rdata)
+                    total += 1
+
+                # Registro reverso (PTR) para o primeiro nome da linha
+                if not partes[1].startswith("*"):
+                    self._adicionar(indice, ip.reverse_pointer + ".", QTYPE.PTR, self.ttl_hosts,
+                                    PTR(partes[1].rstrip(".") + "."))
+        return total
+
+    def _verificar_recarga(self):
+        """
+        Verifica (no máximo a cada 'intervalo_recarga' segundos) se algum arquivo mudou
+        e, nesse caso, recarrega os dados em segundo plano.
+        """
+        agora = time.monotonic()
+        if agora < self._proxima_verificacao:
+            return
+        self._proxima_verificacao = agora + self.intervalo_recarga
+
+        if self._ler_mtimes() != self._mtimes and not self._recarregando.locked():
+            print("Arquivos de dados locais modificados, recarregando...")
+            threading.Thread(target=self.recarregar, daemon=True).start()
+
+    # ---------------- Consulta ----------------
+
+    def _zona_de(self, indice, nome):
+        """
+        Retorna a origem da zona local mais específica que contém o nome (ou None).
+        """
+        while True:
+            if nome in indice.zonas:
+                return nome
+            if nome == ".":
+                return None
+            _, _, nome = nome.partition(".")
+            nome = nome or "."
+
+    def _curinga(self, indice, nome, qtype):
+        """
+        Procura um curinga que cubra o nome. Retorna (registros, existe) onde 'existe'
+        indica que algum curinga cobre o nome, mesmo sem registros do tipo pedido.
+        """
+        _, _, sufixo = nome.partition(".")
+        while sufixo:
+            tipos = indice.curingas.get(sufixo)
+            if tipos is not None:
+                return tipos.get(qtype) or tipos.get(QTYPE.CNAME), True
+            _, _, sufixo = sufixo.partition(".")
+        return None, False
+
+    def buscar(self, dominio, qtype):
+        """
+        Procura a resposta local para (dominio, qtype). 'dominio' deve estar em minúsculas
+        e terminar com ponto. Retorna uma RespostaLocal ou None se o nome não é local.
+        """
+        if self.intervalo_recarga:
+            self._verificar_recarga()
+
+        indice = self._indice
+        registros = indice.registros.get((dominio, qtype))
+        if registros is not None:
+            return RespostaLocal(RCODE.NOERROR, b"".join(r[0] for r in registros), len(registros))
+
+        # CNAME local: devolve a cadeia e os registros do destino, se também forem locais
+        if qtype != QTYPE.CNAME and (dominio, QTYPE.CNAME) in indice.registros:
+            partes, nome, ponteiro = [], dominio, True
+            for _ in range(MAX_CADEIA_CNAME):
+                cname = indice.registros.get((nome, QTYPE.CNAME))
+                if cname is None:
+                    break
+                partes.append(cname[0][0] if ponteiro else cname[0][1])
+                ponteiro = False
+                nome = _destino_cname(cname[0][1])
+                destino = indice.registros.get((nome, qtype))
+                if destino is not None:
+                    partes.extend(r[1] for r in destino)
+                    break
+            return RespostaLocal(RCODE.NOERROR, b"".join(partes), len(partes))
+
+        if dominio in indice.nomes:
+            return self._negativa(indice, dominio, RCODE.NOERROR)  # NODATA
+
+        # Curingas só valem para nomes que não existem explicitamente
+        if indice.curingas:
+            curinga, existe = self._curinga(indice, dominio, qtype)
+            if curinga:
+                return RespostaLocal(RCODE.NOERROR, b"".join(curinga), len(curinga))
+            if existe:
+                return self._negativa(indice, dominio, RCODE.NOERROR)
+
+        if indice.zonas and self._zona_de(indice, dominio) is not None:
+            return self._negativa(indice, dominio, RCODE.NXDOMAIN)
+
+        return None
+
+    def _negativa(self, indice, dominio, rcode):
+        zona = self._zona_de(indice, dominio) if indice.zonas else None
+        if zona is None:
+            return RespostaLocal(rcode)
+        return RespostaLocal(rcode, autoridade=indice.zonas[zona], nscount=1)
+
+
+def _destino_cname(rr_completo):
+    """
+    Extrai o nome de destino de um registro CNAME empacotado sem compressão.
+    """
+    pos = 0
+    while rr_completo[pos] != 0:   # Pula o nome do dono
+        pos += 1 + rr_completo[pos]
+    pos += 1 + 10                   # tipo, classe, TTL e tamanho do rdata
+    rotulos = []
+    while rr_completo[pos] != 0:
+        n = rr_completo[pos]
+        rotulos.append(rr_completo[pos + 1:pos + 1 + n].decode("ascii").lower())
+        pos += 1 + n
+    return ".".join(rotulos) + "."
@@ -0,0 +1,223 @@
+import os
+import sys
+import json
+import time
+import queue
+import random
+import atexit
+import threading
+
+from . import config
+
+# Níveis de log, do mais detalhado ao mais grave
+NIVEIS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+
+# Valor padrão dos parâmetros do QueryLog: usar a configuração LOG_* (relida a cada configurar())
+_CONFIG = object()
+
+
+class QueryLog:
+    def __init__(self, arquivo = _CONFIG, nivel = _CONFIG, amostragem = _CONFIG, fila_max = _CONFIG,
+                 lote_max = _CONFIG, rotacao_bytes = _CONFIG, arquivos_mantidos = _CONFIG):
+        """
+        Inicializa o log de consultas assíncrono.
+
+        O servidor apenas coloca registros compactos em uma fila limitada (sem bloquear);
+        uma thread em segundo plano os escreve em lotes como NDJSON, com rotação por tamanho.
+        Se a thread de escrita não acompanhar, os registros excedentes são descartados e contados.
+
+        Os parâmetros omitidos vêm de LOG_* no config e são relidos por configurar() (recarga).
+        A thread de escrita só é criada no primeiro registro: importar o módulo (ex: no painel
+        web) não abre o arquivo nem inicia threads.
+        """
+        self._parametros = {nome: valor for nome, valor in (
+            ("arquivo", arquivo), ("nivel", nivel), ("amostragem", amostragem), ("fila_max", fila_max),
+            ("lote_max", lote_max), ("rotacao_bytes", rotacao_bytes), ("arquivos_mantidos", arquivos_mantidos),
+        ) if valor is not _CONFIG}
+
+        self._fila = queue.Queue()   # O limite (fila_max) é conferido em registrar()
+        self._random = random.Random()
+        self._lock = threading.Lock()
+
+        # Contadores (apenas informativos, podem perder incrementos sob concorrência extrema)
+        self.registrados = 0
+        self.descartados = 0
+        self.escritos = 0
+
+        self._saida = None
+        self._tamanho_atual = 0
+        self._reabrir = False
+        self._rodando = False
+        self._fechado = False
+        self._thread = None
+
+        self.arquivo = None
+        self.configurar()
+
+    def configurar(self):
+        """
+        Aplica as configurações LOG_* atuais (recarga): nível, amostragem, limites e arquivo.
+        Com outro arquivo, a thread de escrita passa a usá-lo a partir do próximo lote.
+        """
+        valores = {nome: self._parametros.get(nome, getattr(config, f"LOG_{nome.upper()}"))
+                   for nome in ("arquivo", "nivel", "amostragem", "fila_max", "lote_max",
+                                "rotacao_bytes", "arquivos_mantidos")}
+        self.nivel_minimo = NIVEIS[valores["nivel"]]
+        # Amostragem por nível: probabilidade de manter cada registro
+        self.amostragem = {NIVEIS[n]: p for n, p in valores["amostragem"].items()}
+        self.fila_max = valores["fila_max"]
+        self.lote_max = valores["lote_max"]
+        self.rotacao_bytes = valores["rotacao_bytes"]
+        self.arquivos_mantidos = valores["arquivos_mantidos"]
+        if valores["arquivo"] != self.arquivo:
+            self.arquivo = valores["arquivo"]
+            self._reabrir = self._saida is not None
+
+    def _iniciar(self):
+        """
+        Cria a thread de escrita (no primeiro registro).
+        """
+        with self._lock:
+            if self._thread is not None or self._fechado:
+                return
+            self._rodando = True
+            self._thread = threading.Thread(target=self._loop_escrita, daemon=True)
+            self._thread.start()
+
+        # Escreve o que restar na fila ao sair do programa
+        atexit.register(self.fechar)
+
+    def ativo(self, nivel):
+        """
+        Indica se registros do nível informado serão mantidos (evita montar registros à toa).
+        """
+        return NIVEIS[nivel] >= self.nivel_minimo
+
+    def registrar(self, nivel, evento, **campos):
+        """
+        Enfileira um registro sem bloquear. Retorna False se ele foi filtrado ou descartado.
+        """
+        nivel_num = NIVEIS[nivel]
+        if nivel_num < self.nivel_minimo:
+            return False
+
+        proporcao = self.amostragem.get(nivel_num, 1.0)
+        if proporcao < 1.0 and self._random.random() >= proporcao:
+            return False
+
+        if self._thread is None:
+            self._iniciar()
+        if self._fila.qsize() >= self.fila_max:
+            self.descartados += 1
+            return False
+        self._fila.put_nowait((time.time(), nivel, evento, campos))
+
+        self.registrados += 1
+        return True
+
+    def estatisticas(self):
+        """
+        Retorna os contadores do log de consultas.
+        """
+        return {
+            "registrados": self.registrados,
+            "descartados": self.descartados,
+            "escritos": self.escritos,
+            "fila": self._fila.qsize(),
+        }
+
+    def fechar(self):
+        """
+        Encerra a thread de escrita depois de esvaziar a fila.
+        """
+        with self._lock:
+            self._fechado = True
+            if not self._rodando:
+                return
+            self._rodando = False
+        self._thread.join(timeout=5)
+
+    def _formatar(self, registro):
+        ts, nivel, evento, campos = registro
+        if self.arquivo is None:
+            # No terminal usamos o formato legível de antes: [EVENTO] campo=valor ...
+            detalhes = " ".join(f"{k}={v}" for k, v in campos.items())
+            return f"[{evento}] {detalhes}\n"
+        linha = {"ts": round(ts, 6), "nivel": nivel, "evento": evento}
+        linha.update(campos)
+        return json.dumps(linha, ensure_ascii=False, default=str) + "\n"
+
+    def _abrir(self):
+        if self.arquivo is None:
+            self._saida = sys.stdout
+            return
+        diretorio = os.path.dirname(self.arquivo)
+        if diretorio and not os.path.exists(diretorio):
+            os.makedirs(diretorio)
+        self._saida = open(self.arquivo, "a", encoding="utf-8")
+        self._tamanho_atual = self._saida.tell()
+
+    def _rotacionar(self):
+        """
+        Renomeia consultas.ndjson -> consultas.ndjson.1 -> ... e abre um arquivo novo.
+        """
+        self._saida.close()
+        for i in range(self.arquivos_mantidos - 1, 0, -1):
+            origem = f"{self.arquivo}.{i}"
+            if os.path.exists(origem):
+                os.replace(origem, f"{self.arquivo}.{i + 1}")
+        if self.arquivos_mantidos > 0:
+            os.replace(self.arquivo, f"{self.arquivo}.1")
+        else:
+            os.remove(self.arquivo)
+        self._abrir()
+
+    def _loop_escrita(self):
+        descartes_reportados = 0
+
+        while self._rodando or not self._fila.empty():
+            try:
+                lote = [self._fila.get(timeout=0.5)]
+            except queue.Empty:
+                continue
+
+            # Junta o que já estiver na fila para escrever tudo de uma vez
+            while len(lote) < self.lote_max:
+                try:
+                    lote.append(self._fila.get_nowait())
+                except queue.Empty:
+                    break
+
+            # Registra no próprio log quando houve descartes desde o último lote
+            if self.descartados != descartes_reportados:
+                lote.append((time.time(), "WARNING", "LOG DESCARTADOS",
+                             {"total": self.descartados, "novos": self.descartados - descartes_reportados}))
+                descartes_reportados = self.descartados
+
+            try:
+                if self._reabrir:   # O arquivo mudou numa recarga
+                    self._reabrir = False
+                    if self._saida is not None and self._saida is not sys.stdout:
+                        self._saida.close()
+                    self._saida = None
+                if self._saida is None:
+                    self._abrir()
+                texto = "".join(self._formatar(r) for r in lote)
+                self._saida.write(texto)
+                self._saida.flush()
+                self.escritos += len(lote)
+
+                if self.arquivo is not None:
+                    self._tamanho_atual += len(texto.encode("utf-8"))
+                    if self._tamanho_atual >= self.rotacao_bytes:
+                        self._rotacionar()
+            except Exception as e:
+                print(f"Erro ao escrever log de consultas: {e}")
+
+        if self._saida is not None and self._saida is not sys.stdout:
+            self._saida.close()
+
+
+# Instância compartilhada pelo servidor DNS (a thread de escrita começa no primeiro registro)
+query_log = QueryLog()
@@ -0,0 +1,276 @@
+import time
+import random
+import socket
+import struct
+import hashlib
+import functools
+import threading
+from bisect import bisect
+
+from .dns_functions import (query_upstream, localizar_pergunta, montar_resposta, empacotar_registros,
+                            empacotar_nome, parse_response, nome_tipo)
+from .dns_pool import PoolTrabalhadores
+from .dns_log import query_log
+from . import config
+
+# Bit Z do cabeçalho (reservado no DNS), usado só na porta de pares: numa consulta, indica que quem
+# pergunta aceita o aviso "resolvendo"; numa resposta (com SERVFAIL), é esse aviso provisório
+_RESOLVENDO = 0x40
+
+
+def _hash(texto):
+    return int.from_bytes(hashlib.md5(texto.encode()).digest()[:8], "big")
+
+
+def _endereco(par):
+    host, _, porta = par.rpartition(":")
+    return host, int(porta)
+
+
+class CachePares:
+    def __init__(self, cache, pares = None, local = None):
+        """
+        Cache cooperativo entre vários servidores DNS (nós).
+
+        Os nós ficam num anel de hash consistente (com PARES_REPLICAS_VIRTUAIS posições por nó) e
+        cada nome tem um nó dono. Numa falha do cache local, a consulta é enviada ao dono (DNS sobre
+        UDP, na porta de pares) antes de ir ao upstream; o dono responde pelo próprio cache ou
+        resolve no upstream e guarda a resposta. Assim cada nome sai para o upstream por um só nó.
+        Numa falha do próprio cache o dono responde na hora um aviso provisório ("resolvendo"), e
+        quem perguntou espera a resposta final por até PARES_ESPERA_RESOLUCAO_MS. Só um dono que
+        não dá sinal nenhum em PARES_TIMEOUT_MS fica de fora por PARES_PENALIDADE_S segundos; nos
+        dois casos a consulta vai ao upstream. Um nó que tem o anel desatualizado não causa laço:
+        quem atende um par nunca repassa a consulta a outro par.
+        """
+        self.cache = cache
+        self.local = None
+        self._pares_config = pares
+        self._local_config = local
+        self._lock = threading.Lock()
+        self._lock_porta = threading.Lock()   # Abertura e fechamento da porta de pares
+        self._anel = ([], [])        # (hashes ordenados, par de cada hash), trocados juntos
+        self._permitidos = set()     # IPs dos pares, únicos aceitos na porta de pares
+        self._indisponivel_ate = {}  # par -> instante até o qual não é consultado
+        self.nos = 0
+
+        self.socket = None
+        self.pool = None
+        self._servir = False   # iniciar() foi chamado: a porta acompanha PARES/PARES_LOCAL nas recargas
+
+        # Métricas de quem pergunta
+        self.consultas = 0
+        self.respondidas = 0
+        self.timeouts = 0
+        self.aguardadas = 0   # O dono avisou que estava resolvendo
+        self.lentas = 0       # ... e a resposta final não chegou a tempo (sem penalidade)
+        self.puladas = 0
+        # Métricas de quem atende
+        self.atendidas_cache = 0
+        self.atendidas_upstream = 0
+        self.recusadas = 0
+
+        self.configurar()
+
+    def configurar(self):
+        """
+        Monta o anel com PARES e PARES_LOCAL (recarga da configuração). Depois de iniciar(), a porta
+        de pares acompanha a configuração: é aberta quando o cache cooperativo passa a valer, fechada
+        quando ele é desativado e reaberta no novo endereço quando PARES_LOCAL muda.
+        """
+        local = config.PARES_LOCAL if self._local_config is None else self._local_config
+        pares = list(config.PARES if self._pares_config is None else self._pares_config)
+        if local and local not in pares:
+            pares.append(local)
+        anel = sorted((_hash(f"{par}#{i}"), par) for par in pares for i in range(config.PARES_REPLICAS_VIRTUAIS))
+        with self._lock:
+            self._anel = ([h for h, _ in anel], [par for _, par in anel])
+            self._permitidos = {_endereco(par)[0] for par in pares}
+            self.nos = len(set(pares))
+            mudou_local = local != self.local
+            self.local = local
+
+        if self._servir:
+            if mudou_local or not self.ativo:
+                self._fechar()
+            self._abrir()
+
+    @property
+    def ativo(self):
+        return bool(self.local) and self.nos > 1
+
+    def dono(self, dominio):
+        """
+        Retorna o nó dono do nome no anel (todos os tipos de um nome ficam no mesmo nó).
+        """
+        hashes, donos = self._anel
+        if not hashes:
+            return None
+        return donos[bisect(hashes, _hash(dominio)) % len(hashes)]
+
+    def consultar(self, dominio, qtype, transaction_id):
+        """
+        Pergunta ao dono do nome. Retorna o pacote de resposta (com o ID da consulta do cliente)
+        ou None se este nó é o dono, se o dono está fora ou se ele não respondeu a tempo.
+        """
+        if not self.ativo:
+            return None
+        par = self.dono(dominio)
+        if par is None or par == self.local:
+            return None
+        if self._indisponivel_ate.get(par, 0) > time.monotonic():
+            self.puladas += 1
+            return None
+
+        consulta_id = random.getrandbits(16)
+        nome, tipo_classe = empacotar_nome(dominio), struct.pack("!HH", qtype, 1)
+        pacote = struct.pack("!HHHHHH", consulta_id, _RESOLVENDO, 1, 0, 0, 0) + nome + tipo_classe
+        fim_pergunta = 12 + len(nome) + 4
+        self.consultas += 1
+
+        resolvendo = False
+        limite = time.monotonic() + config.PARES_TIMEOUT_MS / 1000
+        try:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                sock.connect(_endereco(par))   # Só datagramas do próprio par chegam ao socket
+                sock.send(pacote)
+                while True:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        raise socket.timeout()
+                    sock.settimeout(restante)
+                    resposta = sock.recv(65535)
+                    # Mesma ID, uma pergunta, e a pergunta é a enviada (nome sem diferença de maiúsculas)
+                    if (len(resposta) < fim_pergunta or resposta[:2] != pacote[:2] or resposta[4:6] != b"\x00\x01"
+                            or resposta[12:12 + len(nome)].lower() != nome
+                            or resposta[12 + len(nome):fim_pergunta] != tipo_classe):
+                        continue
+                    if resposta[3] & _RESOLVENDO:
+                        if not resolvendo:   # O dono está no ar e resolvendo: espera a resposta final
+                            resolvendo = True
+                            self.aguardadas += 1
+                            limite = time.monotonic() + config.PARES_ESPERA_RESOLUCAO_MS / 1000
+                        continue
+                    break
+        except OSError:   # Inclui o timeout e a porta fechada (ICMP)
+            if resolvendo:
+                self.lentas += 1
+                query_log.registrar("INFO", "PAR LENTO", par=par, dominio=dominio)
+                return None
+            self.timeouts += 1
+            self._indisponivel_ate[par] = time.monotonic() + config.PARES_PENALIDADE_S
+            query_log.registrar("WARNING", "PAR INDISPONIVEL", par=par, dominio=dominio)
+            return None
+
+        # SERVFAIL/REFUSED do par (ex: sobrecarga): tenta o upstream
+        if resposta[3] & 0x0F in (2, 5):
+            return None
+        self.respondidas += 1
+        return struct.pack("!H", int(transaction_id)) + resposta[2:]
+
+    def iniciar(self):
+        """
+        Abre a porta de pares (PARES_LOCAL) e passa a atender os outros nós. Com o cache cooperativo
+        desativado, a porta é aberta depois, pela recarga que o ativar. Retorna True se a porta abriu.
+        """
+        self._servir = True
+        return self._abrir()
+
+    def _abrir(self):
+        with self._lock_porta:
+            if self.socket is not None or not self.ativo:
+                return self.socket is not None
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            try:
+                sock.bind(_endereco(self.local))
+            except OSError as e:
+                sock.close()
+                print(f"Erro ao abrir a porta de pares {self.local}: {e}")
+                return False
+            self.socket = sock
+            self.pool = PoolTrabalhadores(functools.partial(self._atender, sock), sock, trabalhadores=config.PARES_TRABALHADORES)
+            threading.Thread(target=self._loop, args=(sock, self.pool), daemon=True).start()
+        print(f"Cache cooperativo: {self.local} num anel de {self.nos} nós")
+        return True
+
+    def _fechar(self):
+        with self._lock_porta:
+            sock, pool = self.socket, self.pool
+            self.socket = self.pool = None
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)   # Acorda o recvfrom do _loop, que só então solta a porta
+            except OSError:
+                pass
+            sock.close()
+        if pool is not None:
+            pool.parar()
+
+    def _loop(self, sock, pool):
+        while True:
+            try:
+                pacote, addr = sock.recvfrom(4096)
+            except OSError:
+                return
+            if addr is None:   # Porta fechada por _fechar()
+                return
+            if addr[0] not in self._permitidos:
+                self.recusadas += 1
+                continue
+            pool.enviar(pacote, addr)
+
+    def _atender(self, sock, pacote, addr):
+        """
+        Responde a consulta de um par pelo cache local ou, numa falha, pelo upstream.
+        """
+        _, dominio, qtype, fim_pergunta = localizar_pergunta(pacote)
+        if not dominio:
+            return
+        qtype_str = nome_tipo(qtype)
+
+        entrada = self.cache.get_resposta(dominio, qtype_str)
+        if entrada is not None and entrada["value"]:
+            secoes = entrada.get("pacote")
+            if secoes is None:
+                secoes = entrada["pacote"] = empacotar_registros(entrada["value"], dominio)
+            sock.sendto(montar_resposta(pacote, fim_pergunta, secoes[0], ancount=secoes[1],
+                                          nscount=secoes[2], arcount=secoes[3],
+                                          rcode=entrada.get("rcode", 0)), addr)
+            self.atendidas_cache += 1
+            return
+
+        if pacote[3] & _RESOLVENDO:
+            # Avisa na hora que o nome não está no cache, para quem perguntou não tomar a demora
+            # do upstream como falha deste nó
+            aviso = bytearray(montar_resposta(pacote, fim_pergunta, rcode=2))
+            aviso[3] |= _RESOLVENDO
+            sock.sendto(aviso, addr)
+        resposta = query_upstream(dominio, qtype, struct.unpack("!H", pacote[:2])[0])
+        if not resposta:
+            sock.sendto(montar_resposta(pacote, fim_pergunta, rcode=2), addr)
+            return
+        sock.sendto(resposta, addr)
+        self.atendidas_upstream += 1
+        registros, _ = parse_response(resposta)
+        self.cache.set_resposta(dominio, qtype_str, registros, rcode=resposta[3] & 0x0F)
+
+    def parar(self):
+        self._servir = False
+        self._fechar()
+
+    def estatisticas(self):
+        """
+        Retorna os contadores das consultas feitas aos pares e das atendidas para eles.
+        """
+        return {
+            "local": self.local,
+            "nos": self.nos,
+            "consultas": self.consultas,
+            "respondidas": self.respondidas,
+            "timeouts": self.timeouts,
+            "aguardadas": self.aguardadas,
+            "lentas": self.lentas,
+            "puladas": self.puladas,
+            "atendidas_cache": self.atendidas_cache,
+            "atendidas_upstream": self.atendidas_upstream,
+            "recusadas": self.recusadas,
+        }
@@ -0,0 +1,264 @@
+from collections import OrderedDict
+
+# Políticas de remoção do DNSCache. Cada política acompanha as chaves presentes no cache
+# (com o tamanho estimado em bytes) e indica qual delas remover quando o cache passa do limite.
+#
+# Interface comum:
+# - registrar(key): toda consulta ao cache, acerto ou não (alimenta o histórico de frequência)
+# - acessar(key):   a chave foi encontrada no cache
+# - inserir(key, tamanho): a chave foi adicionada ao cache
+# - remover(key):   a chave saiu do cache (remoção explícita, expiração ou despejo)
+# - vitima():       chave a despejar; pode reorganizar as filas internas antes de responder
+
+
+class PoliticaLRU:
+
+    """
+    Remove a entrada usada há mais tempo (comportamento original do DNSCache).
+    """
+
+    def __init__(self, capacidade_bytes):
+        self.capacidade_bytes = capacidade_bytes
+        self.fila = OrderedDict()
+
+    def registrar(self, key):
+        pass
+
+    def acessar(self, key):
+        self.fila.move_to_end(key)
+
+    def inserir(self, key, tamanho):
+        self.fila[key] = tamanho
+
+    def remover(self, key):
+        self.fila.pop(key, None)
+
+    def vitima(self):
+        return next(iter(self.fila), None)
+
+
+class SketchFrequencia:
+
+    """
+    Count-min sketch com contadores de 4 bits (0 a 15) que estima quantas vezes cada chave
+    foi consultada recentemente. A cada 'amostra' incrementos todos os contadores são
+    divididos por 2, para que a popularidade antiga perca peso com o tempo.
+    """
+
+    LINHAS = 4
+
+    def __init__(self, largura):
+        # Largura potência de 2 (até 2^16), para indexar cada linha com 16 bits do mesmo hash
+        self.largura = min(1 << max(largura - 1, 1).bit_length(), 1 << 16)
+        self.mascara = self.largura - 1
+        self.tabela = bytearray(self.largura * self.LINHAS)
+        self.amostra = 10 * self.largura
+        self.incrementos = 0
+
+    def _posicoes(self, key):
+        # Espalha o hash da chave (multiplicação de Fibonacci) e usa 16 bits por linha
+        h = (hash(key) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        largura, mascara = self.largura, self.mascara
+        return ((h & mascara), largura + ((h >> 16) & mascara),
+                2 * largura + ((h >> 32) & mascara), 3 * largura + ((h >> 48) & mascara))
+
+    def incrementar(self, key):
+        tabela = self.tabela
+        for pos in self._posicoes(key):
+            if tabela[pos] < 15:
+                tabela[pos] += 1
+
+        self.incrementos += 1
+        if self.incrementos >= self.amostra:
+            self.tabela = bytearray(c >> 1 for c in tabela)
+            self.incrementos //= 2
+
+    def frequencia(self, key):
+        tabela = self.tabela
+        a, b, c, d = self._posicoes(key)
+        return min(tabela[a], tabela[b], tabela[c], tabela[d])
+
+
+class _FilaLRU:
+
+    """
+    Fila LRU de chaves com o total de bytes ocupado por elas.
+    """
+
+    def __init__(self):
+        self.itens = OrderedDict()
+        self.bytes = 0
+
+    def __contains__(self, key):
+        return key in self.itens
+
+    def __len__(self):
+        return len(self.itens)
+
+    def adicionar(self, key, tamanho):
+        self.itens[key] = tamanho
+        self.bytes += tamanho
+
+    def tirar(self, key):
+        tamanho = self.itens.pop(key)
+        self.bytes -= tamanho
+        return tamanho
+
+    def mais_antiga(self):
+        return next(iter(self.itens), None)
+
+
+class PoliticaTinyLFU:
+
+    """
+    W-TinyLFU: entradas novas passam por uma pequena janela LRU; ao sair dela, a entrada
+    só é admitida na área principal se for mais frequente (segundo o sketch) do que a
+    entrada que seria despejada em seu lugar. Nomes consultados uma única vez (varreduras
+    de subdomínios aleatórios, por exemplo) não conseguem expulsar os nomes populares.
+
+    A área principal é uma LRU segmentada: 'provacao' recebe as entradas admitidas e
+    'protegida' as que foram acessadas de novo.
+    """
+
+    def __init__(self, capacidade_bytes, proporcao_janela = 0.01, proporcao_protegida = 0.8,
+                 tamanho_medio_entrada = 64):
+        self.capacidade_bytes = capacidade_bytes
+        self.max_janela = max(int(capacidade_bytes * proporcao_janela), 1)
+        self.max_principal = capacidade_bytes - self.max_janela
+        self.max_protegida = int(self.max_principal * proporcao_protegida)
+
+        self.janela = _FilaLRU()
+        self.provacao = _FilaLRU()
+        self.protegida = _FilaLRU()
+        self.sketch = SketchFrequencia(max(capacidade_bytes // tamanho_medio_entrada, 1024))
+
+    def registrar(self, key):
+        self.sketch.incrementar(key)
+
+    def acessar(self, key):
+        if key in self.janela:
+            self.janela.itens.move_to_end(key)
+        elif key in self.provacao:
+            # Segundo acesso na área principal: promove para a área protegida
+            self.protegida.adicionar(key, self.provacao.tirar(key))
+            while self.protegida.bytes > self.max_protegida and len(self.protegida) > 1:
+                antiga = self.protegida.mais_antiga()
+                self.provacao.adicionar(antiga, self.protegida.tirar(antiga))
+        elif key in self.protegida:
+            self.protegida.itens.move_to_end(key)
+
+    def inserir(self, key, tamanho):
+        self.janela.adicionar(key, tamanho)
+
+        # Enquanto houver espaço na área principal, a janela transborda sem disputa
+        while self.janela.bytes > self.max_janela:
+            candidata = self.janela.mais_antiga()
+            tamanho_candidata = self.janela.itens[candidata]
+            if self.provacao.bytes + self.protegida.bytes + tamanho_candidata > self.max_principal:
+                break
+            self.provacao.adicionar(candidata, self.janela.tirar(candidata))
+
+    def remover(self, key):
+        for fila in (self.janela, self.provacao, self.protegida):
+            if key in fila:
+                fila.tirar(key)
+                return
+
+    def vitima(self):
+        principal = self.provacao.mais_antiga() or self.protegida.mais_antiga()
+
+        if self.janela.bytes <= self.max_janela or principal is None:
+            return principal or self.janela.mais_antiga()
+
+        # A janela está cheia: a entrada mais antiga dela disputa a vaga com a vítima da área principal
+        candidata = self.janela.mais_antiga()
+        if self.sketch.frequencia(candidata) > self.sketch.frequencia(principal):
+            self.provacao.adicionar(candidata, self.janela.tirar(candidata))
+            return principal
+        return candidata
+
+
+class PoliticaARC:
+
+    """
+    ARC (Adaptive Replacement Cache): divide o cache entre entradas vistas uma vez (t1) e
+    entradas vistas mais vezes (t2), e guarda as chaves despejadas recentemente (b1, b2,
+    sem os valores). Um acerto nessas listas fantasmas ajusta o alvo 'p' do tamanho de t1,
+    adaptando o cache entre recência e frequência. Tamanhos e o alvo 'p' são em bytes.
+    """
+
+    def __init__(self, capacidade_bytes):
+        self.capacidade_bytes = capacidade_bytes
+        self.p = 0
+        self.t1, self.t2 = _FilaLRU(), _FilaLRU()
+        self.b1, self.b2 = _FilaLRU(), _FilaLRU()
+
+    def registrar(self, key):
+        pass
+
+    def acessar(self, key):
+        if key in self.t1:
+            self.t2.adicionar(key, self.t1.tirar(key))
+        elif key in self.t2:
+            self.t2.itens.move_to_end(key)
+
+    def inserir(self, key, tamanho):
+        if key in self.b1:
+            # Despejada de t1 cedo demais: t1 deveria ser maior
+            delta = max(1.0, len(self.b2) / len(self.b1)) * tamanho
+            self.p = min(self.capacidade_bytes, self.p + delta)
+            self.b1.tirar(key)
+            self.t2.adicionar(key, tamanho)
+        elif key in self.b2:
+            # Despejada de t2 cedo demais: t2 deveria ser maior
+            delta = max(1.0, len(self.b1) / len(self.b2)) * tamanho
+            self.p = max(0, self.p - delta)
+            self.b2.tirar(key)
+            self.t2.adicionar(key, tamanho)
+        else:
+            self.t1.adicionar(key, tamanho)
+
+    def remover(self, key):
+        for fila in (self.t1, self.t2):
+            if key in fila:
+                fila.tirar(key)
+                return
+
+    def vitima(self):
+        if self.t1.itens and (self.t1.bytes > self.p or not self.t2.itens):
+            origem, fantasma = self.t1, self.b1
+        elif self.t2.itens:
+            origem, fantasma = self.t2, self.b2
+        else:
+            return None
+
+        # A chave vai para a lista fantasma; remover() depois não a encontra mais em t1/t2
+        key = origem.mais_antiga()
+        fantasma.adicionar(key, origem.tirar(key))
+
+        # Limita as listas fantasmas: |t1| + |b1| <= c e o total <= 2c
+        while self.t1.bytes + self.b1.bytes > self.capacidade_bytes and self.b1.itens:
+            self.b1.tirar(self.b1.mais_antiga())
+        while (self.t1.bytes + self.t2.bytes + self.b1.bytes + self.b2.bytes > 2 * self.capacidade_bytes
+               and self.b2.itens):
+            self.b2.tirar(self.b2.mais_antiga())
+        return key
+
+
+POLITICAS = {
+    "LRU": PoliticaLRU,
+    "TINYLFU": PoliticaTinyLFU,
+    "ARC": PoliticaARC,
+}
+
+
+def criar_politica(nome, capacidade_bytes):
+
+    """
+    Cria a política de remoção pelo nome ("LRU", "TINYLFU" ou "ARC").
+    """
+
+    try:
+        return POLITICAS[nome.upper()](capacidade_bytes)
+    except KeyError:
+        raise ValueError(f"Política de cache desconhecida: {nome} (use {', '.join(POLITICAS)})")
@@ -0,0 +1,199 @@
+import time
+import queue
+import threading
+from collections import deque
+
+from .dns_functions import localizar_pergunta, montar_resposta
+from .dns_log import query_log
+from . import config
+
+# RCODE enviado para as consultas descartadas por sobrecarga, conforme POOL_ACAO_SOBRECARGA
+RCODES_SOBRECARGA = {"SERVFAIL": 2, "REFUSED": 5}
+
+# Quantidade de tempos de espera recentes guardados para os percentis
+AMOSTRAS_ESPERA = 2048
+
+
+class PoolTrabalhadores:
+    def __init__(self, processar, server_socket, trabalhadores = None, fila_max = None,
+                 alvo_ms = None, intervalo_ms = None, acao = None):
+        """
+        Pool fixo de threads que atende as consultas encaminhadas ao upstream.
+
+        'processar(pacote, addr)' é chamado por um dos trabalhadores para cada consulta.
+        A fila é limitada e o tempo de espera de cada consulta é medido. No estilo do CoDel,
+        se a espera passar de 'alvo_ms' por mais de 'intervalo_ms', o pool entra em sobrecarga
+        e as consultas que esperaram demais são recusadas (SERVFAIL/REFUSED ou descartadas,
+        conforme 'acao') em vez de atendidas, até a espera voltar a ficar abaixo do alvo.
+        """
+        self.processar = processar
+        self.server_socket = server_socket
+        self.trabalhadores = config.POOL_TRABALHADORES if trabalhadores is None else trabalhadores
+        self.alvo = (config.POOL_ALVO_ESPERA_MS if alvo_ms is None else alvo_ms) / 1000
+        self.intervalo = (config.POOL_INTERVALO_MS if intervalo_ms is None else intervalo_ms) / 1000
+        self.acao = (config.POOL_ACAO_SOBRECARGA if acao is None else acao).upper()
+
+        # O limite da fila é verificado em enviar(), para poder mudar na recarga da configuração
+        self.fila_max = config.POOL_FILA_MAX if fila_max is None else fila_max
+        self._fila = queue.Queue()
+        self._lock = threading.Lock()
+        self._acima_desde = None      # Instante em que a espera passou do alvo (None = abaixo)
+        self.sobrecarregado = False
+
+        # Métricas
+        self.processadas = 0
+        self.recusadas_fila_cheia = 0
+        self.recusadas_espera = 0
+        self.espera_maxima = 0.0
+        self._esperas = deque(maxlen=AMOSTRAS_ESPERA)
+
+        self._threads = []
+        self._encerrar = 0            # Trabalhadores que ainda devem sair (redução do pool)
+        with self._lock:
+            self._iniciar_trabalhadores(self.trabalhadores)
+
+    def _iniciar_trabalhadores(self, quantidade):
+        for _ in range(quantidade):
+            t = threading.Thread(target=self._loop, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def configurar(self):
+        """
+        Aplica as configurações atuais do config (recarga da configuração): alvo, intervalo,
+        ação, tamanho da fila e quantidade de trabalhadores. As consultas enfileiradas são mantidas.
+        """
+        self.alvo = config.POOL_ALVO_ESPERA_MS / 1000
+        self.intervalo = config.POOL_INTERVALO_MS / 1000
+        self.acao = config.POOL_ACAO_SOBRECARGA.upper()
+        self.fila_max = config.POOL_FILA_MAX
+
+        # Inicia trabalhadores novos ou marca os excedentes para sair: cada um termina a consulta
+        # atual, vê a marca e se retira de _threads (nada é colocado na fila, que pode estar cheia)
+        with self._lock:
+            diferenca = config.POOL_TRABALHADORES - (len(self._threads) - self._encerrar)
+            if diferenca > 0:
+                cancelados = min(self._encerrar, diferenca)
+                self._encerrar -= cancelados
+                self._iniciar_trabalhadores(diferenca - cancelados)
+            else:
+                self._encerrar -= diferenca
+            self.trabalhadores = config.POOL_TRABALHADORES
+
+    def enviar(self, pacote, addr):
+        """
+        Enfileira uma consulta sem bloquear. Com a fila cheia, a consulta é recusada na hora.
+        """
+        if self.fila_max and self._fila.qsize() >= self.fila_max:
+            with self._lock:
+                self.recusadas_fila_cheia += 1
+            self._recusar(pacote, addr)
+            return False
+        self._fila.put_nowait((pacote, addr, time.monotonic()))
+        return True
+
+    def _avaliar_espera(self, espera, agora):
+        """
+        Atualiza o estado de sobrecarga (CoDel) e indica se a consulta deve ser recusada.
+        """
+        with self._lock:
+            self._esperas.append(espera)
+            if espera > self.espera_maxima:
+                self.espera_maxima = espera
+
+            if espera < self.alvo:
+                self._acima_desde = None
+                if self.sobrecarregado:
+                    self.sobrecarregado = False
+                    query_log.registrar("WARNING", "SOBRECARGA FIM", fila=self._fila.qsize())
+                return False
+
+            if self._acima_desde is None:
+                self._acima_desde = agora
+            elif not self.sobrecarregado and agora - self._acima_desde >= self.intervalo:
+                self.sobrecarregado = True
+                query_log.registrar("WARNING", "SOBRECARGA", fila=self._fila.qsize(),
+                                    espera_ms=round(espera * 1000, 1), acao=self.acao)
+            return self.sobrecarregado
+
+    def _recusar(self, pacote, addr):
+        rcode = RCODES_SOBRECARGA.get(self.acao)
+        if rcode is None:
+            return  # DROP: o cliente tenta de novo após o timeout
+        _, _, _, fim_pergunta = localizar_pergunta(pacote)
+        if fim_pergunta is None:
+            return
+        try:
+            self.server_socket.sendto(montar_resposta(pacote, fim_pergunta, rcode=rcode), addr)
+        except OSError:
+            pass
+
+    def _sair_se_excedente(self):
+        """
+        Retira o trabalhador atual se o pool foi reduzido. Retorna True se ele deve sair.
+        """
+        with self._lock:
+            if self._encerrar <= 0:
+                return False
+            self._encerrar -= 1
+            self._threads.remove(threading.current_thread())
+            return True
+
+    def _loop(self):
+        while True:
+            if self._encerrar and self._sair_se_excedente():
+                return
+            try:
+                item = self._fila.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if item is None:
+                return
+            pacote, addr, chegada = item
+            agora = time.monotonic()
+
+            if self._avaliar_espera(agora - chegada, agora):
+                with self._lock:
+                    self.recusadas_espera += 1
+                self._recusar(pacote, addr)
+                continue
+
+            try:
+                self.processar(pacote, addr)
+            except Exception as e:
+                query_log.registrar("ERROR", "ERROR", motivo=str(e), cliente=addr[0])
+            with self._lock:
+                self.processadas += 1
+
+    def parar(self):
+        """
+        Encerra os trabalhadores depois que as consultas já enfileiradas forem atendidas.
+        """
+        with self._lock:
+            threads = list(self._threads)
+        for _ in threads:
+            self._fila.put(None)
+        for t in threads:
+            t.join(timeout=1)
+
+    def estatisticas(self):
+        """
+        Retorna os contadores do pool e os percentis do tempo de espera na fila (ms).
+        """
+        with self._lock:
+            esperas = sorted(self._esperas)
+
+        def percentil(p):
+            return round(esperas[min(int(len(esperas) * p), len(esperas) - 1)] * 1000, 2) if esperas else None
+
+        return {
+            "trabalhadores": self.trabalhadores,
+            "fila": self._fila.qsize(),
+            "processadas": self.processadas,
+            "recusadas_fila_cheia": self.recusadas_fila_cheia,
+            "recusadas_espera": self.recusadas_espera,
+            "sobrecarregado": self.sobrecarregado,
+            "espera_p50_ms": percentil(0.50),
+            "espera_p99_ms": percentil(0.99),
+            "espera_max_ms": round(self.espera_maxima * 1000, 2),
+        }
@@ -0,0 +1,187 @@
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+from collections import Counter
+
+from .dns_recarga import sinalizar_servidor
+from . import config
+
+# Faixas dos histogramas: a faixa i conta durações de 2^(i-1) a 2^i microssegundos (a 0, menos de 1 µs)
+FAIXAS = 26   # A última faixa acumula tudo acima de ~33 s
+
+# Etapas marcadas pelo servidor, com histogramas criados de antemão (outras são criadas no primeiro uso)
+ETAPAS = ("parse", "limite", "blocklist", "local", "cache", "empacotar", "par", "upstream",
+          "parse_upstream", "envio", "cache_set")
+
+
+class Rastreador:
+    def __init__(self, ativo = None):
+        """
+        Mede o tempo gasto em cada etapa do atendimento (parse, blocklist, cache, upstream...)
+        e acumula histogramas por etapa, em faixas de potências de 2 em microssegundos.
+
+        Desativado (RASTREIO_ATIVO = False), o custo por consulta é só testar 'ativo'.
+        Os contadores são apenas informativos e podem perder incrementos sob concorrência extrema
+        (sem lock, como no log de consultas).
+        """
+        self.ativo = config.RASTREIO_ATIVO if ativo is None else ativo
+        self._histogramas = {etapa: [0] * FAIXAS for etapa in ETAPAS}   # etapa -> [contagem por faixa]
+        self._totais = dict.fromkeys(ETAPAS, 0.0)                       # etapa -> soma das durações (s)
+        self._captura = threading.Lock()
+
+    def configurar(self):
+        self.ativo = config.RASTREIO_ATIVO
+
+    def marcar(self, etapa, desde):
+        """
+        Registra o tempo decorrido desde 'desde' (time.perf_counter) na etapa e retorna o instante atual,
+        para ser usado como início da próxima etapa.
+        """
+        agora = time.perf_counter()
+        duracao = agora - desde
+        histograma = self._histogramas.get(etapa)
+        if histograma is None:
+            # O total vem antes: outra thread que já veja o histograma sempre encontra o total
+            self._totais.setdefault(etapa, 0.0)
+            histograma = self._histogramas.setdefault(etapa, [0] * FAIXAS)
+        histograma[min(int(duracao * 1_000_000).bit_length(), FAIXAS - 1)] += 1
+        self._totais[etapa] += duracao
+        return agora
+
+    def instantaneo(self):
+        """
+        Copia os histogramas atuais: {etapa: ([contagens], soma em segundos)}.
+        """
+        return {etapa: (list(h), self._totais.get(etapa, 0.0)) for etapa, h in list(self._histogramas.items())}
+
+    @staticmethod
+    def resumir(instantaneo, anterior = None):
+        """
+        Resume os histogramas (ou a diferença para um instantâneo 'anterior'): quantidade,
+        média e percentis aproximados (limite superior da faixa, em µs) por etapa.
+        """
+        anterior = anterior or {}
+        resumo = {}
+        for etapa, (contagens, total) in sorted(instantaneo.items()):
+            contagens_antes, total_antes = anterior.get(etapa, ([0] * FAIXAS, 0.0))
+            contagens = [a - b for a, b in zip(contagens, contagens_antes)]
+            quantidade = sum(contagens)
+            if not quantidade:
+                continue
+
+            def percentil(p):
+                alvo, acumulado = quantidade * p, 0
+                for faixa, contagem in enumerate(contagens):
+                    acumulado += contagem
+                    if acumulado >= alvo:
+                        return 2 ** faixa
+                return 2 ** (FAIXAS - 1)
+
+            resumo[etapa] = {
+                "quantidade": quantidade,
+                "media_us": round((total - total_antes) / quantidade * 1_000_000, 1),
+                "p50_us": percentil(0.50),
+                "p99_us": percentil(0.99),
+                "faixas_us": {2 ** faixa: c for faixa, c in enumerate(contagens) if c},
+            }
+        return resumo
+
+    def estatisticas(self):
+        return self.resumir(self.instantaneo())
+
+    def capturar(self, segundos = None, intervalo_ms = None, diretorio = None):
+        """
+        Captura um perfil do processo por 'segundos': amostra a pilha de todas as threads a cada
+        'intervalo_ms' (sys._current_frames) e liga os histogramas durante a captura.
+
+        Grava em 'diretorio' o perfil no formato de pilhas "dobradas" (uma linha "thread;f1;f2 contagem",
+        aceito por flamegraph.pl, speedscope e inferno) e o resumo das etapas no período (JSON).
+        Retorna os caminhos dos dois arquivos, ou None se já houver uma captura em andamento.
+        """
+        segundos = config.RASTREIO_AMOSTRAGEM_S if segundos is None else segundos
+        intervalo = (config.RASTREIO_INTERVALO_MS if intervalo_ms is None else intervalo_ms) / 1000
+        diretorio = config.RASTREIO_DIRETORIO if diretorio is None else diretorio
+        if not self._captura.acquire(blocking=False):
+            return None
+
+        estava_ativo = self.ativo
+        try:
+            self.ativo = True
+            antes = self.instantaneo()
+            pilhas = Counter()
+            proprio = threading.get_ident()
+            nomes = {}
+            amostras = 0
+
+            fim = time.monotonic() + segundos
+            while time.monotonic() < fim:
+                if len(nomes) != threading.active_count():
+                    nomes = {t.ident: t.name for t in threading.enumerate()}
+                for ident, frame in sys._current_frames().items():
+                    if ident == proprio:
+                        continue
+                    funcoes = []
+                    while frame is not None:
+                        codigo = frame.f_code
+                        funcoes.append(f"{codigo.co_name} ({os.path.basename(codigo.co_filename)}:{codigo.co_firstlineno})")
+                        frame = frame.f_back
+                    funcoes.append(nomes.get(ident, str(ident)))
+                    pilhas[";".join(reversed(funcoes))] += 1
+                amostras += 1
+                time.sleep(intervalo)
+
+            etapas = self.resumir(self.instantaneo(), antes)
+
+            os.makedirs(diretorio, exist_ok=True)
+            prefixo = os.path.join(diretorio, time.strftime("perfil-%Y%m%d-%H%M%S"))
+            with open(prefixo + ".folded", "w", encoding="utf-8") as f:
+                for pilha, contagem in pilhas.most_common():
+                    f.write(f"{pilha} {contagem}\n")
+            with open(prefixo + "-etapas.json", "w", encoding="utf-8") as f:
+                json.dump({"segundos": segundos, "amostras": amostras, "etapas": etapas}, f, indent=2)
+        finally:
+            self.ativo = estava_ativo
+            self._captura.release()
+
+        print(f"Perfil gravado em {prefixo}.folded ({amostras} amostras) e {prefixo}-etapas.json")
+        return prefixo + ".folded", prefixo + "-etapas.json"
+
+    def iniciar_captura(self, segundos = None):
+        """
+        Executa a captura em segundo plano.
+        """
+        t = threading.Thread(target=self.capturar, args=(segundos,), daemon=True)
+        t.start()
+        return t
+
+    def instalar_sigusr1(self):
+        """
+        Faz o sinal SIGUSR1 (kill -USR1 <pid>) disparar uma captura. Não disponível no Windows.
+        """
+        if not hasattr(signal, "SIGUSR1"):
+            return False
+        signal.signal(signal.SIGUSR1, lambda signum, frame: self.iniciar_captura())
+        return True
+
+
+# Instância global usada pelo servidor
+rastreador = Rastreador()
+
+
+if __name__ == "__main__":
+    # Execução direta: python -m dns_app.backend.dns_rastreio (a partir de servidor_dns/)
+    # Pede ao servidor DNS em execução uma captura de RASTREIO_AMOSTRAGEM_S segundos.
+    parser = argparse.ArgumentParser(description="Dispara a captura de perfil do servidor DNS em execução.")
+    parser.add_argument("--pid", default=None, help="Arquivo com o PID do servidor")
+    args = parser.parse_args()
+
+    pid = sinalizar_servidor(args.pid, "SIGUSR1")
+    if pid:
+        print(f"Captura de {config.RASTREIO_AMOSTRAGEM_S}s iniciada no servidor (pid {pid}); "
+              f"os arquivos serão gravados em {config.RASTREIO_DIRETORIO}/")
+    else:
+        print("Servidor DNS não encontrado.")
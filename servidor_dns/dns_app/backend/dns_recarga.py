@@ -0,0 +1,172 @@
+import os
+import json
+import time
+import signal
+import threading
+import importlib.util
+
+from .dns_log import query_log
+from . import config
+
+
+def ler_config():
+
+    """
+    Executa o config.py em um módulo novo, sem tocar no config em uso.
+    Um erro no arquivo (ex: de sintaxe) é levantado aqui e a configuração atual é mantida.
+    """
+
+    spec = importlib.util.spec_from_file_location("dns_app.backend._config_novo", config.__file__)
+    novo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(novo)
+    return {nome: valor for nome, valor in vars(novo).items() if nome.isupper()}
+
+
+class Recarregador:
+    def __init__(self, blocklist = None, zonas = None, limitador = None, pool = None, pares = None, rastreador = None):
+        """
+        Recarrega a configuração com o servidor em execução, sem reiniciá-lo.
+
+        O config.py é lido de novo e só então as novas configurações são aplicadas ao
+        módulo 'config' (lido a cada uso pelo upstream, pela blocklist e pelos demais módulos).
+        A nova blocklist e os dados locais são montados em segundo plano e trocados de uma vez;
+        até lá as versões anteriores continuam respondendo. O cache é mantido.
+        """
+        self.blocklist = blocklist
+        self.zonas = zonas
+        self.limitador = limitador
+        self.pool = pool
+        self.pares = pares
+        self.rastreador = rastreador
+
+        self._lock = threading.Lock()
+        self.ultima = None   # Resultado da última recarga
+
+    @property
+    def em_andamento(self):
+        return self._lock.locked()
+
+    def recarregar(self):
+        """
+        Executa a recarga e retorna um resumo. Se outra recarga estiver em andamento, não faz nada.
+        """
+        if not self._lock.acquire(blocking=False):
+            return {"erro": "recarga já em andamento"}
+
+        inicio = time.time()
+        resultado = {"inicio": inicio, "alteradas": [], "erro": None}
+        try:
+            novas = ler_config()
+            alteradas = [nome for nome, valor in novas.items() if getattr(config, nome, None) != valor]
+            resultado["alteradas"] = alteradas
+
+            # Troca as configurações de uma vez (cada atribuição é atômica para quem lê)
+            for nome, valor in novas.items():
+                setattr(config, nome, valor)
+
+            if self.blocklist is not None and any(n.startswith("BLOCKLIST_") for n in alteradas):
+                self.blocklist.update_blocklists()    # Monta o novo conjunto e então o troca
+
+            if self.zonas is not None and any(n.startswith("LOCAL_") for n in alteradas):
+                self.zonas.configurar()
+
+            if self.limitador is not None and any(n.startswith("LIMITE_") for n in alteradas):
+                self.limitador.configurar()
+
+            if self.pool is not None and any(n.startswith("POOL_") for n in alteradas):
+                self.pool.configurar()
+
+            if self.pares is not None and any(n.startswith("PARES") for n in alteradas):
+                self.pares.configurar()
+
+            if self.rastreador is not None and "RASTREIO_ATIVO" in alteradas:
+                self.rastreador.configurar()
+
+            if any(n.startswith("LOG_") for n in alteradas):
+                query_log.configurar()   # Instância do processo, usada pelo servidor e pelo painel
+
+        except Exception as e:
+            resultado["erro"] = str(e)
+            print(f"Erro ao recarregar a configuração (mantida a anterior): {e}")
+        finally:
+            resultado["duracao_s"] = round(time.time() - inicio, 3)
+            self.ultima = resultado
+            self._lock.release()
+
+        if resultado["erro"] is None:
+            print(f"Configuração recarregada em {resultado['duracao_s']}s. "
+                  f"Alteradas: {', '.join(resultado['alteradas']) or 'nenhuma'}")
+        return resultado
+
+    def iniciar(self):
+        """
+        Executa a recarga em segundo plano.
+        """
+        t = threading.Thread(target=self.recarregar, daemon=True)
+        t.start()
+        return t
+
+    def instalar_sighup(self):
+        """
+        Faz o sinal SIGHUP (kill -HUP <pid>) disparar a recarga. Não disponível no Windows.
+        """
+        if not hasattr(signal, "SIGHUP"):
+            return False
+        signal.signal(signal.SIGHUP, lambda signum, frame: self.iniciar())
+        return True
+
+
+def sinalizar_servidor(arquivo_pid = None, sinal = "SIGHUP"):
+
+    """
+    Envia 'sinal' (padrão SIGHUP, a recarga) ao servidor DNS cujo PID está em 'arquivo_pid'
+    (padrão: SERVIDOR_ARQUIVO_PID). Retorna o PID sinalizado ou None se o servidor não estiver em execução.
+    """
+
+    arquivo_pid = arquivo_pid or config.SERVIDOR_ARQUIVO_PID
+    if not hasattr(signal, sinal) or not os.path.exists(arquivo_pid):
+        return None
+    try:
+        with open(arquivo_pid, "r", encoding="utf-8") as f:
+            pid = int(f.read().strip())
+        os.kill(pid, getattr(signal, sinal))
+        return pid
+    except (ValueError, OSError):
+        return None
+
+
+def escrever_estado_servidor(estado, arquivo = None):
+
+    """
+    Grava o estado do servidor DNS (dicionário) em 'arquivo' (padrão: SERVIDOR_ARQUIVO_ESTADO).
+    O arquivo é trocado de uma vez, então quem o lê nunca vê um JSON pela metade.
+    """
+
+    arquivo = arquivo or config.SERVIDOR_ARQUIVO_ESTADO
+    temporario = f"{arquivo}.{threading.get_ident()}.tmp"   # Um por thread: gravações simultâneas
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(estado, f, ensure_ascii=False)
+    os.replace(temporario, arquivo)
+
+
+def ler_estado_servidor(arquivo = None):
+
+    """
+    Retorna o estado gravado pelo servidor DNS, ou None se ele não estiver em execução
+    (sem arquivo, arquivo inválido ou, onde dá para conferir, PID que não existe mais).
+    """
+
+    arquivo = arquivo or config.SERVIDOR_ARQUIVO_ESTADO
+    try:
+        with open(arquivo, "r", encoding="utf-8") as f:
+            estado = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if hasattr(signal, "SIGHUP"):   # POSIX: o sinal 0 só confere se o processo existe
+        try:
+            os.kill(int(estado.get("pid")), 0)
+        except PermissionError:
+            pass
+        except (TypeError, ValueError, OSError):
+            return None
+    return estado
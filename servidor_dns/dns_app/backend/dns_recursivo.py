@@ -0,0 +1,345 @@
+import time
+import random
+import select
+import socket
+import struct
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from dnslib import DNSRecord, DNSHeader, DNSQuestion, QTYPE, RCODE
+
+from .dns_functions import tipo_consulta, query_upstream_tcp
+from .dns_cache import MAX_CADEIA_CNAME
+from . import config
+
+# Profundidade máxima de resoluções aninhadas (endereço de um servidor sem glue, que por sua
+# vez pode depender de outro servidor sem glue...)
+MAX_PROFUNDIDADE = 4
+
+# SRTT (tempo de resposta suavizado, em segundos) por endereço de servidor
+SRTT_INICIAL_MAX = 0.005   # Servidor nunca consultado: valor pequeno e aleatório, para ser experimentado
+SRTT_PESO = 0.3            # Peso da nova medida na média
+SRTT_DECAIMENTO = 0.98     # Os servidores não escolhidos "melhoram" aos poucos e voltam a ser testados
+SRTT_MAXIMO = 10.0
+
+
+def _subdominio(nome, zona):
+    return zona == "." or nome == zona or nome.endswith("." + zona)
+
+
+def _filtrar_respostas(respostas, nome, qtype, zona):
+    """
+    Mantém só os registros da resposta que pertencem à zona consultada (bailiwick), seguindo a
+    cadeia de CNAMEs a partir do nome pedido. Um CNAME para fora da zona encerra a cadeia: os
+    registros do destino que vierem junto são descartados e o destino é resolvido do zero.
+    """
+    aceitos = []
+    alvo = nome
+    for _ in range(MAX_CADEIA_CNAME):
+        if not _subdominio(alvo, zona):
+            break
+        do_alvo = [rr for rr in respostas if str(rr.rname).lower() == alvo]
+        aceitos.extend(rr for rr in do_alvo if rr.rtype == qtype)
+        cname = next((rr for rr in do_alvo if rr.rtype == QTYPE.CNAME), None)
+        if cname is None or qtype == QTYPE.CNAME:
+            break
+        aceitos.append(cname)
+        alvo = str(cname.rdata.label).lower()
+    return aceitos
+
+
+class ResolvedorRecursivo:
+    def __init__(self):
+        """
+        Resolvedor iterativo: parte dos servidores raiz (RECURSIVO_RAIZES) e segue as delegações
+        (referrals) até o servidor autoritativo do nome, sem depender de um resolvedor público.
+
+        - As delegações (zona -> servidores) e os endereços dos servidores (glue ou resolvidos)
+          ficam em caches próprios, separados do cache de respostas: um nome novo numa zona
+          já conhecida vai direto ao autoritativo, em uma única consulta.
+        - O tempo de resposta de cada servidor é medido (SRTT) e os mais rápidos são escolhidos.
+          RECURSIVO_PARALELO servidores são consultados ao mesmo tempo e vale a primeira resposta;
+          os endereços de servidores sem glue também são resolvidos em paralelo.
+        As configurações são lidas do config a cada consulta.
+        """
+        self._lock = threading.Lock()
+        self._delegacoes = OrderedDict()   # zona -> (expira, [nomes dos servidores])
+        self._enderecos = OrderedDict()    # nome do servidor -> (expira, [IPs])
+        self._srtt = {}                    # IP -> SRTT em segundos
+
+        # Métricas
+        self.consultas = 0
+        self.timeouts = 0
+        self.delegacoes_reaproveitadas = 0
+
+    def consultar(self, domain, query_type = "A", transaction_id = None):
+        """
+        Resolve o nome e retorna o pacote de resposta (como query_upstream), ou None em caso de falha.
+        """
+        nome = str(domain).strip().lower().rstrip(".") + "."
+        qtype = tipo_consulta(query_type)
+        try:
+            rcode, respostas, autoridade = self.resolver(nome, qtype)
+        except Exception as e:
+            print(f"Erro na resolução recursiva de {nome}: {e}")
+            return None
+        if rcode == RCODE.SERVFAIL:
+            return None
+
+        cabecalho = DNSHeader(id=random.getrandbits(16) if transaction_id is None else int(transaction_id),
+                              qr=1, rd=1, ra=1, rcode=rcode)
+        return DNSRecord(cabecalho, q=DNSQuestion(nome, qtype), rr=respostas, auth=autoridade).pack()
+
+    def resolver(self, nome, qtype, profundidade = 0):
+        """
+        Resolve 'nome' (minúsculas, com ponto final) seguindo CNAMEs que levem a outras zonas.
+        Retorna (rcode, registros de resposta, registros de autoridade) no formato do dnslib.
+        """
+        cadeia = []
+        atual = nome
+        for _ in range(MAX_CADEIA_CNAME):
+            rcode, respostas, autoridade = self._resolver_nome(atual, qtype, profundidade)
+            cadeia.extend(respostas)
+            if rcode != RCODE.NOERROR:
+                return rcode, cadeia, autoridade
+
+            # Segue a cadeia de CNAMEs contida na própria resposta
+            alvo = atual
+            for _ in range(MAX_CADEIA_CNAME):
+                if any(rr.rtype == qtype and str(rr.rname).lower() == alvo for rr in respostas):
+                    return rcode, cadeia, autoridade
+                cname = next((rr for rr in respostas
+                              if rr.rtype == QTYPE.CNAME and str(rr.rname).lower() == alvo), None)
+                if cname is None:
+                    break
+                alvo = str(cname.rdata.label).lower()
+
+            if alvo == atual or qtype == QTYPE.CNAME:
+                return rcode, cadeia, autoridade   # Sem registros do tipo (NODATA) ou CNAME pedido
+            atual = alvo   # CNAME para outra zona: continua a partir do destino
+
+        return RCODE.SERVFAIL, cadeia, []
+
+    def _resolver_nome(self, nome, qtype, profundidade):
+        """
+        Consulta os servidores a partir da delegação mais próxima já conhecida,
+        seguindo os referrals até uma resposta definitiva.
+        """
+        zona, servidores = self._delegacao_mais_proxima(nome)
+        for _ in range(config.RECURSIVO_MAX_DELEGACOES):
+            enderecos = self._enderecos_servidores(servidores, profundidade)
+            resposta = self._consultar_servidores(enderecos, nome, qtype) if enderecos else None
+            if resposta is None:
+                return RCODE.SERVFAIL, [], []
+
+            rcode = resposta.header.rcode
+            ns = [rr for rr in resposta.auth if rr.rtype == QTYPE.NS]
+            if rcode != RCODE.NOERROR or resposta.rr or resposta.header.aa or not ns:
+                # Resposta definitiva; na negativa, mantém o SOA (TTL do cache negativo)
+                respostas = _filtrar_respostas(resposta.rr, nome, qtype, zona)
+                autoridade = [] if respostas else [rr for rr in resposta.auth if rr.rtype == QTYPE.SOA
+                                                   and _subdominio(str(rr.rname).lower(), zona)]
+                return rcode, respostas, autoridade
+
+            # Referral: a zona filha deve conter o nome e estar abaixo da zona atual
+            nova_zona = str(ns[0].rname).lower()
+            if nova_zona == zona or not _subdominio(nome, nova_zona) or not _subdominio(nova_zona, zona):
+                return RCODE.SERVFAIL, [], []
+            servidores = self._guardar_delegacao(nova_zona, zona, ns, resposta.ar)
+            zona = nova_zona
+
+        return RCODE.SERVFAIL, [], []
+
+    def _guardar(self, tabela, chave, valor):
+        tabela[chave] = valor
+        tabela.move_to_end(chave)
+        if len(tabela) > config.RECURSIVO_MAX_ZONAS:
+            tabela.popitem(last=False)
+
+    def _guardar_delegacao(self, zona, zona_pai, ns, adicionais):
+        """
+        Guarda a delegação e o glue recebidos num referral. Retorna os nomes dos servidores da zona.
+        Só é aceito glue dos próprios servidores e dentro da zona de quem respondeu (bailiwick).
+        """
+        agora = time.time()
+        registros = [rr for rr in ns if str(rr.rname).lower() == zona]
+        nomes = [str(rr.rdata.label).lower() for rr in registros]
+
+        glue = {}
+        for rr in adicionais:
+            servidor = str(rr.rname).lower()
+            if rr.rtype == QTYPE.A and servidor in nomes and _subdominio(servidor, zona_pai):
+                ips, ttl = glue.get(servidor, ([], rr.ttl))
+                glue[servidor] = (ips + [str(rr.rdata)], min(ttl, rr.ttl))
+
+        with self._lock:
+            self._guardar(self._delegacoes, zona, (agora + min(rr.ttl for rr in registros), nomes))
+            for servidor, (ips, ttl) in glue.items():
+                self._guardar(self._enderecos, servidor, (agora + ttl, ips))
+        return nomes
+
+    def _delegacao_mais_proxima(self, nome):
+        """
+        Retorna (zona, servidores) da delegação em cache mais próxima do nome, ou a raiz.
+        """
+        agora = time.time()
+        rotulos = nome.rstrip(".").split(".")
+        with self._lock:
+            for i in range(len(rotulos)):
+                zona = ".".join(rotulos[i:]) + "."
+                item = self._delegacoes.get(zona)
+                if item is not None and item[0] > agora:
+                    self.delegacoes_reaproveitadas += 1
+                    return zona, item[1]
+        return ".", [servidor.lower() for servidor, _ in config.RECURSIVO_RAIZES]
+
+    def _enderecos_servidores(self, servidores, profundidade):
+        """
+        Retorna os endereços conhecidos dos servidores. Se nenhum tiver endereço (delegação sem glue),
+        resolve até RECURSIVO_PARALELO nomes em paralelo.
+        """
+        agora = time.time()
+        raizes = {servidor.lower(): ip for servidor, ip in config.RECURSIVO_RAIZES}
+        enderecos, sem_endereco = [], []
+        with self._lock:
+            for servidor in servidores:
+                item = self._enderecos.get(servidor)
+                if servidor in raizes:
+                    enderecos.append(raizes[servidor])
+                elif item is not None and item[0] > agora:
+                    enderecos.extend(item[1])
+                else:
+                    sem_endereco.append(servidor)
+
+        if not enderecos and sem_endereco and profundidade < MAX_PROFUNDIDADE:
+            escolhidos = sem_endereco[:max(config.RECURSIVO_PARALELO, 1)]
+            with ThreadPoolExecutor(max_workers=len(escolhidos)) as pool:
+                for ips in pool.map(lambda servidor: self._resolver_endereco(servidor, profundidade + 1), escolhidos):
+                    enderecos.extend(ips)
+        return list(dict.fromkeys(enderecos))
+
+    def _resolver_endereco(self, servidor, profundidade):
+        try:
+            _, respostas, _ = self.resolver(servidor, QTYPE.A, profundidade)
+        except Exception:
+            return []
+        registros = [rr for rr in respostas if rr.rtype == QTYPE.A]
+        if registros:
+            with self._lock:
+                self._guardar(self._enderecos, servidor,
+                              (time.time() + min(rr.ttl for rr in registros), [str(rr.rdata) for rr in registros]))
+        return [str(rr.rdata) for rr in registros]
+
+    def _ordenar(self, enderecos):
+        """
+        Ordena os endereços pelo SRTT (mais rápidos primeiro).
+        """
+        paralelo = max(config.RECURSIVO_PARALELO, 1)
+        with self._lock:
+            if len(self._srtt) > config.RECURSIVO_MAX_ZONAS:
+                self._srtt.clear()
+            for ip in enderecos:
+                if ip not in self._srtt:
+                    self._srtt[ip] = random.uniform(0, SRTT_INICIAL_MAX)
+            ordenados = sorted(enderecos, key=self._srtt.__getitem__)
+            for ip in ordenados[paralelo:]:
+                self._srtt[ip] *= SRTT_DECAIMENTO
+        return ordenados
+
+    def _medir(self, ip, rtt):
+        with self._lock:
+            anterior = self._srtt.get(ip, rtt)
+            self._srtt[ip] = (1 - SRTT_PESO) * anterior + SRTT_PESO * rtt
+
+    def _penalizar(self, ip):
+        with self._lock:
+            self.timeouts += 1
+            self._srtt[ip] = min(self._srtt.get(ip, 0.0) * 2 + config.RECURSIVO_TIMEOUT_S, SRTT_MAXIMO)
+
+    def _consultar_servidores(self, enderecos, nome, qtype):
+        """
+        Envia a consulta (sem recursão) aos servidores em lotes de RECURSIVO_PARALELO, dos mais
+        rápidos aos mais lentos, e retorna a primeira resposta válida (DNSRecord) ou None.
+        """
+        paralelo = max(config.RECURSIVO_PARALELO, 1)
+        porta = config.RECURSIVO_PORTA
+        consulta_id = random.getrandbits(16)
+        pacote = DNSRecord(DNSHeader(id=consulta_id, rd=0), q=DNSQuestion(nome, qtype)).pack()
+        ordenados = self._ordenar(enderecos)
+
+        enviados = {}   # IP -> instante do envio (aceita resposta atrasada de um lote anterior)
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            for i in range(0, len(ordenados), paralelo):
+                lote = ordenados[i:i + paralelo]
+                for ip in lote:
+                    try:
+                        sock.sendto(pacote, (ip, porta))
+                        enviados[ip] = time.monotonic()
+                    except OSError:
+                        self._penalizar(ip)
+                with self._lock:
+                    self.consultas += len(lote)
+
+                limite = time.monotonic() + config.RECURSIVO_TIMEOUT_S
+                while True:
+                    restante = limite - time.monotonic()
+                    if restante <= 0 or not select.select([sock], [], [], restante)[0]:
+                        break
+                    try:
+                        data, (ip, _) = sock.recvfrom(4096)
+                    except OSError:
+                        continue
+                    if ip not in enviados or len(data) < 12 or struct.unpack("!H", data[:2])[0] != consulta_id:
+                        continue
+                    self._medir(ip, time.monotonic() - enviados[ip])
+
+                    try:
+                        resposta = DNSRecord.parse(data)
+                        if str(resposta.q.qname).lower() != nome or resposta.q.qtype != qtype:
+                            continue
+                        if resposta.header.tc:
+                            resposta = DNSRecord.parse(query_upstream_tcp(pacote, config.RECURSIVO_TIMEOUT_S * 2, (ip, porta)))
+                    except Exception:
+                        continue
+                    if resposta.header.rcode in (RCODE.SERVFAIL, RCODE.REFUSED):
+                        continue   # Servidor com problema: espera os outros do lote
+                    return resposta
+
+                # Os servidores do lote que não responderam a tempo ficam para o fim da fila
+                for ip in lote:
+                    self._penalizar(ip)
+        return None
+
+    def estatisticas(self, quantidade = 5):
+        """
+        Retorna os contadores do resolvedor e os servidores mais rápidos (SRTT em ms).
+        """
+        with self._lock:
+            mais_rapidos = sorted(self._srtt.items(), key=lambda item: item[1])[:quantidade]
+            return {
+                "consultas": self.consultas,
+                "timeouts": self.timeouts,
+                "delegacoes_reaproveitadas": self.delegacoes_reaproveitadas,
+                "zonas": len(self._delegacoes),
+                "servidores": len(self._enderecos),
+                "mais_rapidos": [(ip, round(srtt * 1000, 2)) for ip, srtt in mais_rapidos],
+            }
+
+
+_resolvedor = None
+_resolvedor_lock = threading.Lock()
+
+
+def resolvedor_recursivo():
+
+    """
+    Retorna o resolvedor recursivo do processo (criado no primeiro uso e compartilhado pelas threads).
+    """
+
+    global _resolvedor
+    if _resolvedor is None:
+        with _resolvedor_lock:
+            if _resolvedor is None:
+                _resolvedor = ResolvedorRecursivo()
+    return _resolvedor
@@ -0,0 +1,289 @@
+import re
+from functools import lru_cache
+
+from . import config
+
+# Bits guardados por nome no dicionário de sufixos
+BLOQ_EXATO = 1
+BLOQ_SUFIXO = 2
+PERM_EXATO = 4
+PERM_SUFIXO = 8
+_SUFIXOS = BLOQ_SUFIXO | PERM_SUFIXO
+_PERMITIDO = PERM_EXATO | PERM_SUFIXO
+
+# Dígitos hexadecimais que seguem cada escape numérico de uma regex
+_DIGITOS_ESCAPE = {"x": 2, "u": 4, "U": 8}
+
+# Trechos menores que isso não filtram quase nada: a regra é testada em todo nome
+_LITERAL_MINIMO = 3
+
+
+def interpretar_regra(linha):
+    """
+    Interpreta uma regra e retorna (permitir, tipo, valor), ou None para linhas vazias e comentários.
+
+    - "exemplo.com"        tipo "sufixo": o nome e todos os subdomínios (como as listas hosts)
+    - "=exemplo.com"       tipo "exato": apenas o nome
+    - "ads*.exemplo.com"   tipo "curinga": * é qualquer sequência de caracteres e ? um caractere
+    - "/^track[0-9]+\\./"   tipo "regex": re.search no nome (sem o ponto final), sem
+                             diferenciar maiúsculas
+    - prefixo "@@"         exceção (allowlist) em vez de bloqueio
+    """
+    linha = linha.strip()
+    if not linha or linha.startswith("#"):
+        return None
+    permitir = linha.startswith("@@")
+    if permitir:
+        linha = linha[2:]
+
+    if len(linha) > 2 and linha.startswith("/") and linha.endswith("/"):
+        return permitir, "regex", linha[1:-1]
+    linha = linha.rstrip(".").lower()
+    if linha.startswith("="):
+        return permitir, "exato", linha[1:]
+    if "*" in linha or "?" in linha:
+        return permitir, "curinga", linha
+    return permitir, "sufixo", linha
+
+
+def _literal_curinga(padrao):
+    """
+    Trecho literal mais longo de um curinga (todo nome que casa o contém).
+    """
+    return max(re.split(r"[*?]", padrao), key=len)
+
+
+def _fim_escape(padrao, i):
+    """
+    Posição logo após a sequência de escape que começa em padrao[i] ("\\").
+    """
+    seguinte = padrao[i + 1]
+    if seguinte in _DIGITOS_ESCAPE:
+        return min(i + 2 + _DIGITOS_ESCAPE[seguinte], len(padrao))
+    if seguinte == "N" and padrao.startswith("{", i + 2):
+        fim = padrao.find("}", i)
+        return fim + 1 if fim != -1 else len(padrao)
+    if seguinte.isdigit():   # Octal (\0, \012) ou referência a grupo (\1, \12)
+        fim = i + 2
+        while fim < len(padrao) and fim < i + 4 and padrao[fim].isdigit():
+            fim += 1
+        return fim
+    return i + 2
+
+
+def _literal_regex(padrao):
+    """
+    Trecho literal mais longo que toda ocorrência da expressão contém, ou "" se não houver um seguro.
+
+    Só considera caracteres fora de grupos e classes que não sejam seguidos de quantificador;
+    com uma alternativa ("|") fora de grupos nenhum trecho é obrigatório.
+    """
+    trechos, atual = [], []
+    profundidade, i = 0, 0
+    while i < len(padrao):
+        c = padrao[i]
+        literal = None
+        if c == "\\" and i + 1 < len(padrao):
+            seguinte = padrao[i + 1]
+            if not seguinte.isalnum():   # \. \- \/ ...: o próprio caractere
+                literal = seguinte
+            i = _fim_escape(padrao, i)   # \d, \x41, \u0041, \N{...}, \1...: encerram o trecho
+        elif c == "[":
+            fim = padrao.find("]", i + 2)   # "[]...]" inclui o "]" na classe
+            i = fim + 1 if fim != -1 else len(padrao)
+        elif c == "{":
+            fim = padrao.find("}", i)
+            i = fim + 1 if fim != -1 else len(padrao)
+        elif c == "(":
+            profundidade += 1
+            i += 1
+        elif c == ")":
+            profundidade = max(profundidade - 1, 0)
+            i += 1
+        elif c == "|" and profundidade == 0:
+            return ""
+        else:
+            if c not in ".^$*+?{}|":
+                literal = c
+            i += 1
+
+        quantificado = i < len(padrao) and padrao[i] in "*+?{"
+        if literal is not None and profundidade == 0 and not quantificado:
+            atual.append(literal.lower())
+            continue
+        if atual:
+            trechos.append("".join(atual))
+            atual = []
+    if atual:
+        trechos.append("".join(atual))
+    return max(trechos, key=len, default="")
+
+
+class AhoCorasick:
+    def __init__(self, trechos):
+        """
+        Autômato de Aho-Corasick já convertido em DFA: cada estado tem a transição de todos os
+        caracteres do alfabeto dos trechos, então a busca faz uma consulta de dicionário por caractere
+        do nome e encontra todos os trechos presentes numa só passada.
+
+        'trechos' é uma lista de (texto, identificador); buscar() retorna os identificadores encontrados.
+        """
+        self.transicoes = [{}]
+        self.saidas = [()]
+        for texto, identificador in trechos:
+            estado = 0
+            for c in texto:
+                proximo = self.transicoes[estado].get(c)
+                if proximo is None:
+                    proximo = len(self.transicoes)
+                    self.transicoes.append({})
+                    self.saidas.append(())
+                    self.transicoes[estado][c] = proximo
+                estado = proximo
+            self.saidas[estado] += (identificador,)
+
+        # Ligações de falha em largura; as transições que faltam são herdadas do estado de falha
+        alfabeto = {c for texto, _ in trechos for c in texto}
+        falha = [0] * len(self.transicoes)
+        fila = list(self.transicoes[0].values())
+        for c in alfabeto:
+            self.transicoes[0].setdefault(c, 0)
+        for estado in fila:
+            transicoes = self.transicoes[estado]
+            do_falha = self.transicoes[falha[estado]]
+            self.saidas[estado] += self.saidas[falha[estado]]
+            for c in alfabeto:
+                proximo = transicoes.get(c)
+                if proximo is None:
+                    transicoes[c] = do_falha[c]
+                else:
+                    falha[proximo] = do_falha[c]
+                    fila.append(proximo)
+
+    def buscar(self, texto):
+        transicoes, saidas = self.transicoes, self.saidas
+        encontrados = set()
+        estado = 0
+        for c in texto:
+            estado = transicoes[estado].get(c, 0)
+            if saidas[estado]:
+                encontrados.update(saidas[estado])
+        return encontrados
+
+
+class MotorRegras:
+    def __init__(self, dominios = (), regras = (), permitidos = (), tamanho_cache = None):
+        """
+        Compila as regras de bloqueio e as exceções numa estrutura avaliada numa só passada por nome.
+
+        - 'dominios': nomes bloqueados com os subdomínios (as listas hosts)
+        - 'regras': regras no formato de interpretar_regra (com "@@" para exceções)
+        - 'permitidos': exceções, no mesmo formato e sem o "@@"
+
+        Regras exatas e de sufixo ficam num só dicionário (nome -> bits), consultado para o nome e
+        cada domínio pai. Curingas e regex são filtrados por um Aho-Corasick com o trecho literal
+        obrigatório de cada um, e só os candidatos encontrados são testados. Uma exceção sempre vence
+        um bloqueio. O resultado de cada nome fica num LRU de BLOCKLIST_CACHE_NOMES posições.
+        """
+        self.sufixos = dict.fromkeys((d.rstrip(".").lower() for d in dominios), BLOQ_SUFIXO)
+        self.padroes = []      # [(permitir, regex compilada, regra original)]
+        self.invalidas = []
+        sempre, trechos = [], []
+
+        regras = list(regras) + ["@@" + regra for regra in permitidos]
+        for regra in regras:
+            interpretada = interpretar_regra(regra)
+            if interpretada is None:
+                continue
+            permitir, tipo, valor = interpretada
+            if tipo in ("exato", "sufixo"):
+                bit = {("exato", False): BLOQ_EXATO, ("sufixo", False): BLOQ_SUFIXO,
+                       ("exato", True): PERM_EXATO, ("sufixo", True): PERM_SUFIXO}[tipo, permitir]
+                self.sufixos[valor] = self.sufixos.get(valor, 0) | bit
+                continue
+
+            if tipo == "curinga":
+                expressao = "".join(".*" if c == "*" else "." if c == "?" else re.escape(c) for c in valor)
+                expressao, literal = rf"\A{expressao}\Z", _literal_curinga(valor)
+            else:
+                expressao, literal = valor, _literal_regex(valor)
+            try:
+                # O nome é avaliado em minúsculas: a regra também não diferencia maiúsculas
+                compilada = re.compile(expressao, re.IGNORECASE)
+            except re.error as e:
+                self.invalidas.append(regra)
+                print(f"Regra ignorada '{regra.strip()}': {e}")
+                continue
+
+            self.padroes.append((permitir, compilada, regra.strip()))
+            if len(literal) >= _LITERAL_MINIMO:
+                trechos.append((literal, len(self.padroes) - 1))
+            else:
+                sempre.append(len(self.padroes) - 1)
+
+        self.automato = AhoCorasick(trechos) if trechos else None
+        self.sempre = sempre
+        self.ha_excecoes = any(permitir for permitir, _, _ in self.padroes)
+
+        # bloqueado(nome) é a avaliação com o cache LRU (por nome exatamente como recebido)
+        tamanho = config.BLOCKLIST_CACHE_NOMES if tamanho_cache is None else tamanho_cache
+        self.bloqueado = lru_cache(maxsize=tamanho)(self.avaliar) if tamanho else self.avaliar
+
+    def avaliar(self, dominio):
+        """
+        Retorna True se o nome deve ser bloqueado (sem usar o cache de resultados).
+        """
+        nome = dominio.rstrip(".").lower()
+        sufixos = self.sufixos
+
+        # 1. Nome exato e domínios pai, no dicionário
+        bits = sufixos.get(nome, 0)
+        ponto = nome.find(".")
+        while ponto != -1:
+            bits |= sufixos.get(nome[ponto + 1:], 0) & _SUFIXOS
+            ponto = nome.find(".", ponto + 1)
+        if bits & _PERMITIDO:
+            return False
+        bloqueado = bool(bits)
+
+        # 2. Curingas e regex: só os candidatos do autômato (e os sem trecho literal)
+        if not self.padroes or (bloqueado and not self.ha_excecoes):
+            return bloqueado
+        candidatos = self.automato.buscar(nome) if self.automato is not None else set()
+        candidatos.update(self.sempre)
+        for indice in candidatos:
+            permitir, compilada, _ = self.padroes[indice]
+            if (permitir or not bloqueado) and compilada.search(nome):
+                if permitir:
+                    return False
+                bloqueado = True
+        return bloqueado
+
+    def estatisticas(self):
+        """
+        Retorna o tamanho da estrutura compilada e os acertos do cache de resultados.
+        """
+        info = self.bloqueado.cache_info() if hasattr(self.bloqueado, "cache_info") else None
+        return {
+            "nomes": len(self.sufixos),
+            "padroes": len(self.padroes),
+            "sem_trecho_literal": len(self.sempre),
+            "estados_automato": len(self.automato.transicoes) if self.automato is not None else 0,
+            "invalidas": len(self.invalidas),
+            "cache_acertos": info.hits if info else 0,
+            "cache_falhas": info.misses if info else 0,
+        }
+
+
+def ler_regras(arquivos = None):
+    """
+    Lê as regras das configurações BLOCKLIST_REGRAS e BLOCKLIST_REGRAS_ARQUIVOS (uma por linha).
+    """
+    regras = list(config.BLOCKLIST_REGRAS)
+    for arquivo in (config.BLOCKLIST_REGRAS_ARQUIVOS if arquivos is None else arquivos):
+        try:
+            with open(arquivo, "r", encoding="utf-8") as f:
+                regras.extend(f.read().splitlines())
+        except OSError as e:
+            print(f"Erro ao ler arquivo de regras {arquivo}: {e}")
+    return regras
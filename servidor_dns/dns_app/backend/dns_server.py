@@ -1,92 +1,206 @@
+import os
+import argparse
 import socket  # Permite criar soquetes para enviar e receber pacotes UDP
 import threading
+import time
 
-from dnslib import DNSRecord, DNSHeader, DNSQuestion, QTYPE, RCODE, RR, A, QTYPE_MAP # Biblioteca que facilita a criação e análise de pacotes DNS
 
-from servidor_dns.dns_app.backend.dns_cache import DNSCache
-from servidor_dns.dns_app.backend.dns_blocklist import blocklist_cache
-from servidor_dns.dns_app.backend.dns_functions import QUERY_TYPES, query_upstream, parse_query, parse_response, get_blocked_response
+from .dns_cache import DNSCache
+from .dns_blocklist import blocklist_cache
+from .dns_functions import (query_upstream, parse_query, parse_response, get_blocked_response,
+                            localizar_pergunta, empacotar_registros, montar_resposta, nome_tipo)
+from .dns_log import query_log
+from .dns_historico import HistoricoConsultas
+from .dns_local import ZonasLocais
+from .dns_aquecimento import AquecimentoCache
+from .dns_limite import LimitadorTaxa, TRUNCAR
+from .dns_pool import PoolTrabalhadores
+from .dns_recarga import Recarregador, ler_config, escrever_estado_servidor
+from .dns_recursivo import resolvedor_recursivo
+from .dns_pares import CachePares
+from .dns_rastreio import rastreador
 
-from .config import UPSTREAM_DNS
+from . import config
 
-def handle_client(data, addr, server_socket, cache, blocklist):
+def _registrar_historico(historico, domain, qtype_str, fonte, addr, inicio):
+    """
+    Registra a consulta no histórico persistente, se houver um configurado.
+    """
+    if historico is not None:
+        historico.registrar(domain, qtype_str, fonte, cliente=addr[0],
+                            latencia_ms=(time.perf_counter() - inicio) * 1000)
+
+def responder_local(pacote, addr, cache, blocklist, historico = None, zonas = None, limitador = None):
+    """
+    Tenta responder a consulta sem consultar o upstream (blocklist, dados locais ou cache).
+    Com um 'limitador', consultas acima do limite de taxa são descartadas ou truncadas antes de tudo.
+
+    'pacote' pode ser um memoryview sobre o buffer de recepção: nada é copiado até
+    a montagem da resposta. Retorna os bytes da resposta, b"" se a consulta é inválida
+    (deve ser ignorada) ou None se ela precisa ser encaminhada ao upstream.
+    Com RASTREIO_ATIVO, o tempo de cada etapa vai para os histogramas do rastreador.
+    """
+    t = inicio = time.perf_counter()
+    rastreio = rastreador.ativo
+
+    # 1. Parsear consulta DNS recebida de cliente
+    transaction_id, domain, qtype_val, fim_pergunta = localizar_pergunta(pacote)
+    if rastreio:
+        t = rastreador.marcar("parse", t)
+
+    if not domain:
+        query_log.registrar("WARNING", "ERROR", motivo="consulta inválida", cliente=addr[0])
+        return b""
+
+    qtype_str = nome_tipo(qtype_val)
+    query_log.registrar("DEBUG", "QUERY", cliente=addr[0], dominio=domain, tipo=qtype_str)
+
+    # 1.1. Limite de taxa por cliente, por sub-rede e de respostas repetidas (RRL)
+    if limitador is not None:
+        acao = limitador.avaliar(addr[0], domain, qtype_val)
+        if rastreio:
+            t = rastreador.marcar("limite", t)
+        if acao is not None:
+            query_log.registrar("DEBUG", "RATE LIMIT", cliente=addr[0], dominio=domain, tipo=qtype_str, acao=acao)
+            if acao == TRUNCAR:
+                return montar_resposta(pacote, fim_pergunta, tc=True)
+            return b""
+
+    # 2. Verificar se o domínio está na blocklist (fail-closed: SERVFAIL enquanto ela carrega)
+    if not blocklist.carregada and not config.BLOCKLIST_FALHA_ABERTA:
+        return montar_resposta(pacote, fim_pergunta, rcode=2)
+
+    bloqueado = blocklist.is_blocked(domain)
+    if rastreio:
+        t = rastreador.marcar("blocklist", t)
+    if bloqueado:
+        query_log.registrar("INFO", "BLOCKED", cliente=addr[0], dominio=domain, tipo=qtype_str)
+        # Gera a resposta de bloqueio (NXDOMAIN por padrão) preservando o ID da transação
+        blocked_response = blocklist.get_blocked_response(pacote, fim_pergunta, qtype_val)
+        _registrar_historico(historico, domain, qtype_str, "blocklist", addr, inicio)
+        return blocked_response
+
+    # 3. Verificar se o nome é respondido pelos dados locais (hosts e zonas)
+    if zonas is not None and not zonas.vazio:
+        local = zonas.buscar(domain, qtype_val)
+        if rastreio:
+            t = rastreador.marcar("local", t)
+        if local is not None:
+            query_log.registrar("DEBUG", "LOCAL", cliente=addr[0], dominio=domain, tipo=qtype_str)
+            _registrar_historico(historico, domain, qtype_str, "local", addr, inicio)
+            return montar_resposta(pacote, fim_pergunta, local.respostas + local.autoridade,
+                                   ancount=local.ancount, nscount=local.nscount, rcode=local.rcode, aa=True)
+
+    # 4. Verificar se a resposta já existe no cache (diretamente ou por um CNAME já conhecido)
+    entrada = cache.get_resposta(domain, qtype_str)
+    if rastreio:
+        t = rastreador.marcar("cache", t)
+    if entrada is None or not entrada["value"]:
+        return None
+
+    query_log.registrar("DEBUG", "CACHE HIT", cliente=addr[0], dominio=domain, tipo=qtype_str)
+
+    # As seções já vêm empacotadas do cache (set_key); entradas antigas são empacotadas no primeiro hit
+    secoes = entrada.get("pacote")
+    if secoes is None:
+        secoes = entrada["pacote"] = empacotar_registros(entrada["value"], domain)
+
+    resposta = montar_resposta(pacote, fim_pergunta, secoes[0], ancount=secoes[1], nscount=secoes[2],
+                               arcount=secoes[3], rcode=entrada.get("rcode", 0), aa=True) # aa=1: Autoritativa
+    if rastreio:
+        rastreador.marcar("empacotar", t)
+    _registrar_historico(historico, domain, qtype_str, "cache", addr, inicio)
+    return resposta
+
+def handle_client(data, addr, server_socket, cache, blocklist, historico = None, tentar_local = True, zonas = None,
+                  limitador = None, pares = None):
     """
     Processa uma única requisição DNS recebida pelo servidor.
+
+    Com tentar_local=False a consulta vai direto ao upstream (o loop principal já
+    tentou responder pela blocklist e pelo cache). Com 'pares', o nó dono do nome
+    no cache cooperativo é consultado antes do upstream.
     """
+    t = inicio = time.perf_counter()
+    rastreio = rastreador.ativo
     try:
-        # 1. Parsear consulta DNS recebida de cliente
+        if tentar_local:
+            resposta = responder_local(data, addr, cache, blocklist, historico, zonas, limitador)
+            if resposta is not None:
+                if resposta:
+                    if rastreio:
+                        t = time.perf_counter()
+                    server_socket.sendto(resposta, addr)
+                    if rastreio:
+                        rastreador.marcar("envio", t)
+                return
+
         transaction_id, domain, qtype_val = parse_query(data)
+        qtype_str = nome_tipo(qtype_val)
+        if rastreio:
+            t = rastreador.marcar("parse_upstream", t)
 
-        qtype_str = QTYPE.get(qtype_val, "A")
-
-        if not domain:
-            print(f"Erro ao parserar requisição de {addr}")
-            return
-
-        print(f"[QUERY] Recebido de {addr}: {domain} TIPO={qtype_str}")
-
-        # 2. Verificar se o domínio está na blocklist
-        if blocklist.is_blocked(domain):
-            print(f"[BLOCKED] Domínio '{domain}' está na blocklist.")
-            # Gera uma resposta NXDOMAIN (Domínio Inexistente) preservando o ID da transação
-            blocked_response = blocklist.get_blocked_response(data)
-            server_socket.sendto(blocked_response, addr)
-            return
-
-        # 3. Verificar se a resposta já existe no cache
-        cache_key = f"{domain}|{qtype_str}"
-        cached = cache.get_key(cache_key)
-
-        if cached:
-            print(f"[CACHE HIT] Resposta para '{domain}' encontrada no cache.")
-                
-            header = DNSHeader(id=transaction_id, qr=1, aa=1, rcode=0) # qr=1: Resposta; aa=1: Autoritativa
-            question = DNSQuestion(domain, qtype_val)
-            reply = DNSRecord(header, q=question)
-
-            for record in cached:
-                reply.add_answer(RR(
-                    rname = domain,
-                    rtype = QTYPE_MAP.get(record['type'], 1),
-                    rclass = 1,
-                    ttl = record['ttl'],
-                    rdata = A(record['address'])
-                ))
-                
-            server_socket.sendto(reply.pack(), addr)
-            return
-
-        # 4. Se não está bloqueado nem em cache, consultar o servidor upstream
-        print(f"[FORWARD] Encaminhando '{domain}' para {UPSTREAM_DNS[0]}...")
-        upstream_response_bytes = query_upstream(domain, qtype_str, transaction_id)
+        # 5. Se não está bloqueado, nem é local, nem está em cache, perguntar ao nó dono do nome
+        #    (cache cooperativo) e, se ele não responder, ao servidor upstream
+        fonte = "par"
+        upstream_response_bytes = pares.consultar(domain, qtype_val, transaction_id) if pares is not None else None
+        if rastreio and pares is not None and pares.ativo:
+            t = rastreador.marcar("par", t)
+        if upstream_response_bytes is None:
+            fonte = "upstream"
+            query_log.registrar("INFO", "FORWARD", cliente=addr[0], dominio=domain, tipo=qtype_str,
+                                upstream=config.UPSTREAM_DNS[0])
+            upstream_response_bytes = query_upstream(domain, qtype_val, transaction_id)
+            if rastreio:
+                t = rastreador.marcar("upstream", t)
 
         if upstream_response_bytes:
-            # 5. Enviar resposta do upstream diretamente ao cliente
+            # 6. Enviar resposta do upstream diretamente ao cliente
             server_socket.sendto(upstream_response_bytes, addr)
+            if rastreio:
+                t = rastreador.marcar("envio", t)
+            _registrar_historico(historico, domain, qtype_str, fonte, addr, inicio)
             # E então, parsear a resposta para armazenar no cache
-            records, ttl = parse_response(upstream_response_bytes, qtype_str)
-            if records and ttl:
-                print(f"[CACHE SET] Armazenando resposta para '{domain}' no cache por {ttl}s.")
-                cache.set_key(cache_key, records, ttl)
+            # (todas as seções; CNAMEs e o destino também ficam reaproveitáveis por outros nomes)
+            records, _ = parse_response(upstream_response_bytes)
+            ttl = cache.set_resposta(domain, qtype_str, records, rcode=upstream_response_bytes[3] & 0x0F)
+            if rastreio:
+                rastreador.marcar("cache_set", t)
+            if ttl:
+                query_log.registrar("DEBUG", "CACHE SET", dominio=domain, tipo=qtype_str, ttl=ttl)
         else:
-            print(f"[ERROR] Falha ao obter resposta do upstream para '{domain}'.")
+            query_log.registrar("ERROR", "ERROR", motivo="falha no upstream", cliente=addr[0], dominio=domain)
     except Exception as e:
-        print(f"Erro ao processar requisição de {addr}: {e}")
+        query_log.registrar("ERROR", "ERROR", motivo=str(e), cliente=addr[0])
 
 def start_server(host = "0.0.0.0", port = 5353):
     """
     Inicializa o servidor DNS, o cache e a blocklist, e inicia o loop de escuta.
     """
     print("Iniciando o servidor DNS...")
+    inicio_servidor = time.perf_counter()
 
-    cache = DNSCache(tamanho_maximo_bytes=50 * 1024)  # cache com 50 KB
-    blocklist = blocklist_cache() # Pode demorar no primeiro download
+    cache = DNSCache(tamanho_maximo_bytes=config.CACHE_TAMANHO_MAXIMO_BYTES, cache_file_path=config.CACHE_ARQUIVO)
+    # A blocklist é carregada em segundo plano: a porta abre sem esperar o download
+    # (enquanto isso vale BLOCKLIST_FALHA_ABERTA)
+    blocklist = blocklist_cache(segundo_plano=True)
+    historico = HistoricoConsultas()  # Histórico persistente, compartilhado com o painel web
+    zonas = ZonasLocais()             # Hosts e zonas locais (LOCAL_HOSTS_ARQUIVOS / LOCAL_ZONAS_ARQUIVOS)
+    limitador = LimitadorTaxa()       # Desativado com LIMITE_ATIVO = False
+    pares = CachePares(cache)         # Cache cooperativo entre servidores (PARES / PARES_LOCAL)
+
+    # Aquecimento do cache com os nomes mais populares (AQUECIMENTO_FONTE)
+    aquecimento = AquecimentoCache(cache, blocklist)
+    dominios_aquecimento = aquecimento.dominios_configurados(historico)
+    if dominios_aquecimento and config.AQUECIMENTO_BLOQUEANTE:
+        aquecimento.executar(dominios_aquecimento)
 
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
 
     try:
         server_socket.bind((host, port))
-        print(f"Servidor DNS escutando em {host}:{port}")
+        print(f"Servidor DNS escutando em {host}:{port} "
+              f"({(time.perf_counter() - inicio_servidor) * 1000:.0f} ms após o início)")
     except PermissionError:
         print(f"Erro de permissão para vincular à porta {port}. Tente uma porta > 1024 ou execute como root.")
         return
@@ -94,24 +208,153 @@ def start_server(host = "0.0.0.0", port = 5353):
         print(f"Erro ao vincular à porta {port}: {e}")
         return
 
+    if dominios_aquecimento and not config.AQUECIMENTO_BLOQUEANTE:
+        aquecimento.iniciar(dominios_aquecimento)
+
+    # Estado lido pelo /ready/ do painel: gravado ao abrir a porta e a cada carga da blocklist
+    def escrever_estado():
+        try:
+            escrever_estado_servidor({"pid": os.getpid(), "host": host, "porta": port,
+                                      "blocklist": blocklist.estado(), "atualizado": time.time()})
+        except OSError as e:
+            print(f"Erro ao gravar o estado do servidor em {config.SERVIDOR_ARQUIVO_ESTADO}: {e}")
+
+    blocklist.ao_atualizar = escrever_estado
+    escrever_estado()
+
+    # Tempo até a primeira resposta enviada (cache/blocklist no loop ou upstream no pool)
+    primeira_resposta = threading.Event()
+
+    def marcar_primeira_resposta(origem):
+        if not primeira_resposta.is_set():
+            primeira_resposta.set()
+            print(f"Primeira resposta ({origem}) enviada "
+                  f"{(time.perf_counter() - inicio_servidor) * 1000:.0f} ms após o início")
+
+    def processar_upstream(pacote, addr):
+        handle_client(pacote, addr, server_socket, cache, blocklist, historico, False, pares=pares)
+        marcar_primeira_resposta("upstream")
+
+    # Pool fixo de trabalhadores para as consultas que dependem do upstream
+    pool = PoolTrabalhadores(processar_upstream, server_socket)
+
+    pares.iniciar()
+
+    # Recarga da configuração sem reiniciar: kill -HUP <pid> (ou pelo painel web, que envia o sinal)
+    recarregador = Recarregador(blocklist, zonas, limitador, pool, pares, rastreador)
+    # Captura de perfil sob demanda: kill -USR1 <pid> (ou pelo painel web)
+    rastreador.instalar_sigusr1()
+    if recarregador.instalar_sighup():
+        with open(config.SERVIDOR_ARQUIVO_PID, "w", encoding="utf-8") as f:
+            f.write(str(os.getpid()))
+
+    # Buffers de recepção pré-alocados, reaproveitados a cada lote (sem alocar bytes por pacote)
+    buffers = [bytearray(config.SERVIDOR_TAMANHO_BUFFER) for _ in range(config.SERVIDOR_LOTE)]
+    views = [memoryview(buffer) for buffer in buffers]
+
+    # Depois do primeiro pacote, os seguintes do lote são lidos sem bloquear.
+    # Sem MSG_DONTWAIT (ex: Windows) o lote tem um único pacote.
+    flag_sem_espera = getattr(socket, "MSG_DONTWAIT", None)
+    tamanho_lote = config.SERVIDOR_LOTE if flag_sem_espera is not None else 1
+
     # Loop de execução infinito para receber consultas
     while True:
         try:
-            data, addr = server_socket.recvfrom(4096)
-
-            # Usamos multithread para atendermos múltiplas requisições simultaneamente
-            client_thread = threading.Thread (
-                target = handle_client, # Função que a thread vai realizar
-                args = (data, addr, server_socket, cache, blocklist)
-            )
-            client_thread.daemon = True # Garantindo que a thread não bloqueie a finalização do programa
-            client_thread.start()       # Inicializa
-        
+            # 1. Drena até 'tamanho_lote' pacotes já disponíveis no socket
+            recebidos = []
+            for i in range(tamanho_lote):
+                try:
+                    if i == 0:
+                        n, addr = server_socket.recvfrom_into(buffers[i])
+                    else:
+                        n, addr = server_socket.recvfrom_into(buffers[i], 0, flag_sem_espera)
+                except BlockingIOError:
+                    break
+                recebidos.append((views[i][:n], addr))
+
+            # 2. Responde direto do buffer o que não precisa do upstream (blocklist, dados locais e cache).
+            # O erro de um pacote não pode descartar os outros do lote.
+            respostas = []
+            for pacote, addr in recebidos:
+                try:
+                    resposta = responder_local(pacote, addr, cache, blocklist, historico, zonas, limitador)
+                    if resposta is None:
+                        # As consultas que dependem do upstream vão para a fila do pool de trabalhadores.
+                        # O pacote é copiado, pois o buffer será reutilizado no próximo lote.
+                        pool.enviar(bytes(pacote), addr)
+                    elif resposta:
+                        respostas.append((resposta, addr))
+                except Exception as e:
+                    query_log.registrar("ERROR", "ERROR", motivo=str(e), cliente=addr[0])
+
+            # 3. Envia as respostas do lote de uma vez
+            rastreio = rastreador.ativo
+            for resposta, addr in respostas:
+                if rastreio:
+                    t = time.perf_counter()
+                try:
+                    server_socket.sendto(resposta, addr)
+                except OSError as e:
+                    query_log.registrar("ERROR", "ERROR", motivo=str(e), cliente=addr[0])
+                    continue
+                if rastreio:
+                    rastreador.marcar("envio", t)
+            if respostas and not primeira_resposta.is_set():
+                marcar_primeira_resposta("local")
+
         except KeyboardInterrupt:
             print(f"\nServidor sendo desligado...")
             break
         except Exception as e:
-            print(f"Ocorreu um erro: {e}")
+            query_log.registrar("ERROR", "ERROR", motivo=str(e))
 
+    aquecimento.parar()
+    pares.parar()
+    pool.parar()
     server_socket.close()
-    print("Servidor desligado.")
\ No newline at end of file
+    for arquivo in (config.SERVIDOR_ARQUIVO_PID, config.SERVIDOR_ARQUIVO_ESTADO):
+        if os.path.exists(arquivo):
+            os.remove(arquivo)
+    query_log.fechar()
+    historico.fechar()
+    print(f"Log de consultas: {query_log.estatisticas()}")
+    print(f"Cache: {cache.estatisticas()}")
+    print(f"Pool de trabalhadores: {pool.estatisticas()}")
+    print(f"Limite de taxa: {limitador.estatisticas()}")
+    if pares.ativo:
+        print(f"Cache cooperativo: {pares.estatisticas()}")
+    if config.MODO_RESOLUCAO == "recursivo":
+        print(f"Resolvedor recursivo: {resolvedor_recursivo().estatisticas()}")
+    etapas = rastreador.estatisticas()
+    if etapas:
+        print("Tempo por etapa (µs):")
+        for etapa, resumo in etapas.items():
+            print(f"  {etapa:<16}{resumo['quantidade']:>9} consultas  média {resumo['media_us']:>9}"
+                  f"  p50 <{resumo['p50_us']:>7}  p99 <{resumo['p99_us']:>7}")
+    print("Servidor desligado.")
+
+
+if __name__ == "__main__":
+    # Execução direta: python -m dns_app.backend.dns_server (a partir de servidor_dns/)
+    # Os argumentos sobrescrevem o config.py (e continuam valendo depois de uma recarga por SIGHUP)
+    parser = argparse.ArgumentParser(description="Servidor DNS com cache e blocklist.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--porta", type=int, default=5353)
+    parser.add_argument("--upstream", default=None, help="Servidor upstream (host:porta)")
+    parser.add_argument("--pares", default=None, help="Nós do cache cooperativo, separados por vírgula (host:porta)")
+    parser.add_argument("--par-local", default=None, help="Endereço deste nó na lista de pares (host:porta)")
+    parser.add_argument("--cache-arquivo", default=None, help="Arquivo do cache em disco (vazio: não persiste)")
+    parser.add_argument("--pid", default=None, help="Arquivo com o PID do servidor")
+    parser.add_argument("--estado", default=None, help="Arquivo com o estado do servidor (lido pelo /ready/)")
+    args = parser.parse_args()
+
+    ambiente = {"DNS_UPSTREAM": args.upstream, "DNS_PARES": args.pares, "DNS_PARES_LOCAL": args.par_local,
+                "DNS_CACHE_ARQUIVO": args.cache_arquivo, "DNS_ARQUIVO_PID": args.pid,
+                "DNS_ARQUIVO_ESTADO": args.estado}
+    for variavel, valor in ambiente.items():
+        if valor is not None:
+            os.environ[variavel] = valor
+    for nome, valor in ler_config().items():
+        setattr(config, nome, valor)
+
+    start_server(args.host, args.porta)
@@ -0,0 +1,415 @@
+import socket
+import struct
+import threading
+import heapq
+import random
+import time
+import zlib
+import math
+import argparse
+from contextlib import contextmanager
+
+from dnslib import DNSRecord, RR, QTYPE, RCODE, A, AAAA
+
+from . import config
+
+# Servidor upstream local e determinístico, usado nos testes de desempenho.
+# Responde a partir de um arquivo de zona ou de dados gerados a partir do nome
+# consultado, simulando latência, perda, truncamento e NXDOMAIN de forma reproduzível.
+
+
+def parse_latencia(especificacao):
+
+    """
+    Converte uma especificação de latência (em ms) em uma função que sorteia atrasos em segundos.
+
+    Formatos aceitos:
+    - "0" ou "fixa:10"          -> sempre 10 ms
+    - "uniforme:5:50"           -> uniforme entre 5 e 50 ms
+    - "exponencial:20"          -> exponencial com média de 20 ms
+    - "lognormal:20:0.5"        -> lognormal com mediana de 20 ms e sigma 0.5
+    """
+
+    partes = str(especificacao).split(":")
+    tipo = partes[0]
+
+    if len(partes) == 1:
+        fixo = float(tipo) / 1000
+        return lambda rnd: fixo
+    if tipo == "fixa":
+        fixo = float(partes[1]) / 1000
+        return lambda rnd: fixo
+    if tipo == "uniforme":
+        minimo, maximo = float(partes[1]) / 1000, float(partes[2]) / 1000
+        return lambda rnd: rnd.uniform(minimo, maximo)
+    if tipo == "exponencial":
+        media = float(partes[1]) / 1000
+        return lambda rnd: rnd.expovariate(1 / media) if media > 0 else 0.0
+    if tipo == "lognormal":
+        mu, sigma = math.log(float(partes[1]) / 1000), float(partes[2])
+        return lambda rnd: rnd.lognormvariate(mu, sigma)
+
+    raise ValueError(f"Distribuição de latência desconhecida: {especificacao}")
+
+
+class StubUpstream:
+
+    def __init__(self, host="127.0.0.1", port=0, zona=None, gerar=True, latencia="0",
+                 perda=0.0, truncamento=0.0, nxdomain=0.0, ttl=300, semente=0):
+
+        """
+        Inicializa o servidor stub.
+
+        - zona: caminho de um arquivo de zona (formato BIND simples) com os registros a servir.
+        - gerar: responde nomes fora da zona com registros A/AAAA derivados do próprio nome.
+        - latencia: especificação aceita por parse_latencia.
+        - perda, truncamento, nxdomain: proporções entre 0 e 1.
+        - port=0 escolhe uma porta livre (consulte self.address após start()).
+        - semente: cada thread sorteia do próprio gerador, derivado dela (a thread UDP e cada
+          conexão TCP), então a mesma semente com a mesma sequência de consultas se repete.
+        """
+
+        self.host = host
+        self.port = port
+        self.gerar = gerar
+        self.sortear_latencia = parse_latencia(latencia)
+        self.perda = perda
+        self.truncamento = truncamento
+        self.nxdomain = nxdomain
+        self.ttl = ttl
+        self.semente = semente
+        self.random = random.Random(f"{semente}:udp")   # Só da thread UDP: perda, truncamento e latência
+        self._conexoes_tcp = 0
+
+        # Registros da zona indexados por (nome, tipo)
+        self.registros = {}
+        self.nomes = set()
+        self.autoritativo = False   # Zona com SOA: responde como autoritativo e com referrals
+        if zona:
+            self.carregar_zona(zona)
+
+        # Contadores usados pelos testes (ex: quantas consultas chegaram ao upstream)
+        self.consultas_udp = 0
+        self.consultas_tcp = 0
+        self.descartadas = 0
+        self._lock = threading.Lock()
+
+        # Fila de respostas atrasadas: (instante de envio, sequência, pacote, endereço)
+        self._pendentes = []
+        self._cond = threading.Condition()
+        self._seq = 0
+
+        self._rodando = False
+        self._threads = []
+        self.udp_socket = None
+        self.tcp_socket = None
+
+    def carregar_zona(self, caminho):
+
+        """
+        Carrega um arquivo de zona e indexa os registros por nome e tipo.
+        """
+
+        with open(caminho, "r", encoding="utf-8") as f:
+            for rr in RR.fromZone(f.read()):
+                nome = str(rr.rname).lower()
+                self.registros.setdefault((nome, rr.rtype), []).append(rr)
+                self.nomes.add(nome)
+                if rr.rtype == QTYPE.SOA:
+                    self.autoritativo = True
+
+    @property
+    def address(self):
+        return (self.host, self.port)
+
+    def start(self):
+
+        """
+        Abre os sockets UDP e TCP e inicia as threads de atendimento.
+        """
+
+        self.udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp_socket.bind((self.host, self.port))
+        self.port = self.udp_socket.getsockname()[1]
+
+        self.tcp_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.tcp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.tcp_socket.bind((self.host, self.port))
+        self.tcp_socket.listen(64)
+
+        self._rodando = True
+        for alvo in (self._loop_udp, self._loop_tcp, self._loop_envio):
+            t = threading.Thread(target=alvo, daemon=True)
+            t.start()
+            self._threads.append(t)
+
+        print(f"Stub upstream escutando em {self.host}:{self.port} (UDP/TCP)")
+        return self
+
+    def stop(self):
+
+        """
+        Encerra as threads e fecha os sockets.
+        """
+
+        self._rodando = False
+        with self._cond:
+            self._cond.notify_all()
+        for sock in (self.udp_socket, self.tcp_socket):
+            try:
+                sock.close()
+            except Exception:
+                pass
+        for t in self._threads:
+            t.join(timeout=1)
+        self._threads = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @contextmanager
+    def como_upstream(self):
+
+        """
+        Aponta config.UPSTREAM_DNS para este stub enquanto o bloco estiver ativo.
+        """
+
+        anterior = config.UPSTREAM_DNS
+        config.UPSTREAM_DNS = self.address
+        try:
+            yield self
+        finally:
+            config.UPSTREAM_DNS = anterior
+
+    def _fracao(self, nome, sal):
+
+        """
+        Retorna um valor determinístico em [0, 1) para o nome, usado nas proporções por nome.
+        """
+
+        return (zlib.crc32(f"{sal}:{nome}".encode()) & 0xFFFFFFFF) / 2**32
+
+    def responder(self, data, via_tcp=False):
+
+        """
+        Monta a resposta para uma consulta. Retorna None se a consulta deve ser descartada.
+        """
+
+        try:
+            request = DNSRecord.parse(data)
+        except Exception:
+            return None
+
+        nome = str(request.q.qname).lower()
+        qtype = request.q.qtype
+        reply = request.reply()
+
+        if not via_tcp and self.truncamento and self.random.random() < self.truncamento:
+            # Resposta truncada sem registros: o cliente deve repetir via TCP
+            reply.header.tc = 1
+            return reply.pack()
+
+        # NXDOMAIN é decidido por nome, para que o mesmo nome tenha sempre a mesma resposta
+        if self.nxdomain and self._fracao(nome, "nx") < self.nxdomain:
+            reply.header.rcode = RCODE.NXDOMAIN
+            return reply.pack()
+
+        # Hierarquia de teste (raiz/TLD/autoritativo, zonas com SOA): nomes abaixo de uma
+        # zona delegada recebem um referral (NS na autoridade e glue na seção adicional)
+        delegacao, soa = self._zona(nome) if self.autoritativo else (None, None)
+        if delegacao:
+            reply.header.aa = 0
+            for rr in delegacao:
+                reply.add_auth(rr)
+                for glue in self.registros.get((str(rr.rdata.label).lower(), QTYPE.A), []):
+                    reply.add_ar(glue)
+            return reply.pack()
+
+        registros = self._seguir_cname(nome, qtype)
+
+        if registros:
+            for rr in registros:
+                reply.add_answer(rr)
+        elif nome in self.nomes:
+            if soa:
+                reply.add_auth(soa[0])   # NODATA com o SOA, como um autoritativo
+        elif soa and not self.gerar:
+            reply.header.rcode = RCODE.NXDOMAIN
+            reply.add_auth(soa[0])
+        elif self.gerar and qtype in (QTYPE.A, QTYPE.AAAA):
+            semente = zlib.crc32(nome.encode())
+            if qtype == QTYPE.A:
+                rdata = A(socket.inet_ntoa(struct.pack("!I", (10 << 24) | (semente & 0xFFFFFF))))
+            else:
+                rdata = AAAA(socket.inet_ntop(socket.AF_INET6, b"\xfd\x00" + b"\x00" * 10 + struct.pack("!I", semente)))
+            reply.add_answer(RR(request.q.qname, qtype, rdata=rdata, ttl=self.ttl))
+        elif not self.gerar:
+            reply.header.rcode = RCODE.NXDOMAIN
+
+        return reply.pack()
+
+    def _zona(self, nome):
+
+        """
+        Procura, do nome para a raiz, a zona que o contém. Retorna (NS da delegação, None) se ele
+        estiver numa zona filha delegada, (None, SOA) se estiver numa zona com SOA servida aqui,
+        ou (None, None).
+        """
+
+        rotulos = nome.rstrip(".").split(".")
+        for i in range(len(rotulos) + 1):
+            zona = ".".join(rotulos[i:]) + "." if i < len(rotulos) else "."
+            soa = self.registros.get((zona, QTYPE.SOA))
+            if soa:
+                return None, soa
+            ns = self.registros.get((zona, QTYPE.NS))
+            if ns:
+                return ns, None
+        return None, None
+
+    def _seguir_cname(self, nome, qtype, limite=8):
+
+        """
+        Retorna os registros do nome, seguindo cadeias CNAME dentro da zona.
+        """
+
+        registros = []
+        for _ in range(limite):
+            encontrados = self.registros.get((nome, qtype))
+            if encontrados:
+                return registros + encontrados
+            cname = self.registros.get((nome, QTYPE.CNAME)) if qtype != QTYPE.CNAME else None
+            if not cname:
+                return registros
+            registros.append(cname[0])
+            nome = str(cname[0].rdata.label).lower()
+        return registros
+
+    def _agendar(self, pacote, addr):
+
+        """
+        Coloca a resposta na fila de envio respeitando a latência sorteada (chamado pela thread UDP).
+        """
+
+        with self._cond:
+            atraso = self.sortear_latencia(self.random)
+            self._seq += 1
+            heapq.heappush(self._pendentes, (time.monotonic() + atraso, self._seq, pacote, addr))
+            self._cond.notify()
+
+    def _loop_envio(self):
+        while self._rodando:
+            with self._cond:
+                while self._rodando and not self._pendentes:
+                    self._cond.wait()
+                if not self._rodando:
+                    return
+                envio, _, pacote, addr = self._pendentes[0]
+                espera = envio - time.monotonic()
+                if espera > 0:
+                    self._cond.wait(espera)
+                    continue
+                heapq.heappop(self._pendentes)
+            try:
+                self.udp_socket.sendto(pacote, addr)
+            except OSError:
+                pass
+
+    def _loop_udp(self):
+        while self._rodando:
+            try:
+                data, addr = self.udp_socket.recvfrom(4096)
+            except OSError:
+                return
+
+            with self._lock:
+                self.consultas_udp += 1
+                perdida = self.perda and self.random.random() < self.perda
+                if perdida:
+                    self.descartadas += 1
+            if perdida:
+                continue
+
+            resposta = self.responder(data)
+            if resposta is not None:
+                self._agendar(resposta, addr)
+
+    def _loop_tcp(self):
+        while self._rodando:
+            try:
+                conn, _ = self.tcp_socket.accept()
+            except OSError:
+                return
+            self._conexoes_tcp += 1
+            rnd = random.Random(f"{self.semente}:tcp:{self._conexoes_tcp}")
+            threading.Thread(target=self._atender_tcp, args=(conn, rnd), daemon=True).start()
+
+    def _atender_tcp(self, conn, rnd):
+
+        """
+        Atende uma conexão TCP (mensagens prefixadas com 2 bytes de tamanho), sorteando a
+        latência com o gerador 'rnd' da própria conexão.
+        """
+
+        try:
+            with conn:
+                while self._rodando:
+                    cabecalho = _receber_exato(conn, 2)
+                    if not cabecalho:
+                        return
+                    data = _receber_exato(conn, struct.unpack("!H", cabecalho)[0])
+                    if not data:
+                        return
+                    with self._lock:
+                        self.consultas_tcp += 1
+                    resposta = self.responder(data, via_tcp=True)
+                    if resposta is None:
+                        return
+                    time.sleep(self.sortear_latencia(rnd))
+                    conn.sendall(struct.pack("!H", len(resposta)) + resposta)
+        except OSError:
+            pass
+
+
+def _receber_exato(conn, tamanho):
+
+    """
+    Lê exatamente 'tamanho' bytes de uma conexão TCP (ou b"" se ela for fechada).
+    """
+
+    dados = b""
+    while len(dados) < tamanho:
+        parte = conn.recv(tamanho - len(dados))
+        if not parte:
+            return b""
+        dados += parte
+    return dados
+
+
+if __name__ == "__main__":
+    # Execução direta: python -m dns_app.backend.dns_stub --porta 5300 (a partir de servidor_dns/)
+    # e então DNS_UPSTREAM=127.0.0.1:5300 python -m dns_app.backend.dns_server
+    parser = argparse.ArgumentParser(description="Servidor DNS upstream local para testes de desempenho.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=5300)
+    parser.add_argument("--zona", default=None, help="Arquivo de zona com os registros a servir")
+    parser.add_argument("--sem-gerar", action="store_true", help="Responde NXDOMAIN para nomes fora da zona")
+    parser.add_argument("--latencia", default="0", help="Ex: 10, uniforme:5:50, exponencial:20, lognormal:20:0.5 (ms)")
+    parser.add_argument("--perda", type=float, default=0.0, help="Proporção de consultas UDP descartadas")
+    parser.add_argument("--truncamento", type=float, default=0.0, help="Proporção de respostas UDP truncadas")
+    parser.add_argument("--nxdomain", type=float, default=0.0, help="Proporção de nomes respondidos com NXDOMAIN")
+    parser.add_argument("--semente", type=int, default=0)
+    args = parser.parse_args()
+
+    stub = StubUpstream(args.host, args.porta, zona=args.zona, gerar=not args.sem_gerar,
+                        latencia=args.latencia, perda=args.perda, truncamento=args.truncamento,
+                        nxdomain=args.nxdomain, semente=args.semente).start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\nStub sendo desligado...")
+        stub.stop()
@@ -5,4 +5,10 @@ urlpatterns = [
     path('', views.index, name='index'),
     path('query/', views.query_domain, name='query_domain'),
     path('vazao_json/', views.vazao_json, name='vazao_json'),
+    path('recarregar/', views.recarregar, name='recarregar'),
+    path('cache/', views.cache_json, name='cache_json'),
+    path('cache/limpar/', views.cache_limpar, name='cache_limpar'),
+    path('health/', views.health, name='health'),
+    path('ready/', views.ready, name='ready'),
+    path('perfil/', views.perfil, name='perfil'),
 ]
@@ -1,43 +1,54 @@
 from django.shortcuts import render
 from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 from .backend.dns_functions import query_upstream, parse_response 
 from .backend.dns_cache import DNSCache                              
 from .backend.dns_blocklist import blocklist_cache                  
+from .backend.dns_historico import HistoricoConsultas
+from .backend.dns_recarga import Recarregador, sinalizar_servidor, ler_estado_servidor
+from .backend import config
 import time
-from datetime import datetime
 
-cache = DNSCache(tamanho_maximo_bytes=50*1024)  # Cache com tamanho máximo de 50 KB
-blocklist = blocklist_cache()                   # Blocklist de domínios
+cache = DNSCache(tamanho_maximo_bytes=config.CACHE_TAMANHO_MAXIMO_BYTES)  # Mesmo limite do servidor DNS
+blocklist = blocklist_cache(segundo_plano=True)  # Blocklist de domínios (carregada em segundo plano)
+
+historico = HistoricoConsultas()                # Histórico persistente de consultas (SQLite)
+recarregador = Recarregador(blocklist=blocklist)  # Recarga da configuração do painel
 
 # Contadores globais
 cache_hit_count = 0      # Contador de acertos no cache
 upstream_hit_count = 0   # Contador de consultas ao servidor upstream
-history = []             # Armazena últimos N acessos (histórico de consultas)
 
 def query_domain(request):
     """
     Consulta de domínio via formulário.
     Retorna resultado renderizado em template HTML.
     """
-    global cache_hit_count, upstream_hit_count, history
+    global cache_hit_count, upstream_hit_count
 
     result = None
     domain = request.GET.get('domain')          # Obtém domínio da requisição GET
-    qtype = request.GET.get('type', 'A')        # Tipo de consulta, padrão 'A'
-    cache_key = f"{domain}|{qtype}" if domain else None
+    qtype = request.GET.get('type', 'A').upper()  # Tipo de consulta, padrão 'A'
+    # Chave do cache no mesmo formato do servidor DNS: nome em minúsculas, com ponto final
+    cache_name = f"{domain.strip().lower().rstrip('.')}." if domain else None
     elapsed_time = None
     source = "upstream"                         # Fonte inicial (upstream)
 
     if domain:
         start_time = time.time()
         
-        if blocklist.is_blocked(domain):
+        if not blocklist.carregada and not config.BLOCKLIST_FALHA_ABERTA:
+            result = "Blocklist ainda carregando; tente novamente em instantes."
+            source = "blocklist"
+        elif blocklist.is_blocked(domain):
             result = f"Domínio {domain} está bloqueado!"
+            source = "blocklist"
         else:
-            cached = cache.get_key(cache_key)   # Tenta obter do cache local
+            cached = cache.get_resposta(cache_name, qtype)   # Tenta obter do cache local (inclusive via CNAME)
             
-            if cached:
-                result = cached
+            if cached and cached["value"]:
+                result = cached["value"]
                 source = "cache"
                 cache_hit_count += 1
             else:
@@ -48,14 +59,11 @@ def query_domain(request):
                     registros, ttl = parse_response(resposta_bytes, qtype)
                     
                     if registros:
-                        if ttl is None:
-                            ttl = 60  # TTL padrão
-
                         # Adiciona tipo de consulta aos registros
                         for r in registros:
                             r['qtype'] = qtype
 
-                        cache.set_key(cache_key, registros, ttl)  # Armazena no cache
+                        cache.set_resposta(cache_name, qtype, registros)  # Armazena no cache
                         result = registros
                     else:
                         result = f"Nenhum registro válido encontrado para {domain} ({qtype})"
@@ -65,16 +73,9 @@ def query_domain(request):
 
         elapsed_time = time.time() - start_time  # Calcula tempo de consulta
 
-        history.append({
-            'domain': domain,
-            'qtype': qtype,
-            'source': source,
-            'result': result,
-            'elapsed_time': f"{elapsed_time:.2f}s" if elapsed_time else None,
-            'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        })
-        # Mantém apenas os últimos 20 registros
-        history = history[-20:]
+        # Registra no histórico persistente (gravação em segundo plano)
+        historico.registrar(domain, qtype, source, cliente=request.META.get('REMOTE_ADDR'),
+                            latencia_ms=elapsed_time * 1000)
 
     # Renderiza resultado no template HTML
     return render(request, 'dns_app/query_result.html', {
@@ -92,45 +93,24 @@ def index(request):
 
     """
     Página inicial mostrando:
-    - Estado do cache
+    - Estado do cache (uma página por vez)
     - Quantidade de domínios bloqueados
     - Histórico de consultas
     - Contadores de hits
     """
 
-    display_cache = {}
-    keys_to_delete = []
-
-    # Itera sobre cache para exibir registros válidos e remover expirados
-    for key, entry in cache.cache.items():
-        time_left = entry['expire_at'] - datetime.now().timestamp()
-        if time_left <= 0:
-            keys_to_delete.append(key)
-            continue
-
-        # Extrai nome de domínio e tipo de consulta
-        domain_name, qtype = key.split('|', 1)
-        registros = entry['value']
-        formatted_records = []
-
-        for r in registros:
-            formatted_records.append({
-                'name': r['name'],
-                'address': r['address'],
-                'qtype': qtype,
-                'time_left': int(time_left)
-            })
-        display_cache[key] = formatted_records
-
-    # Remove entradas expiradas do cache
-    for key in keys_to_delete:
-        cache.remove(key)
+    # Uma página do cache por vez (custo proporcional à página, não ao tamanho do cache)
+    pagina = cache.listar(cursor=request.GET.get('cursor'), limite=50)
 
     # Renderiza página inicial
     return render(request, 'dns_app/index.html', {
-        'cache': display_cache,
+        'cache': pagina['entradas'],
+        'cache_total': pagina['total'],
+        'cache_proximo': pagina['proximo'],
         'blocked_domains_count': len(blocklist.blocked_domains),
-        'history': history,
+        'history': historico.ultimas(20),
+        'top_domains': historico.top_dominios(quantidade=10),
+        'top_blocked': historico.top_bloqueados(quantidade=10),
         'cache_hit_count': cache_hit_count,
         'upstream_hit_count': upstream_hit_count
     })
@@ -161,3 +141,126 @@ def vazao_json(request):
         'vazao_cache': f"{vazao_cache:.2f} req/s",
         'vazao_upstream': f"{vazao_upstream:.2f} req/s"
     })
+
+
+def cache_json(request):
+
+    """
+    Lista o cache em JSON, paginado por cursor: ?cursor=&limite=&prefixo=&dominio=&tipo=
+    Cada entrada traz os registros, o TTL restante e quantas vezes foi usada.
+    """
+
+    try:
+        limite = int(request.GET.get('limite', 50))
+    except ValueError:
+        return JsonResponse({'erro': 'limite inválido'}, status=400)
+
+    tipo = request.GET.get('tipo')
+    return JsonResponse(cache.listar(
+        cursor=request.GET.get('cursor'),
+        limite=limite,
+        prefixo=request.GET.get('prefixo'),
+        dominio=request.GET.get('dominio'),
+        qtype=tipo.upper() if tipo else None,
+    ))
+
+
+@csrf_exempt
+@require_POST
+def cache_limpar(request):
+
+    """
+    Remove entradas do cache por nome exato, por sufixo (domínio e subdomínios) e/ou tipo.
+    Sem filtros é preciso enviar tudo=1. Aceito apenas a partir da própria máquina.
+    """
+
+    if request.META.get('REMOTE_ADDR') not in ('127.0.0.1', '::1'):
+        return JsonResponse({'erro': 'permitido apenas a partir da própria máquina'}, status=403)
+
+    nome = request.POST.get('nome')
+    sufixo = request.POST.get('sufixo')
+    tipo = request.POST.get('tipo')
+    if not (nome or sufixo or tipo or request.POST.get('tudo')):
+        return JsonResponse({'erro': 'informe nome, sufixo, tipo ou tudo=1'}, status=400)
+
+    removidas = cache.limpar(nome=nome, sufixo=sufixo, qtype=tipo.upper() if tipo else None)
+    return JsonResponse({'removidas': removidas, 'total': len(cache.cache)})
+
+
+def health(request):
+
+    """
+    Liveness: o processo está no ar e atendendo requisições (sempre 200).
+    """
+
+    return JsonResponse({'status': 'ok'})
+
+
+def ready(request):
+
+    """
+    Readiness: 200 quando o servidor DNS está em execução e as blocklists dele e do painel
+    terminaram de carregar; 503 enquanto carregam ou se o servidor não está no ar (o estado do
+    servidor vem do arquivo SERVIDOR_ARQUIVO_ESTADO). Uma carga que terminou sem nenhuma lista
+    (estado "sem_listas", ex: todos os downloads falharam) continua pronta, mas vem indicada.
+    """
+
+    servidor = ler_estado_servidor()
+    painel = blocklist.estado()
+    pronto = (servidor is not None and servidor['blocklist']['estado'] != 'carregando'
+              and painel['estado'] != 'carregando')
+    sem_listas = [nome for nome, estado in (('servidor', servidor and servidor['blocklist']), ('painel', painel))
+                  if estado and estado['estado'] == 'sem_listas']
+
+    return JsonResponse({
+        'pronto': pronto,
+        'servidor': servidor,
+        'painel': {'blocklist': painel},
+        'blocklist_sem_listas': sem_listas,
+        'falha_aberta': config.BLOCKLIST_FALHA_ABERTA,
+    }, status=200 if pronto else 503)
+
+
+@csrf_exempt
+@require_POST
+def recarregar(request):
+
+    """
+    Recarrega a configuração (config.py) sem reiniciar: no painel, em segundo plano,
+    e no servidor DNS em execução, enviando SIGHUP ao PID registrado por ele.
+    Aceito apenas a partir da própria máquina.
+    """
+
+    if request.META.get('REMOTE_ADDR') not in ('127.0.0.1', '::1'):
+        return JsonResponse({'erro': 'permitido apenas a partir da própria máquina'}, status=403)
+
+    recarregador.iniciar()
+    pid = sinalizar_servidor()
+    return JsonResponse({
+        'painel': 'recarga iniciada',
+        'servidor_dns': f'SIGHUP enviado (pid {pid})' if pid else 'servidor DNS não encontrado',
+        'ultima_recarga': recarregador.ultima,
+    }, status=202)
+
+
+@csrf_exempt
+@require_POST
+def perfil(request):
+
+    """
+    Pede ao servidor DNS em execução uma captura de perfil (SIGUSR1): pilhas amostradas e
+    histogramas por etapa durante RASTREIO_AMOSTRAGEM_S segundos, gravados em RASTREIO_DIRETORIO.
+    Aceito apenas a partir da própria máquina.
+    """
+
+    if request.META.get('REMOTE_ADDR') not in ('127.0.0.1', '::1'):
+        return JsonResponse({'erro': 'permitido apenas a partir da própria máquina'}, status=403)
+
+    pid = sinalizar_servidor(sinal="SIGUSR1")
+    if not pid:
+        return JsonResponse({'erro': 'servidor DNS não encontrado'}, status=404)
+    return JsonResponse({
+        'servidor_dns': f'captura iniciada (pid {pid})',
+        'segundos': config.RASTREIO_AMOSTRAGEM_S,
+        'diretorio': config.RASTREIO_DIRETORIO,
+    }, status=202)
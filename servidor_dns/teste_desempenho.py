@@ -0,0 +1,252 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+from dnslib import DNSRecord, DNSQuestion, RR, QTYPE, A
+
+from dns_app.backend.dns_functions import parse_query, parse_response
+from dns_app.backend.dns_blocklist import blocklist_cache
+from dns_app.backend.dns_regras import MotorRegras
+from dns_app.backend.dns_cache import DNSCache
+from dns_app.backend.dns_server import handle_client
+from dns_app.backend.dns_limite import LimitadorTaxa
+from dns_app.backend import config
+
+# Microbenchmarks dos caminhos críticos do servidor DNS.
+# Cada caso é executado em várias rodadas; o resultado é a mediana de ns por operação.
+# Os resultados podem ser salvos como baseline (JSON) e comparados em execuções futuras.
+
+RODADAS = 7                    # Rodadas por caso (a mediana é reportada)
+TEMPO_MINIMO_RODADA = 0.2      # Cada rodada executa o caso por pelo menos esse tempo (s)
+LIMITE_REGRESSAO = 0.15        # Regressão tolerada em relação à baseline (15%)
+DOMINIOS_BLOQUEADOS = 1_000_000
+
+
+class SocketFalso:
+
+    """
+    Substitui o socket do servidor no benchmark: apenas conta as respostas enviadas.
+    """
+
+    def __init__(self):
+        self.enviados = 0
+
+    def sendto(self, data, addr):
+        self.enviados += 1
+
+
+def medir(funcao, argumentos):
+
+    """
+    Mede o custo de 'funcao(*arg)' percorrendo ciclicamente a lista de argumentos.
+    Retorna um dicionário com a mediana e a dispersão em ns por operação.
+    """
+
+    total = len(argumentos)
+
+    # Calibra o tamanho do lote para que cada rodada dure pelo menos TEMPO_MINIMO_RODADA
+    lote = 1
+    while True:
+        inicio = time.perf_counter_ns()
+        for i in range(lote):
+            funcao(*argumentos[i % total])
+        decorrido = time.perf_counter_ns() - inicio
+        if decorrido >= TEMPO_MINIMO_RODADA * 1e9 or lote >= 10_000_000:
+            break
+        lote *= 2
+
+    amostras = []
+    for _ in range(RODADAS):
+        inicio = time.perf_counter_ns()
+        for i in range(lote):
+            funcao(*argumentos[i % total])
+        amostras.append((time.perf_counter_ns() - inicio) / lote)
+
+    mediana = statistics.median(amostras)
+    return {
+        "ns_por_op": round(mediana, 1),
+        "ops_por_s": round(1e9 / mediana, 1) if mediana else None,
+        "min_ns": round(min(amostras), 1),
+        "max_ns": round(max(amostras), 1),
+        "lote": lote,
+    }
+
+
+def gerar_dominios_bloqueados(quantidade, rnd):
+
+    """
+    Gera uma blocklist sintética com formato parecido com as listas reais:
+    muitos subdomínios de um conjunto menor de domínios registráveis.
+    """
+
+    tlds = ["com", "net", "org", "io", "com.br", "info", "xyz", "ru"]
+    prefixos = ["ads", "track", "pixel", "metrics", "cdn", "stats", "telemetry", "click", "adserver", "beacon"]
+    registraveis = [f"dominio{i}.{rnd.choice(tlds)}" for i in range(max(1, quantidade // 10))]
+
+    dominios = set()
+    while len(dominios) < quantidade:
+        base = rnd.choice(registraveis)
+        profundidade = rnd.choice((0, 1, 1, 1, 2))
+        partes = [f"{rnd.choice(prefixos)}{rnd.randrange(1000)}" for _ in range(profundidade)]
+        dominios.add(".".join(partes + [base]))
+    return dominios, registraveis
+
+
+def montar_resposta(dominio, enderecos):
+
+    """
+    Monta um pacote de resposta do tipo A com os endereços informados.
+    """
+
+    request = DNSRecord(q=DNSQuestion(dominio, QTYPE.A))
+    reply = request.reply()
+    for endereco in enderecos:
+        reply.add_answer(RR(dominio, QTYPE.A, rdata=A(endereco), ttl=300))
+    return reply.pack()
+
+
+def preparar_casos(dominios_bloqueados):
+
+    """
+    Cria os dados de entrada de cada caso e retorna {nome: (funcao, argumentos)}.
+    """
+
+    rnd = random.Random(42)
+    nomes = [f"www.site{i}.com" for i in range(1000)]
+    consultas = [DNSRecord(q=DNSQuestion(nome, QTYPE.A)).pack() for nome in nomes]
+    respostas = [montar_resposta(nome, [f"10.0.{i % 256}.{j}" for j in range(1, 5)])
+                 for i, nome in enumerate(nomes)]
+
+    casos = {}
+
+    # 1. Parsing de consultas e respostas
+    casos["parse_query"] = (parse_query, [(c,) for c in consultas])
+    casos["parse_response"] = (parse_response, [(r, "A") for r in respostas])
+
+    # 2. Blocklist com lista grande: metade das consultas são subdomínios bloqueados, metade não
+    print(f"Gerando blocklist sintética com {dominios_bloqueados} domínios...")
+    bloqueados, registraveis = gerar_dominios_bloqueados(dominios_bloqueados, rnd)
+    # Sem o cache de resultados por nome: os argumentos se repetem em ciclo, e com ele o caso mediria
+    # só acertos do LRU (e deixaria de ser comparável com baselines antigas)
+    config.BLOCKLIST_CACHE_NOMES = 0
+    blocklist = blocklist_cache(dominios=bloqueados)
+    amostra_bloqueados = rnd.sample(sorted(bloqueados), 500)
+    consultas_blocklist = [(f"img.{d}.",) for d in amostra_bloqueados]
+    consultas_blocklist += [(f"a.b.c.{rnd.choice(registraveis)}.naobloqueado.net.",) for _ in range(500)]
+    rnd.shuffle(consultas_blocklist)
+    casos["blocklist_is_blocked"] = (blocklist.is_blocked, consultas_blocklist)
+
+    # 2b. Motor de regras sem o cache de resultados: as mesmas listas com curingas, regex e exceções
+    regras = [f"ads{i}*.rede{i}.com" for i in range(500)] + [f"/^track[0-9]+\\.parceiro{i}\\./" for i in range(100)]
+    regras += [f"@@cdn.{d}" for d in amostra_bloqueados[:100]]
+    motor = MotorRegras(bloqueados, regras, tamanho_cache=0)
+    casos["regras_avaliar"] = (motor.avaliar, consultas_blocklist)
+    casos["regras_avaliar_lru"] = (MotorRegras(bloqueados, regras, tamanho_cache=65536).bloqueado, consultas_blocklist)
+    casos["blocklist_resposta_bloqueio"] = (blocklist.get_blocked_response, [(c,) for c in consultas])
+
+    # 3. Cache sob pressão de remoção: o conjunto de chaves é bem maior que a capacidade
+    registros = [{"name": "www.exemplo.com.", "type": "A", "address": "10.0.0.1", "ttl": 300}]
+    cache_pressao = DNSCache(tamanho_maximo_bytes=50 * 1024, cache_file_path=None)
+    chaves = [f"host{i}.exemplo.com.|A" for i in range(20000)]
+    casos["cache_set_key_remocao"] = (cache_pressao.set_key, [(k, registros, 300) for k in chaves])
+    for k in chaves:
+        cache_pressao.set_key(k, registros, 300)
+    casos["cache_get_key_misto"] = (cache_pressao.get_key, [(rnd.choice(chaves),) for _ in range(5000)])
+
+    # 4. Resposta de cache hit completa em handle_client (parse + blocklist + cache + empacotamento)
+    cache_hit = DNSCache(tamanho_maximo_bytes=10 * 1024 * 1024, cache_file_path=None)
+    for nome, resposta in zip(nomes, respostas):
+        registros_resp, ttl = parse_response(resposta, "A")
+        cache_hit.set_key(f"{nome}.|A", registros_resp, ttl)
+    sock = SocketFalso()
+    addr = ("127.0.0.1", 40000)
+    casos["handle_client_cache_hit"] = (handle_client,
+                                        [(c, addr, sock, cache_hit, blocklist) for c in consultas])
+
+    # 5. Limite de taxa: clientes distintos consultando nomes variados (baldes já existentes)
+    limitador = LimitadorTaxa(isentos=[], ativo=True)
+    consultas_limite = [(f"10.{i % 7}.{i % 200}.{i % 250}", f"www.site{i % 1000}.com.", 1) for i in range(5000)]
+    casos["limite_avaliar"] = (limitador.avaliar, consultas_limite)
+
+    return casos
+
+
+def comparar(resultados, baseline, limite):
+
+    """
+    Compara os resultados com a baseline. Retorna a lista de casos que regrediram além do limite.
+    Usa o menor tempo entre as rodadas, que é menos sensível a ruído da máquina do que a mediana.
+    """
+
+    regressoes = []
+    print(f"\n{'caso':<28}{'baseline (ns)':>15}{'atual (ns)':>15}{'variação':>12}")
+    for nome, atual in resultados.items():
+        anterior = baseline.get("resultados", {}).get(nome)
+        if not anterior:
+            print(f"{nome:<28}{'-':>15}{atual['min_ns']:>15}{'novo':>12}")
+            continue
+        variacao = atual["min_ns"] / anterior["min_ns"] - 1
+        marca = " <-- REGRESSÃO" if variacao > limite else ""
+        print(f"{nome:<28}{anterior['min_ns']:>15}{atual['min_ns']:>15}{variacao:>+11.1%}{marca}")
+        if variacao > limite:
+            regressoes.append(nome)
+    return regressoes
+
+
+def main():
+    global RODADAS
+
+    parser = argparse.ArgumentParser(description="Microbenchmarks dos caminhos críticos do servidor DNS.")
+    parser.add_argument("--casos", nargs="*", default=None, help="Executa apenas os casos informados")
+    parser.add_argument("--rodadas", type=int, default=RODADAS, help="Rodadas por caso")
+    parser.add_argument("--dominios-bloqueados", type=int, default=DOMINIOS_BLOQUEADOS,
+                        help="Tamanho da blocklist sintética")
+    parser.add_argument("--salvar", default=None, help="Salva os resultados como baseline JSON")
+    parser.add_argument("--comparar", default=None, help="Compara com uma baseline JSON salva anteriormente")
+    parser.add_argument("--limite", type=float, default=LIMITE_REGRESSAO,
+                        help="Regressão tolerada (ex: 0.15 = 15%% mais lento)")
+    args = parser.parse_args()
+    RODADAS = args.rodadas
+
+    casos = preparar_casos(args.dominios_bloqueados)
+    if args.casos:
+        casos = {nome: caso for nome, caso in casos.items() if nome in args.casos}
+
+    resultados = {}
+    for nome, (funcao, argumentos) in casos.items():
+        # handle_client imprime logs por consulta; descartamos a saída durante a medição
+        with open(os.devnull, "w") as nulo, contextlib.redirect_stdout(nulo):
+            resultados[nome] = medir(funcao, argumentos)
+        r = resultados[nome]
+        print(f"{nome:<28}{r['ns_por_op']:>12.1f} ns/op {r['ops_por_s']:>14.1f} ops/s")
+
+    relatorio = {
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "data": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "resultados": resultados,
+    }
+
+    if args.salvar:
+        with open(args.salvar, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, indent=2)
+        print(f"Baseline salva em {args.salvar}")
+
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressoes = comparar(resultados, baseline, args.limite)
+        if regressoes:
+            print(f"\n{len(regressoes)} caso(s) com regressão acima de {args.limite:.0%}: {', '.join(regressoes)}")
+            sys.exit(1)
+        print("\nNenhuma regressão acima do limite.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+import os
+import sys
+import signal
+import socket
+import argparse
+import subprocess
+import tempfile
+import time
+import random
+
+from dnslib import DNSRecord
+
+from dns_app.backend.dns_stub import StubUpstream
+from teste_vazao import SeletorDominios
+
+# Mede o ganho do cache cooperativo (dns_pares.py): sobe um stub upstream e vários servidores
+# DNS como processos locais, envia a mesma carga Zipf espalhada entre eles e compara quantas
+# consultas chegam ao upstream com e sem o anel de pares (taxa de acerto da frota).
+
+NOS = 3
+CONSULTAS = 5000
+DOMINIOS = 2000
+ZIPF_S = 1.0
+PORTA_DNS = 5360       # Nó i: porta DNS PORTA_DNS + i e porta de pares PORTA_PARES + i
+PORTA_PARES = 5460
+
+
+def aguardar(porta, limite=15):
+
+    """
+    Espera o servidor na porta responder (a blocklist é carregada em segundo plano).
+    """
+
+    fim = time.time() + limite
+    while time.time() < fim:
+        try:
+            DNSRecord.question("aguardar.teste").send("127.0.0.1", porta, timeout=0.5)
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def rodar(nos, com_pares, consultas, dominios, zipf_s, semente, latencia):
+
+    """
+    Executa uma rodada e retorna (consultas ao upstream, respostas, estatísticas de cada nó).
+    """
+
+    stub = StubUpstream(port=0, latencia=latencia).start()
+    pares = ",".join(f"127.0.0.1:{PORTA_PARES + i}" for i in range(nos))
+    pasta = tempfile.mkdtemp()
+    processos = []
+    try:
+        for i in range(nos):
+            comando = [sys.executable, "-m", "dns_app.backend.dns_server", "--host", "127.0.0.1",
+                       "--porta", str(PORTA_DNS + i), "--upstream", f"127.0.0.1:{stub.port}",
+                       "--cache-arquivo", "", "--pid", os.path.join(pasta, f"no{i}.pid"),
+                       "--estado", os.path.join(pasta, f"no{i}.estado.json")]
+            if com_pares:
+                comando += ["--pares", pares, "--par-local", f"127.0.0.1:{PORTA_PARES + i}"]
+            processos.append(subprocess.Popen(comando, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True))
+
+        # Primeiro as portas de pares: uma consulta a um dono que ainda não subiu o deixaria
+        # de fora por PARES_PENALIDADE_S segundos
+        portas = ([PORTA_PARES + i for i in range(nos)] if com_pares else []) + [PORTA_DNS + i for i in range(nos)]
+        for porta in portas:
+            if not aguardar(porta):
+                raise RuntimeError(f"A porta {porta} não respondeu")
+        base = stub.consultas_udp
+
+        seletor = SeletorDominios(dominios, zipf_s=zipf_s, semente=semente)
+        rnd = random.Random(semente)
+        respondidas = 0
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(2)
+            for _ in range(consultas):
+                consulta = DNSRecord.question(f"site{seletor.proximo()}.exemplo.com")
+                try:
+                    sock.sendto(consulta.pack(), ("127.0.0.1", PORTA_DNS + rnd.randrange(nos)))
+                    while DNSRecord.parse(sock.recv(4096)).header.id != consulta.header.id:
+                        pass
+                    respondidas += 1
+                except OSError:
+                    pass
+        upstream = stub.consultas_udp - base
+    finally:
+        saidas = []
+        for processo in processos:
+            processo.send_signal(signal.SIGINT)
+        for processo in processos:
+            try:
+                saida, _ = processo.communicate(timeout=10)
+            except subprocess.TimeoutExpired:
+                processo.kill()
+                saida, _ = processo.communicate()
+            saidas.append(next((linha for linha in saida.splitlines() if linha.startswith("Cache cooperativo: {")), ""))
+        stub.stop()
+
+    return upstream, respondidas, saidas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara o tráfego ao upstream com e sem o cache cooperativo.")
+    parser.add_argument("--nos", type=int, default=NOS)
+    parser.add_argument("--consultas", type=int, default=CONSULTAS)
+    parser.add_argument("--dominios", type=int, default=DOMINIOS)
+    parser.add_argument("--zipf", type=float, default=ZIPF_S)
+    parser.add_argument("--latencia", default="fixa:5", help="Latência do upstream (formato do dns_stub)")
+    parser.add_argument("--semente", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{args.nos} nós, {args.consultas} consultas Zipf({args.zipf}) sobre {args.dominios} nomes")
+    for com_pares in (False, True):
+        upstream, respondidas, saidas = rodar(args.nos, com_pares, args.consultas, args.dominios,
+                                              args.zipf, args.semente, args.latencia)
+        print(f"\n{'Com' if com_pares else 'Sem'} cache cooperativo: {respondidas}/{args.consultas} respondidas, "
+              f"{upstream} consultas ao upstream, acerto da frota {1 - upstream / args.consultas:.2%}")
+        for i, saida in enumerate(saidas):
+            if saida:
+                print(f"  nó {i}: {saida}")
+
+
+if __name__ == "__main__":
+    main()
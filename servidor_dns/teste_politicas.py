@@ -0,0 +1,119 @@
+import argparse
+import json
+import random
+import time
+
+from dns_app.backend.dns_cache import DNSCache
+from dns_app.backend.dns_politicas import POLITICAS
+from dns_app.backend import config
+from teste_vazao import carregar_dominios, SeletorDominios
+
+# Compara a taxa de acerto das políticas de remoção do DNSCache (LRU, W-TinyLFU e ARC)
+# com o mesmo limite de memória, reproduzindo um trace de consultas: um log real
+# (--dominios) ou uma carga sintética com nomes populares (Zipf) e rajadas de varredura
+# de subdomínios únicos, como rastreadores, malware com DGA ou o próprio teste_vazao.py.
+
+REQUISICOES = 200_000      # Tamanho do trace sintético
+POPULARES = 20_000         # Quantidade de nomes distintos na parte popular
+ZIPF_S = 0.9               # Expoente da distribuição de popularidade
+VARREDURA = 0.3            # Proporção de consultas que são nomes únicos (varredura)
+RAJADA = 2_000             # Consultas únicas seguidas em cada rajada de varredura
+
+
+def gerar_trace(requisicoes, populares, zipf_s, varredura, rajada, semente):
+
+    """
+    Gera um trace sintético: consultas Zipf sobre 'populares' nomes intercaladas com
+    rajadas de nomes que aparecem uma única vez.
+    """
+
+    rnd = random.Random(semente)
+    seletor = SeletorDominios(populares, zipf_s=zipf_s, semente=semente)
+    normais = [f"site{seletor.proximo()}.com." for _ in range(int(requisicoes * (1 - varredura)))]
+
+    unicas = int(requisicoes * varredura)
+    rajadas = max(unicas // rajada, 1) if unicas else 0
+    inicios = sorted(rnd.randrange(len(normais) + 1) for _ in range(rajadas))
+
+    trace, anterior, contador = [], 0, 0
+    for inicio in inicios:
+        trace.extend(normais[anterior:inicio])
+        for _ in range(unicas // rajadas):
+            trace.append(f"{rnd.getrandbits(48):012x}.varredura{contador % 7}.net.")
+            contador += 1
+        anterior = inicio
+    trace.extend(normais[anterior:])
+    return trace
+
+
+def reproduzir(trace, politica, capacidade_bytes):
+
+    """
+    Reproduz o trace em um DNSCache com a política informada. Cada falha é seguida da
+    inserção da resposta, como no servidor. Retorna a taxa de acerto e o custo por consulta.
+    """
+
+    cache = DNSCache(tamanho_maximo_bytes=capacidade_bytes, cache_file_path=None, politica=politica)
+    acertos = 0
+
+    inicio = time.perf_counter()
+    for nome in trace:
+        key = f"{nome}|A"
+        if cache.get_entry(key) is not None:
+            acertos += 1
+        else:
+            registros = [{"name": nome, "type": "A", "address": "10.0.0.1", "ttl": 86400}]
+            cache.set_key(key, registros, 86400)
+    decorrido = time.perf_counter() - inicio
+
+    return {
+        "taxa_acerto": round(acertos / len(trace), 4),
+        "acertos": acertos,
+        "entradas": len(cache.cache),
+        "us_por_consulta": round(decorrido / len(trace) * 1e6, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara a taxa de acerto das políticas de remoção do cache.")
+    parser.add_argument("--dominios", default=None,
+                        help="Trace a reproduzir (log de consultas ou lista .json); padrão: trace sintético")
+    parser.add_argument("--capacidades", type=int, nargs="+", default=[config.CACHE_TAMANHO_MAXIMO_BYTES],
+                        help="Limites de memória do cache a testar, em bytes")
+    parser.add_argument("--politicas", nargs="+", default=list(POLITICAS))
+    parser.add_argument("--requisicoes", type=int, default=REQUISICOES)
+    parser.add_argument("--populares", type=int, default=POPULARES)
+    parser.add_argument("--zipf", type=float, default=ZIPF_S)
+    parser.add_argument("--varredura", type=float, default=VARREDURA)
+    parser.add_argument("--rajada", type=int, default=RAJADA)
+    parser.add_argument("--semente", type=int, default=1)
+    parser.add_argument("--json", default=None, help="Salva os resultados em JSON")
+    args = parser.parse_args()
+
+    if args.dominios:
+        trace = [d.lower().rstrip(".") + "." for d in carregar_dominios(args.dominios)]
+        descricao = f"replay de {args.dominios}"
+    else:
+        trace = gerar_trace(args.requisicoes, args.populares, args.zipf, args.varredura, args.rajada, args.semente)
+        descricao = (f"sintético: {len(trace)} consultas, zipf={args.zipf} sobre {args.populares} nomes, "
+                     f"{args.varredura:.0%} em rajadas de varredura")
+
+    print(f"Trace {descricao} ({len(set(trace))} nomes distintos)")
+    print(f"\n{'capacidade':>12}{'política':>10}{'acerto':>10}{'entradas':>10}{'us/consulta':>13}")
+
+    resultados = []
+    for capacidade in args.capacidades:
+        for politica in args.politicas:
+            r = reproduzir(trace, politica, capacidade)
+            resultados.append({"capacidade_bytes": capacidade, "politica": politica.upper(), **r})
+            print(f"{capacidade:>12}{politica.upper():>10}{r['taxa_acerto']:>10.2%}{r['entradas']:>10}"
+                  f"{r['us_por_consulta']:>13.2f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"trace": descricao, "resultados": resultados}, f, indent=2, ensure_ascii=False)
+        print(f"\nResultados salvos em {args.json}")
+
+
+if __name__ == "__main__":
+    main()
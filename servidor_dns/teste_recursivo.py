@@ -0,0 +1,123 @@
+import os
+import sys
+import argparse
+import tempfile
+import time
+
+from dnslib import QTYPE, RCODE
+
+from dns_app.backend.dns_stub import StubUpstream
+from dns_app.backend.dns_recursivo import ResolvedorRecursivo
+from dns_app.backend import config
+
+# Testa o modo recursivo (dns_recursivo.py) contra uma hierarquia DNS local e falsa, sem
+# acesso à internet: raiz, TLD "com." e dois autoritativos, cada um num stub (dns_stub.py)
+# em um endereço de loopback diferente. Um dos servidores do TLD não existe, para mostrar
+# o SRTT desviando as consultas para o servidor que responde. Um quinto servidor ("malicioso.com.")
+# responde com um CNAME para outra zona e um endereço falso do destino junto: o resolvedor deve
+# descartar o registro fora da zona (bailiwick) e resolver o destino no servidor dele.
+
+ZONAS = {
+    "127.0.0.1": """
+.                   86400  IN SOA a.raiz.teste. admin.raiz.teste. 1 1800 900 604800 86400
+com.                172800 IN NS  a.tld.com.
+com.                172800 IN NS  b.tld.com.
+a.tld.com.          172800 IN A   127.0.0.2
+b.tld.com.          172800 IN A   127.0.0.9
+""",
+    "127.0.0.2": """
+com.                86400  IN SOA a.tld.com. admin.tld.com. 1 1800 900 604800 86400
+exemplo.com.        86400  IN NS  ns1.exemplo.com.
+ns1.exemplo.com.    86400  IN A   127.0.0.3
+outro.com.          86400  IN NS  ns.exemplo.com.
+malicioso.com.      86400  IN NS  ns.malicioso.com.
+ns.malicioso.com.   86400  IN A   127.0.0.5
+""",
+    "127.0.0.3": """
+exemplo.com.        3600   IN SOA ns1.exemplo.com. admin.exemplo.com. 1 1800 900 604800 300
+exemplo.com.        3600   IN NS  ns1.exemplo.com.
+ns1.exemplo.com.    3600   IN A   127.0.0.3
+ns.exemplo.com.     3600   IN A   127.0.0.4
+www.exemplo.com.    300    IN A   192.0.2.10
+api.exemplo.com.    300    IN A   192.0.2.11
+cdn.exemplo.com.    300    IN CNAME www.outro.com.
+""",
+    "127.0.0.4": """
+outro.com.          3600   IN SOA ns.exemplo.com. admin.outro.com. 1 1800 900 604800 300
+outro.com.          3600   IN NS  ns.exemplo.com.
+www.outro.com.      300    IN A   192.0.2.20
+""",
+    "127.0.0.5": """
+malicioso.com.      3600   IN SOA ns.malicioso.com. admin.malicioso.com. 1 1800 900 604800 300
+malicioso.com.      3600   IN NS  ns.malicioso.com.
+x.malicioso.com.    300    IN CNAME www.outro.com.
+www.outro.com.      300    IN A   6.6.6.6
+""",
+}
+
+# Endereço injetado pelo servidor de malicioso.com. para um nome de outra zona
+ENDERECO_FALSO = "6.6.6.6"
+
+# (nome, tipo): delegação com glue, delegação em cache, CNAME para outra zona (servidor sem glue),
+# NXDOMAIN, NODATA e CNAME com registro fora da zona
+CONSULTAS = [
+    ("www.exemplo.com.", "A"),
+    ("api.exemplo.com.", "A"),
+    ("cdn.exemplo.com.", "A"),
+    ("naoexiste.exemplo.com.", "A"),
+    ("www.exemplo.com.", "MX"),
+    ("x.malicioso.com.", "A"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Testa a resolução recursiva contra uma hierarquia DNS local.")
+    parser.add_argument("--porta", type=int, default=5301, help="Porta dos servidores da hierarquia")
+    parser.add_argument("--latencia", default="fixa:10", help="Latência de cada servidor (formato do dns_stub)")
+    parser.add_argument("--rodadas", type=int, default=3)
+    args = parser.parse_args()
+
+    config.RECURSIVO_RAIZES = [("a.raiz.teste.", "127.0.0.1")]
+    config.RECURSIVO_PORTA = args.porta
+    config.RECURSIVO_TIMEOUT_S = 0.3
+    config.RECURSIVO_PARALELO = 1   # Um servidor por vez, para o SRTT aparecer nos tempos
+
+    stubs, arquivos = [], []
+    try:
+        for host, zona in ZONAS.items():
+            with tempfile.NamedTemporaryFile("w", suffix=".zona", delete=False, encoding="utf-8") as f:
+                f.write(zona)
+            arquivos.append(f.name)
+            stubs.append(StubUpstream(host, args.porta, zona=f.name, gerar=False, latencia=args.latencia).start())
+
+        resolvedor = ResolvedorRecursivo()
+        envenenado = False
+        print(f"\n{'rodada':>6}  {'consulta':<28}{'rcode':>9}{'ms':>8}{'envios':>8}  resposta")
+        for rodada in range(1, args.rodadas + 1):
+            for nome, tipo in CONSULTAS:
+                envios = resolvedor.consultas
+                inicio = time.perf_counter()
+                rcode, respostas, _ = resolvedor.resolver(nome, QTYPE.reverse[tipo])
+                ms = (time.perf_counter() - inicio) * 1000
+                resposta = ", ".join(str(rr.rdata) for rr in respostas) or "-"
+                envenenado |= any(str(rr.rdata) == ENDERECO_FALSO for rr in respostas)
+                print(f"{rodada:>6}  {nome + ' ' + tipo:<28}{RCODE[rcode]:>9}{ms:>8.1f}"
+                      f"{resolvedor.consultas - envios:>8}  {resposta}")
+
+        print(f"\nResolvedor: {resolvedor.estatisticas()}")
+        print(f"Consultas recebidas por servidor: "
+              f"{ {stub.host: stub.consultas_udp for stub in stubs} }")
+        if envenenado:
+            print(f"FALHA: o resolvedor aceitou {ENDERECO_FALSO}, enviado por um servidor de outra zona")
+        else:
+            print("OK: registros fora da zona do servidor consultado foram descartados")
+    finally:
+        for stub in stubs:
+            stub.stop()
+        for arquivo in arquivos:
+            os.remove(arquivo)
+    sys.exit(1 if envenenado else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import sys
+import argparse
+
+from dns_app.backend.dns_regras import MotorRegras, _literal_regex
+
+# Confere o motor de regras da blocklist (dns_regras.py): listas hosts, regras exatas, de sufixo,
+# curingas e regex, exceções vencendo bloqueios e nomes em maiúsculas, com e sem o cache de
+# resultados por nome. Termina com código 1 se algum caso falhar.
+
+DOMINIOS = ["Rastreio.Exemplo.com.", "doubleclick.net", "anuncios.org"]
+
+REGRAS = [
+    "=exato.io",
+    "ads*.site.org",
+    "metric?.site.org",
+    r"/^track[0-9]+\./",
+    r"/^\x61\x64srv[0-9]+\.rd$/",           # \x61\x64 = "ad": o trecho literal não pode ser "64srv"
+    r"/^cdn\d+\.estatisticas\.com$/",
+    r"/^Pixel[0-9]+\.LOJA\.com$/",           # Maiúsculas na regra: o nome é comparado em minúsculas
+    "@@cdn.doubleclick.net",
+    "@@=livre.anuncios.org",
+    "@@/^ok[0-9]\\.anuncios\\.org$/",
+]
+
+PERMITIDOS = ["ads-bom.site.org"]
+
+# (nome, bloqueado?)
+CASOS = [
+    # Listas: o nome e os subdomínios, sem diferença de maiúsculas e com ou sem ponto final
+    ("rastreio.exemplo.com", True),
+    ("a.rastreio.exemplo.com.", True),
+    ("exemplo.com", False),
+    ("DoubleClick.NET.", True),
+    ("x.doubleclick.net", True),
+    # Exato: só o próprio nome
+    ("exato.io", True),
+    ("EXATO.IO.", True),
+    ("a.exato.io", False),
+    # Curingas: * qualquer sequência (inclusive pontos), ? um caractere
+    ("ads1.site.org", True),
+    ("ads.x.site.org", True),
+    ("site.org", False),
+    ("metrics.site.org", True),
+    ("metric.site.org", False),
+    ("metricas.site.org", False),
+    # Regex
+    ("track12.loja.com", True),
+    ("Track7.Loja.com", True),
+    ("track.loja.com", False),
+    ("meutrack1.loja.com", False),
+    ("adsrv42.rd", True),
+    ("adsrv.rd", False),
+    ("cdn3.estatisticas.com", True),
+    ("cdn.estatisticas.com", False),
+    ("pixel3.loja.com", True),
+    ("PIXEL3.Loja.COM.", True),
+    ("pixel.loja.com", False),
+    # Exceções vencem bloqueios de lista, curinga e regex
+    ("cdn.doubleclick.net", False),
+    ("img.cdn.doubleclick.net", False),
+    ("livre.anuncios.org", False),
+    ("x.livre.anuncios.org", True),
+    ("ok1.anuncios.org", False),
+    ("okk.anuncios.org", True),
+    ("ads-bom.site.org", False),
+    ("ADS-BOM.site.org.", False),
+]
+
+# (expressão, trecho literal que toda ocorrência contém)
+LITERAIS = [
+    (r"^track[0-9]+\.", "track"),
+    (r"^\x61\x64srv[0-9]+\.rd$", "srv"),
+    (r"^adsrv\.net$", "adsrv.net"),
+    (r"^cdn\d+\.x$", "cdn"),
+    (r"(a)\1bcd", "bcd"),
+    (r"foo|barbaz", ""),
+    (r"metrics?\.x", "metric"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Confere o motor de regras da blocklist.")
+    parser.add_argument("-v", "--verboso", action="store_true", help="Mostra todos os casos, não só as falhas")
+    args = parser.parse_args()
+
+    falhas = 0
+    for padrao, esperado in LITERAIS:
+        obtido = _literal_regex(padrao)
+        if obtido != esperado:
+            falhas += 1
+            print(f"FALHA  trecho de /{padrao}/: {obtido!r}, esperado {esperado!r}")
+        elif args.verboso:
+            print(f"ok     trecho de /{padrao}/: {obtido!r}")
+
+    for tamanho_cache in (0, 1024):
+        motor = MotorRegras(DOMINIOS, REGRAS, PERMITIDOS, tamanho_cache=tamanho_cache)
+        for _ in range(2):   # A segunda passada responde pelo cache, quando ativo
+            for nome, esperado in CASOS:
+                obtido = motor.bloqueado(nome)
+                if obtido != esperado:
+                    falhas += 1
+                    print(f"FALHA  {nome:<28} bloqueado={obtido}, esperado {esperado} (cache={tamanho_cache})")
+                elif args.verboso:
+                    print(f"ok     {nome:<28} bloqueado={obtido} (cache={tamanho_cache})")
+
+    total = len(LITERAIS) + 4 * len(CASOS)
+    print(f"{total - falhas}/{total} casos corretos. Motor: {motor.estatisticas()}")
+    sys.exit(1 if falhas else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,103 +1,401 @@
-import requests       
-import threading       
-import time            
-import random          
-import json            
-from dns_app.backend.dns_blocklist import blocklist_cache 
+import argparse
+import asyncio
+import bisect
+import contextlib
+import json
+import random
+import socket
+import struct
+import sys
+import time
+from collections import OrderedDict
 
-# URL do endpoint de consulta do servidor DNS Django
-URL = "http://127.0.0.1:8000/query/"
+from dnslib import DNSRecord, DNSQuestion, QTYPE
 
-# Parâmetros do teste
-DURACAO_TESTE = 60           # Duração do teste em segundos
-THREADS_PARALELAS = 50       # Número máximo de threads simultâneas
+# Gerador de carga UDP em malha aberta (open-loop) para o servidor DNS.
+# As consultas são enviadas em um ritmo fixo, independente das respostas, e
+# casadas pelo ID da transação. Assim medimos o servidor DNS, e não o cliente.
 
-# Contadores globais para resultados
-sucesso = 0      
-falhas = 0       
-bloqueados = 0   
-lock = threading.Lock()  # Lock para evitar condições de corrida nos contadores
+# Parâmetros padrão do teste
+SERVIDOR_PADRAO = ("127.0.0.1", 5353)
+DURACAO_TESTE = 60            # Duração do teste em segundos
+QPS_ALVO = 1000               # Taxa de envio alvo (consultas por segundo)
+TIMEOUT_RESPOSTA = 2.0        # Após esse tempo sem resposta a consulta é contada como perdida
+ARQUIVO_DOMINIOS = "dns_app/dns_modules/domains_list/backlink_rank.json"
 
-# Carrega lista de domínios de um arquivo JSON
-# Cada item do JSON deve ser um dicionário com a chave "target"
-with open("dns_app/dns_modules/domains_list/backlink_rank.json", "r") as f:
-    DOMINIOS = json.load(f)
+# Percentis reportados no histograma de latência
+PERCENTIS = (50, 90, 99, 99.9)
 
-# Inicializa a blocklist
-blocklist = blocklist_cache()
+# Nomes dos códigos de resposta mais comuns
+NOMES_RCODE = {0: "NOERROR", 1: "FORMERR", 2: "SERVFAIL", 3: "NXDOMAIN", 4: "NOTIMP", 5: "REFUSED"}
 
-def consulta(dominio):
+
+def carregar_dominios(caminho):
 
     """
-    Função que realiza a consulta de um domínio. Verifica se o domínio está bloqueado antes de contar como sucesso.
+    Carrega a lista de domínios a serem consultados.
+
+    - Arquivos .json seguem o formato do backlink_rank.json (lista de dicionários com a chave "target").
+    - Qualquer outro arquivo é tratado como log de consultas: um domínio por linha
+      (primeira coluna) ou uma linha NDJSON com a chave "dominio".
     """
-    global sucesso, falhas, bloqueados
-    params = {"domain": dominio, "type": "A"}  # Parâmetros da requisição GET
-    try:
-        # Faz a requisição HTTP para o endpoint Django
-        resp = requests.get(URL, params=params, timeout=5)
-        if resp.status_code == 200:
-            # Verifica se o domínio está bloqueado
-            if blocklist.is_blocked(dominio):
-                with lock:
-                    bloqueados += 1
+
+    dominios = []
+
+    if caminho.endswith(".json"):
+        with open(caminho, "r", encoding="utf-8") as f:
+            for item in json.load(f):
+                dominios.append(item["target"] if isinstance(item, dict) else str(item))
+        return dominios
+
+    with open(caminho, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            # Ignora linhas de comentário e linhas vazias
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                try:
+                    dominio = json.loads(line).get("dominio")
+                except ValueError:
+                    continue
+                if dominio:
+                    dominios.append(dominio)
             else:
-                with lock:
-                    sucesso += 1
-        else:
-            # Contabiliza falhas de status HTTP
-            with lock:
-                falhas += 1
-    except Exception:
-        # Contabiliza falhas de exceção, como timeout ou erro de rede
-        with lock:
-            falhas += 1
-
-def teste_vazao():
+                dominios.append(line.split()[0])
+
+    return dominios
+
+
+def montar_pacotes(dominios, qtype):
+
+    """
+    Pré-constrói um pacote de consulta por domínio. Durante o teste apenas os
+    2 primeiros bytes (ID da transação) são alterados.
+    """
+
+    qtype_val = getattr(QTYPE, qtype.upper())
+    pacotes = []
+    for dominio in dominios:
+        try:
+            pacotes.append(bytearray(DNSRecord(q=DNSQuestion(dominio, qtype_val)).pack()))
+        except Exception:
+            # Domínios inválidos (ex: rótulos maiores que 63 bytes) são descartados
+            continue
+    return pacotes
+
+
+class SeletorDominios:
+
+    def __init__(self, total, zipf_s=0.0, sequencial=False, semente=None):
+
+        """
+        Seleciona o índice do próximo domínio a consultar.
+
+        - sequencial: repete a lista na ordem do arquivo (replay do log).
+        - zipf_s > 0: a posição i na lista tem peso 1 / i^s (listas ordenadas por popularidade).
+        - caso contrário: escolha uniforme.
+        """
+
+        self.total = total
+        self.sequencial = sequencial
+        self.posicao = 0
+        self.random = random.Random(semente)
+        self.acumulado = None
+
+        if zipf_s > 0:
+            soma = 0.0
+            self.acumulado = []
+            for i in range(1, total + 1):
+                soma += 1.0 / (i ** zipf_s)
+                self.acumulado.append(soma)
+
+    def proximo(self):
+        if self.sequencial:
+            indice = self.posicao % self.total
+            self.posicao += 1
+            return indice
+        if self.acumulado:
+            alvo = self.random.random() * self.acumulado[-1]
+            return min(bisect.bisect_left(self.acumulado, alvo), self.total - 1)
+        return self.random.randrange(self.total)
+
+
+class ProtocoloCarga(asyncio.DatagramProtocol):
+
+    def __init__(self, resultado, timeout):
+
+        """
+        Recebe as respostas e calcula a latência de cada consulta pendente.
+        Respostas que chegam depois de 'timeout' segundos não contam como respondidas.
+        """
+
+        self.resultado = resultado
+        self.timeout = timeout
+        self.pendentes = OrderedDict()   # ID da transação -> instante de envio (perf_counter), em ordem de envio
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        agora = time.perf_counter()
+        if len(data) < 12:
+            self.resultado["invalidas"] += 1
+            return
+
+        id_transacao, flags = struct.unpack_from("!HH", data)
+        enviado_em = self.pendentes.pop(id_transacao, None)
+        if enviado_em is None or agora - enviado_em > self.timeout:
+            # Resposta tardia (contada como perdida) ou duplicada
+            self.resultado["inesperadas"] += 1
+            return
+
+        self.resultado["latencias"].append(agora - enviado_em)
+        rcode = NOMES_RCODE.get(flags & 0x000F, str(flags & 0x000F))
+        self.resultado["rcodes"][rcode] = self.resultado["rcodes"].get(rcode, 0) + 1
+
+    def error_received(self, exc):
+        self.resultado["erros_socket"] += 1
+
+    def expirar(self, agora):
+
+        """
+        Descarta as consultas pendentes há mais de 'timeout' segundos (ficam como perdidas),
+        liberando os IDs. As pendentes estão em ordem de envio, então basta olhar o início.
+        """
+
+        limite = agora - self.timeout
+        pendentes = self.pendentes
+        while pendentes and pendentes[next(iter(pendentes))] <= limite:
+            pendentes.popitem(last=False)
+
+
+def percentil(ordenadas, p):
+
+    """
+    Retorna o percentil p (0-100) de uma lista já ordenada.
+    """
+
+    if not ordenadas:
+        return None
+    indice = min(len(ordenadas) - 1, int(round(p / 100.0 * (len(ordenadas) - 1))))
+    return ordenadas[indice]
+
+
+def histograma(latencias):
+
+    """
+    Agrupa as latências em faixas de potência de 2 (em microssegundos).
+    Retorna uma lista de [limite_superior_us, quantidade].
+    """
+
+    faixas = {}
+    for latencia in latencias:
+        us = max(1, int(latencia * 1_000_000))
+        limite = 1 << (us - 1).bit_length()
+        faixas[limite] = faixas.get(limite, 0) + 1
+    return [[limite, faixas[limite]] for limite in sorted(faixas)]
+
+
+async def executar_carga(servidor, pacotes, seletor, qps, duracao, timeout):
+
+    """
+    Envia consultas em malha aberta no ritmo 'qps' durante 'duracao' segundos.
+    """
+
+    resultado = {
+        "latencias": [],
+        "rcodes": {},
+        "enviadas": 0,
+        "colisoes_id": 0,
+        "invalidas": 0,
+        "inesperadas": 0,
+        "erros_socket": 0,
+        "atraso_max_envio": 0.0,
+    }
+
+    loop = asyncio.get_running_loop()
+    transport, protocolo = await loop.create_datagram_endpoint(
+        lambda: ProtocoloCarga(resultado, timeout), remote_addr=servidor
+    )
+    sock = transport.get_extra_info("socket")
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+    except OSError:
+        pass
+
+    intervalo = 1.0 / qps
+    proximo_id = random.randrange(65536)
+    inicio = time.perf_counter()
+    fim = inicio + duracao
+    enviadas = 0
+
+    while True:
+        agora = time.perf_counter()
+        if agora >= fim:
+            break
+        protocolo.expirar(agora)
+
+        # Envia todas as consultas cujo horário programado já passou
+        devidas = int((agora - inicio) / intervalo) + 1 - enviadas
+        if devidas > 0:
+            atraso = agora - (inicio + enviadas * intervalo)
+            if atraso > resultado["atraso_max_envio"]:
+                resultado["atraso_max_envio"] = atraso
+
+            for _ in range(devidas):
+                id_transacao = proximo_id
+                proximo_id = (proximo_id + 1) & 0xFFFF
+                if protocolo.pendentes.pop(id_transacao, None) is not None:
+                    # ID ainda em uso: a consulta antiga ficou sem resposta (sai para manter a ordem de envio)
+                    resultado["colisoes_id"] += 1
+
+                pacote = pacotes[seletor.proximo()]
+                struct.pack_into("!H", pacote, 0, id_transacao)
+                protocolo.pendentes[id_transacao] = time.perf_counter()
+                transport.sendto(bytes(pacote))
+                enviadas += 1
+
+        proximo_envio = inicio + enviadas * intervalo
+        await asyncio.sleep(max(0.0, proximo_envio - time.perf_counter()))
+
+    duracao_real = time.perf_counter() - inicio
+
+    # Aguarda as respostas das últimas consultas até o timeout
+    limite = time.perf_counter() + timeout
+    while protocolo.pendentes and time.perf_counter() < limite:
+        await asyncio.sleep(0.01)
+        protocolo.expirar(time.perf_counter())
+
+    transport.close()
+    resultado["enviadas"] = enviadas
+    resultado["duracao"] = duracao_real
+    return resultado
+
+
+def resumir(resultado, args):
 
     """
-    Executa o teste de vazão criando múltiplas threads para consultar domínios. Mantém até THREADS_PARALELAS threads simultâneas e mede a duração do teste.
+    Monta o relatório final do teste (dicionário serializável em JSON).
     """
-    inicio = time.time()  # Marca o início do teste
-    threads = []
 
-    while time.time() - inicio < DURACAO_TESTE:
-        # Seleciona um domínio aleatório da lista
-        dominio = random.choice(DOMINIOS)
+    latencias = sorted(resultado["latencias"])
+    respondidas = len(latencias)
+    enviadas = resultado["enviadas"]
+    perdidas = enviadas - respondidas
+    duracao = resultado["duracao"]
 
-        # Cria uma thread para consultar o domínio
-        t = threading.Thread(target=consulta, args=(dominio['target'],))
-        threads.append(t)
-        t.start()
+    def ms(valor):
+        return round(valor * 1000, 3) if valor is not None else None
 
-        # Controla o número máximo de threads simultâneas
-        if len(threads) >= THREADS_PARALELAS:
-            threads_to_join = [t for t in threads if not t.is_alive()]
-            for t in threads_to_join:
-                t.join()
-                threads.remove(t)
+    return {
+        "configuracao": {
+            "servidor": f"{args.host}:{args.porta}",
+            "qps_alvo": args.qps,
+            "duracao": args.duracao,
+            "tipo": args.tipo,
+            "dominios": args.dominios,
+            "zipf": args.zipf,
+            "sequencial": args.sequencial,
+        },
+        "enviadas": enviadas,
+        "respondidas": respondidas,
+        "perdidas": perdidas,
+        "perda_pct": round(perdidas / enviadas * 100, 3) if enviadas else 0.0,
+        "qps_enviado": round(enviadas / duracao, 2) if duracao else 0.0,
+        "qps_alcancado": round(respondidas / duracao, 2) if duracao else 0.0,
+        "rcodes": resultado["rcodes"],
+        "colisoes_id": resultado["colisoes_id"],
+        "respostas_inesperadas": resultado["inesperadas"],
+        "erros_socket": resultado["erros_socket"],
+        "atraso_max_envio_ms": ms(resultado["atraso_max_envio"]),
+        "latencia_ms": {
+            "min": ms(latencias[0]) if latencias else None,
+            "media": ms(sum(latencias) / respondidas) if latencias else None,
+            **{f"p{str(p).replace('.', '')}": ms(percentil(latencias, p)) for p in PERCENTIS},
+            "max": ms(latencias[-1]) if latencias else None,
+        },
+        "histograma_us": histograma(latencias),
+    }
 
-    # Aguarda todas as threads restantes terminarem
-    for t in threads:
-        t.join()
 
-    fim = time.time()  # Marca o fim do teste
-    duracao = fim - inicio  # Calcula o tempo total do teste
+def imprimir(relatorio):
 
-    # Calcula métricas do teste
-    total_requisicoes = sucesso + falhas + bloqueados
-    percentual_falhas = (falhas / total_requisicoes) * 100 if total_requisicoes > 0 else 0
+    """
+    Exibe o relatório de forma legível no terminal.
+    """
 
-    # Exibe os resultados do teste
+    lat = relatorio["latencia_ms"]
     print("\n==== RESULTADOS ====")
-    print(f"Requisições bem-sucedidas: {sucesso}")
-    print(f"Falhas: {falhas}")
-    print(f"Domínios bloqueados: {bloqueados}")
-    print(f"Total de requisições: {total_requisicoes}")
-    print(f"Percentual de falhas: {percentual_falhas:.2f}%")
-    print(f"Tempo total (real): {duracao:.2f}s")
-    print(f"Vazão calculada: {sucesso / duracao:.2f} req/s")
+    print(f"Consultas enviadas: {relatorio['enviadas']}")
+    print(f"Respostas recebidas: {relatorio['respondidas']}")
+    print(f"Perdidas: {relatorio['perdidas']} ({relatorio['perda_pct']:.2f}%)")
+    print(f"Códigos de resposta: {relatorio['rcodes']}")
+    print(f"Vazão enviada: {relatorio['qps_enviado']:.2f} req/s")
+    print(f"Vazão alcançada: {relatorio['qps_alcancado']:.2f} req/s")
+    print(f"Latência (ms): p50={lat['p50']} p90={lat['p90']} p99={lat['p99']} p999={lat['p999']} max={lat['max']}")
+    print(f"Maior atraso do gerador em relação ao ritmo alvo: {relatorio['atraso_max_envio_ms']} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de vazão UDP (open-loop) para o servidor DNS.")
+    parser.add_argument("--host", default=SERVIDOR_PADRAO[0], help="Endereço do servidor DNS")
+    parser.add_argument("--porta", type=int, default=SERVIDOR_PADRAO[1], help="Porta UDP do servidor DNS")
+    parser.add_argument("--qps", type=float, default=QPS_ALVO, help="Taxa de envio alvo (consultas/s)")
+    parser.add_argument("--duracao", type=float, default=DURACAO_TESTE, help="Duração do teste em segundos")
+    parser.add_argument("--tipo", default="A", help="Tipo de consulta (A, AAAA, MX, ...)")
+    parser.add_argument("--dominios", default=ARQUIVO_DOMINIOS, help="Arquivo .json de ranking ou log de consultas")
+    parser.add_argument("--zipf", type=float, default=0.0, help="Expoente da distribuição de Zipf (0 = uniforme)")
+    parser.add_argument("--sequencial", action="store_true", help="Repete os domínios na ordem do arquivo")
+    parser.add_argument("--timeout", type=float, default=TIMEOUT_RESPOSTA, help="Tempo máximo de espera por resposta")
+    parser.add_argument("--semente", type=int, default=None, help="Semente do gerador aleatório")
+    parser.add_argument("--stub", type=int, default=None, metavar="PORTA",
+                        help="Sobe o upstream stub local nesta porta (inicie o servidor com DNS_UPSTREAM=127.0.0.1:PORTA)")
+    parser.add_argument("--stub-latencia", default="0", help="Latência do stub (ex: exponencial:20, em ms)")
+    parser.add_argument("--stub-perda", type=float, default=0.0, help="Proporção de consultas descartadas pelo stub")
+    parser.add_argument("--stub-nxdomain", type=float, default=0.0, help="Proporção de nomes NXDOMAIN no stub")
+    parser.add_argument("--json", dest="saida_json", default=None, help="Grava o relatório em JSON ('-' para stdout)")
+    args = parser.parse_args()
+
+    # Com --json - o stdout é só o JSON: as mensagens vão para o stderr
+    mensagens = sys.stderr if args.saida_json == "-" else sys.stdout
+
+    dominios = carregar_dominios(args.dominios)
+    pacotes = montar_pacotes(dominios, args.tipo)
+    if not pacotes:
+        print(f"Nenhum domínio válido encontrado em {args.dominios}.", file=mensagens)
+        sys.exit(1)
+
+    stub = None
+    if args.stub is not None:
+        from dns_app.backend.dns_stub import StubUpstream
+        with contextlib.redirect_stdout(mensagens):
+            stub = StubUpstream(port=args.stub, latencia=args.stub_latencia, perda=args.stub_perda,
+                                nxdomain=args.stub_nxdomain, semente=args.semente or 0).start()
+
+    seletor = SeletorDominios(len(pacotes), zipf_s=args.zipf, sequencial=args.sequencial, semente=args.semente)
+
+    print(f"Enviando {args.qps:.0f} req/s para {args.host}:{args.porta} por {args.duracao:.0f}s "
+          f"({len(pacotes)} domínios)...", file=mensagens)
+    resultado = asyncio.run(executar_carga((args.host, args.porta), pacotes, seletor,
+                                           args.qps, args.duracao, args.timeout))
+    relatorio = resumir(resultado, args)
+    if stub:
+        relatorio["stub"] = {"consultas_udp": stub.consultas_udp, "consultas_tcp": stub.consultas_tcp,
+                             "descartadas": stub.descartadas}
+        stub.stop()
+
+    if args.saida_json == "-":
+        print(json.dumps(relatorio, indent=2))
+        return
+
+    imprimir(relatorio)
+    if args.saida_json:
+        with open(args.saida_json, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, indent=2)
+        print(f"Relatório salvo em {args.saida_json}")
 
 
 if __name__ == "__main__":
-    teste_vazao()
+    main()